@@ -0,0 +1,238 @@
+"""Cache downloaded results locally, by the request they were downloaded with."""
+
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+
+DEFAULT_CACHE_SIZE = 20  # GB
+# Request fields where the order of the values has a meaning.
+ORDERED_FIELDS = ["area"]
+# Linux ioctl to share the data blocks of a file with another one (copy-on-write).
+FICLONE = 0x40049409
+INDEX_FILENAME = "index.sqlite"
+# The total size is kept up to date by triggers, so that it is never summed.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_used_at ON entries (used_at);
+CREATE TABLE IF NOT EXISTS total (bytes INTEGER NOT NULL);
+INSERT INTO total SELECT 0 WHERE NOT EXISTS (SELECT * FROM total);
+CREATE TRIGGER IF NOT EXISTS entry_added AFTER INSERT ON entries
+BEGIN
+    UPDATE total SET bytes = bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS entry_removed AFTER DELETE ON entries
+BEGIN
+    UPDATE total SET bytes = bytes - OLD.size;
+END;
+"""
+
+
+def default_cache_dir() -> Path:
+    """The cache directory: $ERA5CLI_CACHE_DIR, or era5cli in the user cache dir."""
+    if "ERA5CLI_CACHE_DIR" in os.environ:
+        return Path(os.environ["ERA5CLI_CACHE_DIR"])
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "era5cli"
+
+
+def normalize(request: dict) -> dict:
+    """Normalize a request, so that equivalent requests are equal.
+
+    The CDS treats every field as a set of values, so the values are sorted, and
+    numbers are compared as strings (e.g. year 2008 and '2008').
+    """
+    normalized = {}
+    for field, value in request.items():
+        if field in ORDERED_FIELDS:
+            normalized[field] = [str(val) for val in value]
+        elif isinstance(value, (list, tuple)):
+            normalized[field] = sorted(str(val) for val in value)
+        else:
+            normalized[field] = [str(value)]
+    return normalized
+
+
+def cache_key(name: str, request: dict) -> str:
+    """Hash of a normalized request, independent of the output file."""
+    canonical = json.dumps([name, normalize(request)], sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _reflink(source: Path, target: Path) -> None:
+    """Copy a file by sharing its data blocks, on file systems that support it."""
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are only supported on Linux")
+    import fcntl  # Not available on Windows
+
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def materialize(source: Path, target: Path) -> None:
+    """Make `target` a copy of `source`, as cheaply as possible.
+
+    The copy shares its data blocks with `source` (copy-on-write) on file systems
+    that support it, and is a plain copy otherwise. Either way, modifying one file
+    never changes the other. The copy is made under a temporary name first, so
+    that `target` is never incomplete.
+
+    Args:
+        source: The existing file.
+        target: The file to create (or replace).
+    """
+    target = Path(target)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.")
+    os.close(fd)
+    try:
+        try:
+            _reflink(source, Path(tmp))
+        except OSError:
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class ResultCache:
+    """Downloaded results, stored by the hash of their (normalized) request.
+
+    The least recently used results are evicted when the cache grows beyond its
+    size limit. The size and last use of every result are kept in an index, along
+    with their total, so that storing a result does not need to list the cache.
+    The index is rebuilt from the cached files if it is missing.
+
+    Args:
+        directory: Where the results are stored. Defaults to `default_cache_dir()`.
+        max_size: The size limit of the cache in GB.
+    """
+
+    def __init__(
+        self, directory: Optional[Path] = None, max_size: float = DEFAULT_CACHE_SIZE
+    ):
+        self.directory = Path(directory or default_cache_dir())
+        self.max_bytes = int(max_size * 1e9)
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            path = self.directory / INDEX_FILENAME
+            self.directory.mkdir(parents=True, exist_ok=True)
+            rebuild = not path.exists()
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            with self._connection:
+                self._connection.executescript(SCHEMA)
+                if rebuild:
+                    self._rebuild()
+        return self._connection
+
+    def _rebuild(self) -> None:
+        """Index the results that are in the cache directory."""
+        for path in self.directory.glob("??/*"):
+            if path.name.startswith("."):
+                continue  # Being written.
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # Evicted by another process.
+            self._add(path.name, stat.st_size, stat.st_mtime)
+
+    def _add(self, key: str, size: int, used_at: float) -> None:
+        self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self._connection.execute(
+            "INSERT INTO entries (key, size, used_at) VALUES (?, ?, ?)",
+            (key, size, used_at),
+        )
+
+    def _path(self, name: str, request: dict) -> Path:
+        key = cache_key(name, request)
+        return self.directory / key[:2] / key
+
+    def get(self, name: str, request: dict, outputfile: str) -> bool:
+        """Materialize the cached result of a request as `outputfile`, if cached.
+
+        A result that can not be used (e.g. because it was evicted in the meantime,
+        the disk is full, or the index is locked) counts as not cached, so that it
+        is downloaded instead.
+
+        Returns:
+            Whether the result was in the cache, and was materialized.
+        """
+        path = self._path(name, request)
+        if not path.exists():
+            return False
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    connection.execute(
+                        "UPDATE entries SET used_at = ? WHERE key = ?",
+                        (time.time(), path.name),
+                    )
+            materialize(path, Path(outputfile))
+        except (sqlite3.Error, OSError) as error:
+            logging.warning(f"Cached result for {outputfile} not used: {error}")
+            return False
+        return True
+
+    def put(self, name: str, request: dict, outputfile: str) -> None:
+        """Store a downloaded result, and evict old results if the cache is full."""
+        size = os.path.getsize(outputfile)
+        if size > self.max_bytes:
+            return  # Would evict everything else, and itself.
+        path = self._path(name, request)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        materialize(Path(outputfile), path)
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                self._add(path.name, size, time.time())
+            self._evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used results, until the cache fits its limit."""
+        with self._lock:
+            self._connect()
+            self._evict()
+
+    def _evict(self) -> None:
+        with self._connection as connection:
+            (total,) = connection.execute("SELECT bytes FROM total").fetchone()
+            if total <= self.max_bytes:
+                return
+            evicted = []
+            for key, size in connection.execute(
+                "SELECT key, size FROM entries ORDER BY used_at"
+            ):
+                if total <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                total -= size
+            connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        for (key,) in evicted:
+            try:
+                (self.directory / key[:2] / key).unlink()
+            except FileNotFoundError:
+                pass  # Evicted by another process.
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
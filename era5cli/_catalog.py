@@ -0,0 +1,185 @@
+"""An index of the ERA5 variables and datasets, built once from `inputref`.
+
+The lists in `inputref` are meant to be read (and printed); the catalog maps every
+variable to its metadata, so that checking a variable is a single lookup.
+"""
+
+from typing import Dict
+from typing import FrozenSet
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+import era5cli.inputref as ref
+
+
+# Native resolution (in degrees) of the ensemble products, for all ERA5 datasets.
+ENSEMBLE_GRID = 0.5
+
+# Level types of the datasets.
+SINGLE = "single-levels"
+PRESSURE = "pressure-levels"
+LAND = "land"
+
+
+# The names under which the CDS stores variables in netCDF files (the GRIB
+# shortName and cfVarName), for the variables whose description (long_name) does
+# not read like their request name. Other variables are found by their description,
+# e.g. 'Total precipitation' for total_precipitation.
+SHORT_NAMES: Dict[str, Tuple[str, ...]] = {
+    "2m_temperature": ("t2m", "2t"),
+    "2m_dewpoint_temperature": ("d2m", "2d"),
+    "10m_u_component_of_wind": ("u10", "10u"),
+    "10m_v_component_of_wind": ("v10", "10v"),
+    "100m_u_component_of_wind": ("u100", "100u"),
+    "100m_v_component_of_wind": ("v100", "100v"),
+    "10m_wind_gust_since_previous_post_processing": ("fg10", "10fg"),
+    "instantaneous_10m_wind_gust": ("i10fg",),
+    "maximum_2m_temperature_since_previous_post_processing": ("mx2t",),
+    "minimum_2m_temperature_since_previous_post_processing": ("mn2t",),
+    "mean_total_precipitation_rate": ("mtpr", "avg_tprate"),
+    "sea_ice_cover": ("siconc", "ci"),
+    "significant_height_of_combined_wind_waves_and_swell": ("swh",),
+    "surface_net_solar_radiation": ("ssr",),
+    "surface_net_thermal_radiation": ("str",),
+    "surface_solar_radiation_downwards": ("ssrd",),
+    "surface_thermal_radiation_downwards": ("strd",),
+    "top_net_solar_radiation": ("tsr",),
+    "top_net_thermal_radiation": ("ttr",),
+    "total_column_water_vapour": ("tcwv",),
+    "vorticity": ("vo",),
+}
+
+
+class Dataset(NamedTuple):
+    """A dataset of the CDS, and the data it holds."""
+
+    name: str
+    level_type: str
+    monthly: bool
+    grid: float  # Native resolution, in degrees
+    first_year: int
+
+
+DATASETS = {
+    dataset.name: dataset
+    for level_type, grid, first_year in [
+        (SINGLE, 0.25, 1940),
+        (PRESSURE, 0.25, 1940),
+        (LAND, 0.1, 1950),
+    ]
+    for dataset in [
+        Dataset(f"reanalysis-era5-{level_type}", level_type, False, grid, first_year),
+        Dataset(
+            f"reanalysis-era5-{level_type}-monthly-means",
+            level_type,
+            True,
+            grid,
+            first_year,
+        ),
+    ]
+}
+
+
+class Variable(NamedTuple):
+    """A variable, and the level types and periods it is available for."""
+
+    name: str
+    level_types: FrozenSet[str]
+    hourly: bool  # Available in the hourly single level data
+    monthly: bool  # Available in the monthly single level data
+    short_names: Tuple[str, ...] = ()  # Names in netCDF files, see SHORT_NAMES
+
+    @property
+    def is_pressure_level(self) -> bool:
+        return PRESSURE in self.level_types
+
+    @property
+    def is_single_level(self) -> bool:
+        return SINGLE in self.level_types
+
+    @property
+    def is_land(self) -> bool:
+        return LAND in self.level_types
+
+    @property
+    def datasets(self) -> List[Dataset]:
+        """The datasets that hold this variable."""
+        return [
+            dataset
+            for dataset in DATASETS.values()
+            if dataset.level_type in self.level_types
+            and (
+                dataset.level_type != SINGLE
+                or (self.monthly if dataset.monthly else self.hourly)
+            )
+        ]
+
+
+class Catalog:
+    """All ERA5 variables and pressure levels, indexed by name."""
+
+    def __init__(self):
+        missing_monthly = frozenset(ref.MISSING_MONTHLY_VARS)
+        missing_hourly = frozenset(ref.MISSING_HOURLY_VARS)
+        level_types: Dict[str, set] = {}
+        for level_type, variables in [
+            (SINGLE, ref.SLVARS),
+            (PRESSURE, ref.PLVARS),
+            (LAND, ref.ERA5_LAND_VARS),
+        ]:
+            for name in variables:
+                level_types.setdefault(name, set()).add(level_type)
+        self.variables: Dict[str, Variable] = {
+            name: Variable(
+                name,
+                frozenset(types),
+                hourly=name not in missing_hourly,
+                monthly=name not in missing_monthly,
+                short_names=SHORT_NAMES.get(name, ()),
+            )
+            for name, types in level_types.items()
+        }
+        self.levels = frozenset(ref.PLEVELS)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.variables
+
+    def get(self, name: str) -> Optional[Variable]:
+        """The variable with this name, or None if there is no such variable."""
+        return self.variables.get(name)
+
+    def is_pressure_level(self, name: str) -> bool:
+        variable = self.variables.get(name)
+        return variable is not None and variable.is_pressure_level
+
+    def dataset(
+        self, name: str, land: bool, surface: bool, monthly: bool
+    ) -> Optional[Dataset]:
+        """The dataset to request a variable from, or None if there is none.
+
+        Args:
+            name: Name of the variable.
+            land: Whether ERA5-Land data is requested.
+            surface: Whether the single level variant of an ambiguous variable (like
+                geopotential) is requested.
+            monthly: Whether monthly means are requested.
+        """
+        variable = self.variables.get(name)
+        if variable is None:
+            return None
+        if land:
+            level_type = LAND
+        elif surface:
+            level_type = SINGLE
+        elif variable.is_pressure_level:
+            level_type = PRESSURE
+        elif variable.is_single_level:
+            level_type = SINGLE
+        else:
+            return None
+        suffix = "-monthly-means" if monthly else ""
+        return DATASETS[f"reanalysis-era5-{level_type}{suffix}"]
+
+
+CATALOG = Catalog()
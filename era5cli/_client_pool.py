@@ -0,0 +1,85 @@
+"""Pool of reusable CDS clients, to reuse keep-alive connections between tasks."""
+
+import sys
+import threading
+import cdsapi
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Default number of connections kept alive per host in every session. A single
+# session can be shared by several download threads (e.g. in asynchronous mode).
+DEFAULT_POOL_MAXSIZE = 10
+
+
+def new_session(maxsize: int = DEFAULT_POOL_MAXSIZE) -> requests.Session:
+    """Create a requests session which keeps up to `maxsize` connections alive."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=maxsize, pool_maxsize=maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class ClientPool:
+    """Thread-safe pool of cdsapi clients, with one HTTP session per thread.
+
+    Every thread gets its own client (and requests session) for each distinct set of
+    client options, which is then reused for all tasks executed by that thread. This
+    avoids a new TLS handshake and connection for every submission, status poll and
+    download.
+
+    Parameters
+    ----------
+        maxsize: int
+            Number of connections kept alive per host in every session.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_POOL_MAXSIZE):
+        """Initialization of the ClientPool class."""
+        self.maxsize = maxsize
+        """int: Number of connections kept alive per host in every session."""
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._clients = {}
+
+    def session(self) -> requests.Session:
+        """Return the requests session of the calling thread."""
+        thread = threading.get_ident()
+        with self._lock:
+            if thread not in self._sessions:
+                self._sessions[thread] = new_session(self.maxsize)
+            return self._sessions[thread]
+
+    def client(self, url: str, key: str, **kwargs) -> cdsapi.Client:
+        """Return the cdsapi client of the calling thread for these options.
+
+        Parameters
+        ----------
+            url: str
+                URL to the CDS API.
+            key: str
+                The CDS API key.
+            kwargs:
+                Additional keyword arguments passed to `cdsapi.Client`.
+        """
+        kwargs.setdefault("verify", True)
+        # only show progress in interactive sessions.
+        kwargs.setdefault("progress", sys.stdin.isatty())
+
+        clientkey = (threading.get_ident(), url, key, tuple(sorted(kwargs.items())))
+        session = self.session()
+        with self._lock:
+            if clientkey not in self._clients:
+                self._clients[clientkey] = cdsapi.Client(
+                    url=url, key=key, session=session, **kwargs
+                )
+            return self._clients[clientkey]
+
+    def close(self) -> None:
+        """Close all sessions, and drop the clients that use them."""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._clients.clear()
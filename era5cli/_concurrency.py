@@ -0,0 +1,184 @@
+"""Adapt the number of requests in flight to the observed behaviour of the CDS."""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from pathos.threading import ThreadPool as Pool
+from era5cli import _retry
+
+
+# Number of times a task may be rejected by the CDS before giving up on it.
+MAX_REJECTIONS = 5
+# Seconds to wait before resubmitting a rejected task, doubled with every rejection.
+REJECTION_DELAY = 30
+# Factor by which the queue time may grow over the shortest queue time seen, before
+# adding more requests in flight is considered to only make them wait longer.
+QUEUE_GROWTH = 2.0
+# Queue times shorter than this (in seconds) are not considered to be congestion.
+QUEUE_TIME_FLOOR = 60.0
+# Relative decrease of throughput that is still considered noise.
+THROUGHPUT_TOLERANCE = 0.1
+
+
+class ConcurrencyController:
+    """Decide how many requests may be in flight at the CDS at the same time.
+
+    The limit starts at the floor, and is adjusted after every round of completed
+    requests (as many as the limit):
+        - a rejection by the CDS halves the limit immediately,
+        - queue times that grew far above the shortest queue time seen lower the
+          limit by one, as the CDS is already running as many requests as it allows,
+        - otherwise the limit is raised by one, unless the previous raise did not
+          improve the throughput, in which case it is undone.
+
+    Args:
+        floor: The minimum number of requests in flight.
+        ceiling: The maximum number of requests in flight.
+    """
+
+    def __init__(self, floor: int = 1, ceiling: int = 6):
+        if not 1 <= floor <= ceiling:
+            raise ValueError(
+                f"Invalid thread limits: minimum {floor}, maximum {ceiling}. "
+                "The minimum should be at least 1, and at most the maximum."
+            )
+        self.floor = floor
+        self.ceiling = ceiling
+        self.limit = floor
+        self._lock = threading.Lock()
+        self._min_queue_time: Optional[float] = None
+        self._queue_times: List[float] = []
+        self._last_change = 0
+        self._last_throughput: Optional[float] = None
+        self._start_round()
+
+    def _start_round(self) -> None:
+        self._round_start = time.monotonic()
+        self._round_bytes = 0
+        self._round_completed = 0
+        self._queue_times = []
+
+    def _set_limit(self, limit: int) -> None:
+        limit = max(self.floor, min(self.ceiling, limit))
+        self._last_change = limit - self.limit
+        self.limit = limit
+        self._start_round()
+
+    def record_rejection(self) -> None:
+        """Record that the CDS refused a request because of too many requests."""
+        with self._lock:
+            self._set_limit(self.limit // 2)
+            self._last_throughput = None
+
+    def record_success(self, nbytes: int, queue_time: Optional[float] = None) -> None:
+        """Record a completed request.
+
+        Args:
+            nbytes: The size of the downloaded result.
+            queue_time: Seconds the request waited at the CDS, if known.
+        """
+        with self._lock:
+            self._round_completed += 1
+            self._round_bytes += nbytes
+            if queue_time is not None:
+                self._queue_times.append(queue_time)
+                if self._min_queue_time is None or queue_time < self._min_queue_time:
+                    self._min_queue_time = queue_time
+            if self._round_completed >= self.limit:
+                self._adjust()
+
+    def _congested(self) -> bool:
+        if not self._queue_times:
+            return False
+        mean_queue_time = sum(self._queue_times) / len(self._queue_times)
+        baseline = max(self._min_queue_time, QUEUE_TIME_FLOOR)
+        return mean_queue_time > QUEUE_GROWTH * baseline
+
+    def _adjust(self) -> None:
+        elapsed = max(time.monotonic() - self._round_start, 1e-9)
+        throughput = self._round_bytes / elapsed
+        previous, self._last_throughput = self._last_throughput, throughput
+
+        if self._congested():
+            self._set_limit(self.limit - 1)
+        elif (
+            self._last_change > 0
+            and previous is not None
+            and throughput < previous * (1 + THROUGHPUT_TOLERANCE)
+        ):
+            self._set_limit(self.limit - 1)  # More in flight did not help.
+        else:
+            self._set_limit(self.limit + 1)
+
+
+def file_size(filename: str) -> int:
+    """Get the size of a downloaded file, or 0 if it does not exist (anymore)."""
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
+def _tracked(work: Callable, done: queue.Queue, task: tuple) -> None:
+    """Run a task (with retries), and report its outcome to the scheduler."""
+    done.put((task, _retry.call(work, *task, rejections=False)))
+
+
+def run_adaptive(
+    tasks: List[Tuple[str, dict, str]],
+    work: Callable,
+    controller: ConcurrencyController,
+) -> List[_retry.Failure]:
+    """Run all tasks, keeping as many in flight as the controller allows.
+
+    Tasks rejected by the CDS because of too many requests are retried later, other
+    transient errors are retried by the task itself.
+
+    Args:
+        tasks: List of (name, request, outputfile) tuples.
+        work: Callable with the signature (name, request, outputfile), which
+            retrieves a single task.
+        controller: Decides how many tasks can run at the same time.
+
+    Returns:
+        The tasks that failed.
+    """
+    pool = Pool(nodes=controller.ceiling)
+    waiting = deque(tasks)
+    rejections = {id(task): 0 for task in tasks}
+    done: queue.Queue = queue.Queue()
+    failures = []
+    running = 0
+    resume_at = 0.0
+
+    while waiting or running:
+        while waiting and running < controller.limit and time.monotonic() >= resume_at:
+            pool.apipe(_tracked, work, done, waiting.popleft())
+            running += 1
+
+        try:
+            timeout = max(resume_at - time.monotonic(), 0) if not running else None
+            task, failure = done.get(timeout=timeout)
+        except queue.Empty:
+            continue  # Waited for a rejection delay to pass.
+        running -= 1
+
+        if failure is None:
+            controller.record_success(file_size(task[-1]))
+        elif (
+            _retry.classify(failure.error) == _retry.REJECTED
+            and rejections[id(task)] < MAX_REJECTIONS
+        ):
+            controller.record_rejection()
+            resume_at = time.monotonic() + REJECTION_DELAY * 2 ** rejections[id(task)]
+            rejections[id(task)] += 1
+            waiting.appendleft(task)
+        else:
+            failures.append(failure)
+    return failures
@@ -0,0 +1,58 @@
+"""Run the bookkeeping of finished downloads off the download threads."""
+
+import logging
+import sqlite3
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from typing import List
+from typing import Tuple
+from era5cli import _retry
+
+
+# Errors of the ledger, inventory and cache, which do not affect the files themselves.
+BOOKKEEPING_ERRORS = (sqlite3.Error, OSError)
+
+
+def keep_books(update: Callable, *args) -> None:
+    """Update the ledger, inventory or cache, and only warn if that fails.
+
+    A failure to record a file does not make the file invalid, so it should not
+    fail (or retry) the task that wrote it.
+    """
+    try:
+        update(*args)
+    except BOOKKEEPING_ERRORS as error:
+        name = getattr(update, "__qualname__", repr(update))
+        logging.warning(f"Bookkeeping ({name}) failed: {error}")
+
+
+class DeferredStage:
+    """A background stage that finishes downloaded files, one at a time.
+
+    Stamping the history of a netCDF file rewrites its header, which for large
+    netCDF-3 files means rewriting the whole file. Doing this in a single background
+    thread lets the download threads continue with the next request, while file
+    access stays serial (HDF5 is not thread-safe).
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="era5cli-finish"
+        )
+        self._pending: List[Tuple[tuple, Future]] = []
+
+    def submit(self, task: tuple, work: Callable, *args) -> None:
+        """Schedule `work(*args)` to finish `task`."""
+        self._pending.append((task, self._executor.submit(work, *args)))
+
+    def wait(self) -> List[_retry.Failure]:
+        """Wait until all work is done, and return the tasks that failed."""
+        self._executor.shutdown(wait=True)
+        failures = []
+        for task, future in self._pending:
+            error = future.exception()
+            if error is not None:
+                failures.append(_retry.Failure(task, error, 1))
+        self._pending = []
+        return failures
@@ -0,0 +1,418 @@
+"""Download results to a partial file first, and resume interrupted downloads."""
+
+import contextlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from typing import Iterator
+from typing import List
+from typing import Optional
+import requests
+
+
+PART_SUFFIX = ".part"
+# Progress of the segments of a download over several connections.
+SEGMENTS_SUFFIX = ".segments"
+# The result that a partial file belongs to: its location, size and validator.
+SOURCE_SUFFIX = ".source"
+# Smaller segments are not worth an extra connection.
+MIN_SEGMENT_SIZE = 16 * 1024 * 1024  # bytes
+CHUNK_SIZE = 1024 * 1024  # bytes
+# Seconds to wait for the server to send (the next part of) a response.
+TIMEOUT = 60
+
+PARTIAL_CONTENT = 206
+RANGE_NOT_SATISFIABLE = 416
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class IncompleteDownloadError(IOError):
+    """Raised when a download ended before the whole file was received."""
+
+
+class RangesNotSupportedError(IOError):
+    """Raised when a server sends the whole file, instead of the requested range."""
+
+
+class ChangedSourceError(IncompleteDownloadError):
+    """Raised when a result changed since its partial file was started."""
+
+
+def part_path(outputfile: str) -> str:
+    """The file that a download is written to until it is complete."""
+    return f"{outputfile}{PART_SUFFIX}"
+
+
+def segments_path(outputfile: str) -> str:
+    """The file that keeps track of the segments of a download in progress."""
+    return f"{part_path(outputfile)}{SEGMENTS_SUFFIX}"
+
+
+def source_path(outputfile: str) -> str:
+    """The file that records which result a partial file belongs to."""
+    return f"{part_path(outputfile)}{SOURCE_SUFFIX}"
+
+
+def _range_headers(first: int, last: str, source: dict) -> dict:
+    """Headers to request part of a file, which the server ignores (sending the
+    whole file instead) if the file changed since the download started."""
+    headers = {"Range": f"bytes={first}-{last}"}
+    if source["validator"] is not None:
+        headers["If-Range"] = source["validator"]
+    return headers
+
+
+def _get(
+    session: requests.Session, url: str, offset: int, source: dict
+) -> requests.Response:
+    headers = _range_headers(offset, "", source) if offset else {}
+    return session.get(url, headers=headers, stream=True, timeout=TIMEOUT)
+
+
+def _validator(response: requests.Response) -> Optional[str]:
+    """The strong ETag of a response, or its Last-Modified date if it has none."""
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def _check_source(response: requests.Response, source: dict) -> None:
+    """Remember the validator of a result, or check that it did not change.
+
+    Raises:
+        ChangedSourceError: if the server sent part of a changed file.
+    """
+    validator = _validator(response)
+    if validator is None:
+        return
+    if source["validator"] is None:
+        source["validator"] = validator
+    elif validator != source["validator"]:
+        raise ChangedSourceError(
+            f"{source['url']} changed since the download started."
+        )
+
+
+@contextlib.contextmanager
+def _progress(
+    outputfile: str, size: Optional[int], received: int, show: bool
+) -> Iterator[Callable[[int], None]]:
+    """Show the progress of a download like cdsapi does, if `show` is True.
+
+    Yields:
+        A function to report the number of bytes received since the last report.
+        It can be called from several threads.
+    """
+    if not show:
+        yield lambda nbytes: None
+        return
+    from tqdm import tqdm  # Only needed in interactive sessions.
+
+    lock = threading.Lock()
+    with tqdm(
+        total=size,
+        initial=received,
+        desc=os.path.basename(outputfile),
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+        leave=False,
+    ) as bar:
+
+        def update(nbytes: int) -> None:
+            with lock:
+                bar.update(nbytes)
+
+        yield update
+
+
+def _total_size(response: requests.Response, offset: int) -> Optional[int]:
+    """The size of the whole file, according to the headers of a response."""
+    match = CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+    if match and match.group(3) != "*":
+        return int(match.group(3))
+    if "Content-Length" in response.headers:
+        return offset + int(response.headers["Content-Length"])
+    return None
+
+
+def download(
+    session: requests.Session,
+    url: str,
+    outputfile: str,
+    size: Optional[int] = None,
+    segments: int = 1,
+    progress: bool = False,
+) -> None:
+    """Download a file, continuing from an earlier, interrupted attempt.
+
+    The data is written to `part_path(outputfile)`. If that file exists, only the
+    remaining bytes are requested (HTTP Range). The partial file is renamed to
+    `outputfile` once its size matches the size of the result, so `outputfile` is
+    never incomplete.
+
+    A partial file is only resumed if `source_path(outputfile)` shows it was
+    started for the same location and size. Ranges are requested with the ETag
+    (or Last-Modified date) of the first response as If-Range, so that a changed
+    file is sent whole, and a partial file of a changed result is discarded.
+
+    Large files can be downloaded over several connections at once, each fetching
+    a segment of the file into a preallocated partial file. This falls back to a
+    single connection if the server does not support ranges.
+
+    Args:
+        session: The session to download with.
+        url: Location of the result.
+        outputfile: The file to write the result to.
+        size: The size of the result in bytes, if known. Taken from the response
+            headers otherwise.
+        segments: The maximum number of connections to download with. Every
+            connection downloads at least `MIN_SEGMENT_SIZE` bytes.
+        progress: Whether to show a progress bar.
+
+    Raises:
+        IncompleteDownloadError: if the connection ended before the whole file was
+            received. Trying again continues where this attempt stopped.
+    """
+    count = min(segments, (size or 0) // MIN_SEGMENT_SIZE)
+    if count > 1:
+        try:
+            return _download_segments(
+                session, url, outputfile, size, count, progress
+            )
+        except RangesNotSupportedError:
+            _discard(outputfile)
+    _download_stream(session, url, outputfile, size, progress)
+
+
+def split_segments(size: int, count: int) -> List[List[int]]:
+    """Split a file into segments of (almost) equal size.
+
+    Returns:
+        The [start, end, received] bytes of every segment, where `end` is exclusive.
+    """
+    bounds = [size * i // count for i in range(count + 1)]
+    return [[start, end, 0] for start, end in zip(bounds, bounds[1:])]
+
+
+def _discard(outputfile: str) -> None:
+    for path in (
+        part_path(outputfile),
+        segments_path(outputfile),
+        source_path(outputfile),
+    ):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _save_source(outputfile: str, source: dict) -> None:
+    with open(source_path(outputfile), "w") as file:
+        json.dump(source, file)
+
+
+def _start(outputfile: str, url: str, size: Optional[int]) -> dict:
+    """The source of the partial file, which is only resumed if it was started for
+    the same result. Otherwise (or if its source is unknown) it is discarded."""
+    try:
+        with open(source_path(outputfile)) as file:
+            source = json.load(file)
+        if source["url"] == url and source["size"] == size:
+            return source
+    except (OSError, ValueError, KeyError, TypeError):
+        pass  # Nothing to resume.
+
+    _discard(outputfile)
+    source = {"url": url, "size": size, "validator": None}
+    _save_source(outputfile, source)
+    return source
+
+
+def _complete(outputfile: str) -> None:
+    """Move a complete partial file into place, and forget its progress."""
+    os.replace(part_path(outputfile), outputfile)
+    for path in (segments_path(outputfile), source_path(outputfile)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _save_segments(outputfile: str, size: int, segments: List[List[int]]) -> None:
+    with open(segments_path(outputfile), "w") as file:
+        json.dump({"size": size, "segments": segments}, file)
+
+
+def _load_segments(outputfile: str, size: int, count: int) -> List[List[int]]:
+    """The segments of an interrupted download, or those of a new, preallocated one."""
+    part = part_path(outputfile)
+    try:
+        with open(segments_path(outputfile)) as file:
+            progress = json.load(file)
+        if progress["size"] == size and os.path.getsize(part) == size:
+            return progress["segments"]
+    except (OSError, ValueError, KeyError):
+        pass  # Nothing to resume.
+
+    segments = split_segments(size, count)
+    # Saved before preallocating, so that the size of the partial file is never
+    # mistaken for its progress.
+    _save_segments(outputfile, size, segments)
+    with open(part, "wb") as file:
+        file.truncate(size)
+    return segments
+
+
+def _fetch_segment(
+    session: requests.Session,
+    url: str,
+    part: str,
+    source: dict,
+    segment: List[int],
+    update: Callable[[int], None],
+) -> None:
+    """Download the rest of a segment into its place in the partial file."""
+    start, end, _ = segment
+    if start + segment[2] >= end:
+        return
+    headers = _range_headers(start + segment[2], str(end - 1), source)
+    with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        response.raise_for_status()
+        if response.status_code != PARTIAL_CONTENT:
+            raise RangesNotSupportedError(f"{url} does not support ranges.")
+        _check_source(response, source)
+        with open(part, "r+b") as file:
+            file.seek(start + segment[2])
+            for chunk in response.iter_content(CHUNK_SIZE):
+                chunk = chunk[: end - start - segment[2]]
+                file.write(chunk)
+                segment[2] += len(chunk)
+                update(len(chunk))
+    if start + segment[2] < end:
+        raise IncompleteDownloadError(
+            f"Segment {start}-{end - 1} of {url} incomplete: received {segment[2]} "
+            f"of {end - start} bytes."
+        )
+
+
+def _download_segments(
+    session: requests.Session,
+    url: str,
+    outputfile: str,
+    size: int,
+    count: int,
+    progress: bool = False,
+) -> None:
+    """Download a file over `count` connections at once."""
+    part = part_path(outputfile)
+    source = _start(outputfile, url, size)
+    segments = _load_segments(outputfile, size, count)
+    received = sum(segment[2] for segment in segments)
+    try:
+        with _progress(outputfile, size, received, progress) as update:
+            with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+                futures = [
+                    executor.submit(
+                        _fetch_segment, session, url, part, source, segment, update
+                    )
+                    for segment in segments
+                ]
+        errors = [future.exception() for future in futures if future.exception()]
+    finally:
+        _save_segments(outputfile, size, segments)
+        _save_source(outputfile, source)
+    for error in errors:
+        if isinstance(error, ChangedSourceError):
+            _discard(outputfile)
+            raise error
+    for error in errors:
+        if isinstance(error, RangesNotSupportedError):
+            raise error  # Fall back to a single connection.
+    if errors:
+        raise errors[0]
+    _complete(outputfile)
+
+
+def _download_stream(
+    session: requests.Session,
+    url: str,
+    outputfile: str,
+    size: Optional[int],
+    progress: bool = False,
+) -> None:
+    """Download a file over a single connection, appending to the partial file."""
+    part = part_path(outputfile)
+    if os.path.exists(segments_path(outputfile)):
+        _discard(outputfile)  # Preallocated, so its size says nothing.
+    source = _start(outputfile, url, size)
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if size is not None and offset > size:
+        offset = 0
+
+    if size is None or offset < size:
+        response = _get(session, url, offset, source)
+        if response.status_code == RANGE_NOT_SATISFIABLE:
+            response.close()
+            offset = 0
+            response = _get(session, url, offset, source)
+        with response:
+            response.raise_for_status()
+            if response.status_code != PARTIAL_CONTENT:
+                offset = 0  # The server sends the whole (possibly changed) file.
+                source["validator"] = None
+            try:
+                _check_source(response, source)
+            except ChangedSourceError:
+                _discard(outputfile)
+                raise
+            _save_source(outputfile, source)
+            total = _total_size(response, offset)
+            if size is not None and total is not None and total != size:
+                _discard(outputfile)
+                raise IncompleteDownloadError(
+                    f"Size of {url} changed from {size} to {total} bytes."
+                )
+            size = total if size is None else size
+
+            with open(part, "ab" if offset else "wb") as file, _progress(
+                outputfile, size, offset, progress
+            ) as update:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    file.write(chunk)
+                    update(len(chunk))
+
+    received = os.path.getsize(part)
+    if size is not None and received != size:
+        raise IncompleteDownloadError(
+            f"Download of {outputfile} incomplete: received {received} of {size} "
+            "bytes."
+        )
+    _complete(outputfile)
+
+
+def fetch_result(
+    result,
+    outputfile: str,
+    session: requests.Session,
+    segments: int = 1,
+    progress: bool = False,
+) -> None:
+    """Download the result of a completed CDS request to `outputfile`.
+
+    Args:
+        result: The result, as returned by `cdsapi.Client.retrieve` without a
+            target, or the results of a completed asynchronous request.
+        outputfile: The file to write the result to.
+        session: The session to download with.
+        segments: The maximum number of connections to download with.
+        progress: Whether to show a progress bar, as cdsapi does.
+    """
+    download(
+        session,
+        result.location,
+        outputfile,
+        int(result.content_length),
+        segments,
+        progress,
+    )
@@ -0,0 +1,232 @@
+"""Estimate the size of requests in bytes, and how long they will take."""
+
+import math
+import os
+from typing import TYPE_CHECKING
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from era5cli._catalog import DATASETS
+from era5cli._catalog import ENSEMBLE_GRID
+from era5cli._ledger import Ledger
+from era5cli._request_size import VALID_HOURS_ENSEMBLE
+from era5cli._request_size import count_days
+
+
+if TYPE_CHECKING:
+    from era5cli.fetch import Fetch
+
+
+# Bytes per value of a field. GRIB files of the CDS are packed with 16 bits per
+# value; netCDF files hold 32-bit floats. Compression of netCDF files is not taken
+# into account, so that the estimate is an upper bound for budgeting disk space.
+BYTES_PER_VALUE = {"grib": 2, "netcdf": 4}
+# Number of members of the ERA5 ensemble.
+ENSEMBLE_MEMBERS = 10
+
+# Duration of a request without any download history: the time spent in the queue of
+# the CDS, and the download speed.
+DEFAULT_OVERHEAD = 600.0  # seconds
+DEFAULT_RATE = 5e6  # bytes per second
+# Minimum number of earlier transfers to base the duration on.
+MIN_TRANSFERS = 3
+# Maximum number of tiles to split the area of a request into.
+MAX_TILES = 16
+
+
+class Timing(NamedTuple):
+    """The duration of a request: a fixed overhead, plus the time to download."""
+
+    overhead: float  # seconds
+    seconds_per_byte: float
+    measured: bool = True  # Whether the timing is based on earlier transfers
+
+    def seconds(self, nbytes: int) -> float:
+        return self.overhead + nbytes * self.seconds_per_byte
+
+
+DEFAULT_TIMING = Timing(DEFAULT_OVERHEAD, 1 / DEFAULT_RATE, measured=False)
+
+
+class Estimate(NamedTuple):
+    """The estimated size and duration of a single request."""
+
+    name: str
+    outputfile: str
+    fields: int
+    nbytes: int
+    seconds: float
+    measured: bool  # Whether the duration is based on earlier transfers
+
+
+def _as_list(value) -> list:
+    return list(value) if isinstance(value, (list, tuple, range)) else [value]
+
+
+def _length(value) -> int:
+    return 1 if value is None else len(_as_list(value))
+
+
+def grid_points(grid: float, area: Optional[list] = None) -> int:
+    """Number of grid points of a field, globally or within `area`.
+
+    Args:
+        grid: Resolution of the grid, in degrees.
+        area: The area as [lat_max, lon_min, lat_min, lon_max], or None.
+    """
+    if not area:
+        return (round(180 / grid) + 1) * round(360 / grid)
+    lat_max, lon_min, lat_min, lon_max = area
+    n_lat = math.floor((lat_max - lat_min) / grid) + 1
+    n_lon = math.floor(((lon_max - lon_min) % 360) / grid) + 1
+    return n_lat * n_lon
+
+
+def _product_types(request: dict) -> List[str]:
+    product_types = request.get("product_type") or []
+    return [product_types] if isinstance(product_types, str) else product_types
+
+
+def _is_ensemble(request: dict) -> bool:
+    return any("ensemble" in product for product in _product_types(request))
+
+
+def n_fields(request: dict) -> int:
+    """Number of 2-D fields of a request: one per variable, time step, level and
+    product type."""
+    n_times = _length(request.get("time"))
+    if _is_ensemble(request):
+        # The ensemble is only available every three hours.
+        n_times = sum(
+            int(str(time).split(":")[0]) in VALID_HOURS_ENSEMBLE
+            for time in _as_list(request["time"])
+        )
+    days = request.get("day")
+    days = None if days is None else _as_list(days)
+    n_dates = sum(
+        count_days(int(year), month, days)
+        for year in _as_list(request["year"])
+        for month in _as_list(request["month"])
+    )
+    return (
+        math.prod(_length(request.get(key)) for key in ["variable", "pressure_level"])
+        * n_dates
+        * n_times
+        * _length(request.get("product_type"))
+    )
+
+
+def request_grid(name: str, request: dict) -> float:
+    """Resolution of the grid of the result of a request, in degrees."""
+    return ENSEMBLE_GRID if _is_ensemble(request) else DATASETS[name].grid
+
+
+def request_bytes(name: str, request: dict) -> int:
+    """Estimated size of the result of a request, in bytes."""
+    product_types = _product_types(request)
+    grid = request_grid(name, request)
+
+    values = n_fields(request) * grid_points(grid, request.get("area"))
+    if any("members" in product for product in product_types):
+        # Only one of the product types holds all members.
+        values += values // len(product_types) * (ENSEMBLE_MEMBERS - 1)
+    return values * BYTES_PER_VALUE[request.get("format", "netcdf")]
+
+
+def fit_timing(transfers: List[Tuple[int, float]]) -> Timing:
+    """Fit the duration of earlier transfers as an overhead plus a download time.
+
+    Args:
+        transfers: The size (in bytes) and duration (in seconds) of earlier
+            transfers.
+    """
+    if len(transfers) < MIN_TRANSFERS:
+        return DEFAULT_TIMING
+    mean_bytes = sum(nbytes for nbytes, _ in transfers) / len(transfers)
+    mean_seconds = sum(seconds for _, seconds in transfers) / len(transfers)
+    variance = sum((nbytes - mean_bytes) ** 2 for nbytes, _ in transfers)
+    covariance = sum(
+        (nbytes - mean_bytes) * (seconds - mean_seconds)
+        for nbytes, seconds in transfers
+    )
+    slope = max(covariance / variance, 0.0) if variance > 0 else 0.0
+    return Timing(max(mean_seconds - slope * mean_bytes, 0.0), slope)
+
+
+def _timings(names) -> Dict[str, Timing]:
+    """The timing of the requests of every dataset, based on the earlier transfers of
+    the same dataset in the ledger, or of all datasets if there are too few.
+
+    The ledger is only read, so it is used even if the fetch does not keep one."""
+    ledger = Ledger()
+    timings = {}
+    try:
+        for name in names:
+            if name not in timings:
+                transfers = ledger.transfers(name)
+                if len(transfers) < MIN_TRANSFERS:
+                    transfers = ledger.transfers()
+                timings[name] = fit_timing(transfers)
+    finally:
+        ledger.close()
+    return timings
+
+
+def estimate(fetch: "Fetch", tasks: List[Tuple[str, dict, str]]) -> List[Estimate]:
+    """Estimate the size and duration of every task of a fetch."""
+    timings = _timings([name for name, _, _ in tasks])
+    estimates = []
+    for name, request, outputfile in tasks:
+        nbytes = request_bytes(name, request)
+        estimates.append(
+            Estimate(
+                name,
+                outputfile,
+                n_fields(request),
+                nbytes,
+                timings[name].seconds(nbytes),
+                timings[name].measured,
+            )
+        )
+    return estimates
+
+
+def parallel_requests(fetch: "Fetch") -> int:
+    """The (maximum) number of requests that a fetch makes in parallel."""
+    if fetch.controller is not None:
+        return fetch.controller.ceiling
+    return fetch.threads or os.cpu_count() or 1
+
+
+def _wall_clock(seconds: List[float], parallel: int) -> float:
+    if not seconds:
+        return 0.0
+    return max(sum(seconds) / max(parallel, 1), max(seconds))
+
+
+def wall_clock(estimates: List[Estimate], parallel: int) -> float:
+    """Estimated duration of all requests, with `parallel` requests at a time."""
+    return _wall_clock([est.seconds for est in estimates], parallel)
+
+
+def best_tiles(fetch: "Fetch", requests: List[Tuple[str, dict]]) -> int:
+    """The number of tiles to split the area of every request into, for the shortest
+    estimated duration of the fetch.
+
+    Tiles are downloaded in parallel, but every tile is a separate request that
+    waits in the queue of the CDS. Tiling only pays off if downloading takes longer
+    than waiting, and there are fewer requests than can run in parallel.
+    """
+    timings = _timings([name for name, _ in requests])
+    sizes = [
+        (timings[name], request_bytes(name, request)) for name, request in requests
+    ]
+    parallel = parallel_requests(fetch)
+
+    def duration(n_tiles: int) -> float:
+        seconds = [timing.seconds(nbytes / n_tiles) for timing, nbytes in sizes]
+        return _wall_clock(seconds * n_tiles, parallel)
+
+    return min(range(1, MAX_TILES + 1), key=duration)
@@ -0,0 +1,249 @@
+"""Keep an inventory of the files written by era5cli, to know what is held locally."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from era5cli import key_management
+
+
+INVENTORY_FILENAME = "inventory.sqlite"
+CHECKSUM_BLOCK = 1024 * 1024  # bytes
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    variable TEXT NOT NULL,
+    first_year INTEGER NOT NULL,
+    last_year INTEGER NOT NULL,
+    years TEXT NOT NULL,
+    months TEXT NOT NULL,
+    days TEXT,
+    hours TEXT NOT NULL,
+    area TEXT,
+    levels TEXT,
+    product_type TEXT,
+    format TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    checksum TEXT NOT NULL,
+    written_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_variable ON files (variable, first_year, last_year);
+"""
+COLUMNS = [
+    "path",
+    "dataset",
+    "variable",
+    "years",
+    "months",
+    "days",
+    "hours",
+    "area",
+    "levels",
+    "product_type",
+    "format",
+    "size",
+    "checksum",
+    "written_at",
+]
+# Columns stored as JSON.
+JSON_COLUMNS = ["years", "months", "days", "hours", "area", "levels", "product_type"]
+
+
+class Record(NamedTuple):
+    """A file in the inventory, and the data that it holds."""
+
+    path: str
+    dataset: str
+    variable: str
+    years: List[int]
+    months: List[str]
+    days: Optional[List[str]]  # None for monthly data
+    hours: List[str]
+    area: Optional[List[float]]
+    levels: Optional[list]
+    product_type: Optional[list]
+    format: str
+    size: int
+    checksum: str
+    written_at: float
+
+
+def inventory_path() -> Path:
+    """The inventory is stored next to the era5cli configuration."""
+    return key_management.ERA5CLI_CONFIG_PATH.parent / INVENTORY_FILENAME
+
+
+def checksum(path: str) -> str:
+    """SHA-256 checksum of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(CHECKSUM_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _as_list(value) -> Optional[list]:
+    if value is None:
+        return None
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+class Inventory:
+    """The files written by era5cli, and what they contain.
+
+    Like the ledger, the database is only created when the first file is recorded,
+    and it is shared by all threads of a fetch.
+
+    Args:
+        path: The SQLite file to store the inventory in. Defaults to
+            `inventory_path()`.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            path = self.path or inventory_path()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def _exists(self) -> bool:
+        return self._connection is not None or (self.path or inventory_path()).exists()
+
+    def record(self, path: str, name: str, request: dict) -> None:
+        """Record a file that was written, with the request of the data it holds."""
+        stat = os.stat(path)
+        years = [int(year) for year in _as_list(request["year"])]
+        variable = _as_list(request["variable"])
+        row = {
+            "path": os.path.abspath(path),
+            "dataset": name,
+            "variable": ",".join(variable),
+            "first_year": min(years),
+            "last_year": max(years),
+            "years": json.dumps(sorted(years)),
+            "months": json.dumps(_as_list(request["month"])),
+            "days": json.dumps(_as_list(request.get("day"))),
+            "hours": json.dumps(_as_list(request["time"])),
+            "area": json.dumps(request.get("area")),
+            "levels": json.dumps(_as_list(request.get("pressure_level"))),
+            "product_type": json.dumps(_as_list(request.get("product_type"))),
+            "format": request.get("format", ""),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "checksum": checksum(path),
+            "written_at": time.time(),
+        }
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    f"INSERT OR REPLACE INTO files ({', '.join(row)})"
+                    f" VALUES ({', '.join('?' * len(row))})",
+                    tuple(row.values()),
+                )
+
+    def forget(self, paths: Iterable[str]) -> None:
+        """Remove files from the inventory, e.g. temporary files that were removed."""
+        if not self._exists():
+            return
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "DELETE FROM files WHERE path = ?",
+                    [(os.path.abspath(path),) for path in paths],
+                )
+
+    def _select(self, where: str = "", parameters: tuple = ()) -> List[Record]:
+        if not self._exists():
+            return []
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(
+                    f"SELECT {', '.join(COLUMNS)} FROM files {where} ORDER BY path",
+                    parameters,
+                )
+                .fetchall()
+            )
+        records = []
+        for row in rows:
+            fields = dict(zip(COLUMNS, row))
+            for column in JSON_COLUMNS:
+                fields[column] = json.loads(fields[column])
+            records.append(Record(**fields))
+        return records
+
+    def lookup(self, path: str) -> Optional[Record]:
+        """The record of a file, if it was not changed since it was recorded."""
+        path = os.path.abspath(path)
+        if not self._exists():
+            return None
+        with self._lock:
+            stat = (
+                self._connect()
+                .execute("SELECT size, mtime_ns FROM files WHERE path = ?", (path,))
+                .fetchone()
+            )
+        try:
+            current = os.stat(path)
+        except OSError:
+            return None
+        if stat is None or stat != (current.st_size, current.st_mtime_ns):
+            return None
+        return self._select("WHERE path = ?", (path,))[0]
+
+    def query(
+        self,
+        variables: Optional[List[str]] = None,
+        startyear: Optional[int] = None,
+        endyear: Optional[int] = None,
+        months: Optional[List[int]] = None,
+    ) -> List[Record]:
+        """The recorded files with (a part of) the given variables and period."""
+        conditions, parameters = [], []
+        if variables:
+            conditions.append(f"variable IN ({', '.join('?' * len(variables))})")
+            parameters += variables
+        if startyear is not None:
+            conditions.append("last_year >= ?")
+            parameters.append(startyear)
+        if endyear is not None:
+            conditions.append("first_year <= ?")
+            parameters.append(endyear)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        records = self._select(where, tuple(parameters))
+        if startyear is not None or endyear is not None:
+            low = startyear if startyear is not None else -1
+            high = endyear if endyear is not None else 10_000
+            records = [
+                rec for rec in records if any(low <= y <= high for y in rec.years)
+            ]
+        if months:
+            wanted = {int(month) for month in months}
+            records = [
+                rec for rec in records if wanted & {int(m) for m in rec.months}
+            ]
+        return records
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
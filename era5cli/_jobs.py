@@ -0,0 +1,236 @@
+"""Submit all CDS requests up front, poll their state, and download the results."""
+
+import functools
+import time
+from collections import deque
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from pathos.threading import ThreadPool as Pool
+from era5cli import _concurrency
+from era5cli import _deferred
+from era5cli import _ledger
+from era5cli import _retry
+from era5cli._concurrency import ConcurrencyController
+from era5cli._ledger import Ledger
+
+
+# Seconds to wait between polling passes. The interval grows by POLL_BACKOFF every
+# pass where no job finished, up to POLL_INTERVAL_MAX, to go easy on the CDS.
+POLL_INTERVAL = 5
+POLL_INTERVAL_MAX = 60
+POLL_BACKOFF = 1.5
+
+
+def _download_tracked(
+    download: Callable,
+    controller: ConcurrencyController,
+    queue_time: float,
+    remote,
+    *task,
+) -> None:
+    try:
+        download(remote, *task)
+    except Exception as error:
+        if _retry.classify(error) == _retry.REJECTED:
+            controller.record_rejection()
+        raise
+    controller.record_success(_concurrency.file_size(task[-1]), queue_time)
+
+
+class _AsyncRun:
+    """The state of all tasks of an asynchronous run: waiting to be submitted,
+    pending at the CDS, ready to be downloaded, or failed."""
+
+    def __init__(
+        self,
+        client,
+        tasks: list,
+        controller: Optional[ConcurrencyController],
+        ledger: Optional[Ledger],
+        resume: bool,
+    ):
+        self.client = client
+        self.controller = controller
+        self.ledger = ledger
+        self.resume = resume
+        self.waiting = deque(tasks)
+        self.attempts = {task[-1]: 0 for task in tasks}
+        self.retry_at: Dict[str, float] = {}
+        self.pending: list = []
+        # Completed jobs waiting for a download slot, with their queue time.
+        self.ready: deque = deque()
+        self.failures: List[_retry.Failure] = []
+
+    def failed(self, task: tuple, error: Exception) -> bool:
+        """Retry a failed submission or job later, or give up on it.
+
+        Returns:
+            Whether the CDS rejected the task because of too many requests.
+        """
+        attempt = self.attempts[task[-1]]
+        rejected = _retry.classify(error) == _retry.REJECTED
+        if rejected and self.controller is not None:
+            self.controller.record_rejection()
+        if _retry.should_retry(error, attempt):
+            delay = _retry.backoff_delay(attempt)
+            print(
+                f"Request for {task[-1]} failed ({error}). "
+                f"Resubmitting in {delay:.0f} seconds."
+            )
+            self.retry_at[task[-1]] = time.monotonic() + delay
+            self.waiting.append(task)
+        else:
+            self.failures.append(_retry.Failure(task, error, attempt))
+        return rejected
+
+    def submit(self) -> None:
+        """Submit waiting tasks, up to the number of jobs the controller allows."""
+        limit = len(self.attempts) if self.controller is None else self.controller.limit
+        submitted = reattached = 0
+        for _ in range(len(self.waiting)):
+            if len(self.pending) >= limit:
+                break
+            task = self.waiting.popleft()
+            if self.retry_at.get(task[-1], 0) > time.monotonic():
+                self.waiting.append(task)  # Not yet time to try again.
+                continue
+
+            self.attempts[task[-1]] += 1
+            remote = self.reattach(task)
+            if remote is not None:
+                self.pending.append((remote, task, time.monotonic()))
+                reattached += 1
+                continue
+
+            name, request, _ = task
+            try:
+                remote = self.client.retrieve(name, request)
+            except Exception as error:
+                if self.failed(task, error):
+                    break  # The CDS will not accept more requests now.
+                continue
+            if self.ledger is not None:
+                _deferred.keep_books(
+                    self.ledger.submitted, task, getattr(remote, "request_id", None)
+                )
+            self.pending.append((remote, task, time.monotonic()))
+            submitted += 1
+        if reattached:
+            print(f"Reattached to {reattached} earlier request(s) at the CDS.")
+        if submitted:
+            print(f"Submitted {submitted} request(s) to the CDS.")
+
+    def reattach(self, task: tuple):
+        """Get the job of a task submitted in an earlier run, when resuming."""
+        if not self.resume or self.attempts[task[-1]] > 1:
+            return None  # Failed jobs are submitted anew.
+        request_id = self.ledger.request_id(task)
+        if request_id is None:
+            return None
+        return _ledger.reattach(self.client, request_id)
+
+    def poll(self) -> bool:
+        """Find the completed jobs, to be downloaded.
+
+        Returns:
+            Whether any of the pending jobs has finished.
+        """
+        still_pending = []
+        for remote, task, submitted in self.pending:
+            try:
+                # results_ready raises an exception if the job failed at the CDS.
+                ready = remote.results_ready
+            except Exception as error:
+                self.failed(task, error)
+                continue
+            if not ready:
+                still_pending.append((remote, task, submitted))
+                continue
+            self.ready.append((remote, task, time.monotonic() - submitted))
+
+        finished = len(still_pending) < len(self.pending)
+        self.pending = still_pending
+        return finished
+
+    def start_downloads(self, pool, download: Callable, downloads: list) -> None:
+        """Hand completed jobs to the download pool, up to the number of downloads
+        the controller allows at the same time."""
+        if self.controller is None:
+            limit = len(self.attempts)
+        else:
+            limit = self.controller.limit
+        active = sum(not result.ready() for _, result in downloads)
+        while self.ready and active < limit:
+            remote, task, queue_time = self.ready.popleft()
+            work = download
+            if self.controller is not None:
+                work = functools.partial(
+                    _download_tracked, download, self.controller, queue_time
+                )
+            downloads.append((task, pool.apipe(_retry.call, work, remote, *task)))
+            active += 1
+
+
+def run_async(
+    client,
+    tasks: List[Tuple[str, dict, str]],
+    download: Callable,
+    threads=None,
+    poll_interval: float = POLL_INTERVAL,
+    controller: Optional[ConcurrencyController] = None,
+    ledger: Optional[Ledger] = None,
+    resume: bool = False,
+) -> List[_retry.Failure]:
+    """Submit all tasks, then download each result as soon as it is ready.
+
+    A single poller (the calling thread) tracks the state of all submitted jobs.
+    Completed jobs are handed to a separate pool of download threads, so queueing
+    at the CDS overlaps for all jobs, and downloads overlap with the polling.
+
+    Tasks that fail with a transient error are resubmitted (or downloaded again)
+    after a delay. Other failures do not affect the remaining tasks.
+
+    Args:
+        client: cdsapi client, created with `wait_until_complete=False`.
+        tasks: List of (name, request, outputfile) tuples.
+        download: Callable with the signature (remote, name, request, outputfile),
+            which downloads and finalizes a completed job.
+        threads: Number of download threads. Defaults to the pathos default.
+        poll_interval: Initial number of seconds between polling passes.
+        controller: If given, only as many jobs as the controller allows are
+            submitted at the same time, instead of all tasks up front, and only as
+            many results are downloaded at the same time.
+        ledger: If given, the id of every submitted job is recorded in it.
+        resume: Whether to reattach to jobs recorded in the ledger by an earlier
+            run, instead of submitting them again.
+
+    Returns:
+        The tasks that failed.
+    """
+    run = _AsyncRun(client, tasks, controller, ledger, resume)
+    if controller is not None:
+        pool = Pool(nodes=controller.ceiling)
+    else:
+        pool = Pool(nodes=threads) if threads else Pool()
+    downloads: list = []
+
+    interval = poll_interval
+    while run.waiting or run.pending or run.ready:
+        run.submit()
+        finished = run.poll()
+        run.start_downloads(pool, download, downloads)
+
+        if run.waiting or run.pending or run.ready:
+            if finished:
+                interval = poll_interval  # Jobs are finishing, poll quickly again.
+            time.sleep(interval)
+            interval = min(interval * POLL_BACKOFF, POLL_INTERVAL_MAX)
+
+    for task, result in downloads:
+        failure = result.get()
+        if failure is not None:
+            run.failures.append(failure._replace(task=task))
+    return run.failures
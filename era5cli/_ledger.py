@@ -0,0 +1,269 @@
+"""Keep an on-disk record of the jobs submitted to the CDS, to be able to resume."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from era5cli import key_management
+from era5cli._cache import cache_key
+
+
+LEDGER_FILENAME = "jobs.sqlite"
+
+SUBMITTED = "submitted"
+COMPLETED = "completed"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    request TEXT NOT NULL,
+    outputfile TEXT NOT NULL,
+    request_id TEXT,
+    state TEXT NOT NULL,
+    error TEXT,
+    submitted_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS finished (
+    outputfile TEXT PRIMARY KEY,
+    request_key TEXT NOT NULL,
+    finished_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transfers (
+    name TEXT NOT NULL,
+    nbytes INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    finished_at REAL NOT NULL
+);
+"""
+# Number of recent transfers to base estimates on.
+MAX_TRANSFERS = 200
+
+
+def ledger_path() -> Path:
+    """The ledger is stored next to the era5cli configuration."""
+    return key_management.ERA5CLI_CONFIG_PATH.parent / LEDGER_FILENAME
+
+
+def task_key(name: str, request: dict, outputfile: str) -> str:
+    """Canonical key of a task, independent of the order of the request fields."""
+    canonical = json.dumps(
+        [name, request, os.path.abspath(outputfile)], sort_keys=True, default=str
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def reattach(client, request_id: str):
+    """Get the handle of a job that was submitted earlier, or None if it is gone.
+
+    Args:
+        client: cdsapi client, created with `wait_until_complete=False`.
+        request_id: The id of the job at the CDS.
+    """
+    datastores_client = getattr(client, "client", client)
+    try:
+        return datastores_client.get_remote(request_id)
+    except Exception:
+        return None  # Expired, deleted, or not supported by this client.
+
+
+class Ledger:
+    """The state of every task, the output files that were finished, and the size
+    and duration of transfers.
+
+    The database is only created when the first state is recorded, so that dry runs
+    leave no trace. It is shared by all threads of a fetch.
+
+    Args:
+        path: The SQLite file to store the ledger in. Defaults to `ledger_path()`.
+        resumable: Whether to record the state of tasks and the finished output
+            files, to resume from. Transfers are recorded either way, to base
+            estimates on.
+    """
+
+    def __init__(self, path: Optional[Path] = None, resumable: bool = True):
+        self.path = path
+        self.resumable = resumable
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._submitted_at: Dict[str, float] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            path = self.path or ledger_path()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def _update(self, task: tuple, state: str, **fields) -> None:
+        name, request, outputfile = task
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR IGNORE INTO jobs"
+                    " (key, name, request, outputfile, state, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        task_key(*task),
+                        name,
+                        json.dumps(request, sort_keys=True, default=str),
+                        os.path.abspath(outputfile),
+                        state,
+                        now,
+                    ),
+                )
+                assignments = ", ".join(f"{field} = ?" for field in fields)
+                connection.execute(
+                    f"UPDATE jobs SET state = ?, updated_at = ?"
+                    f"{', ' if fields else ''}{assignments} WHERE key = ?",
+                    (state, now, *fields.values(), task_key(*task)),
+                )
+
+    def submitted(self, task: tuple, request_id: Optional[str]) -> None:
+        """Record that a task was submitted to the CDS, as job `request_id`."""
+        with self._lock:
+            self._submitted_at[task_key(*task)] = time.time()
+        if self.resumable:
+            self._update(
+                task, SUBMITTED, request_id=request_id, submitted_at=time.time()
+            )
+
+    def completed(self, task: tuple) -> None:
+        """Record that the result of a task was downloaded.
+
+        If the task was submitted (by this run, or by the run it resumes), the size
+        of its result and the time it took since the submission are recorded as
+        well, to estimate the duration of requests.
+        """
+        with self._lock:
+            submitted_at = self._submitted_at.pop(task_key(*task), None)
+        if self.resumable:
+            with self._lock:
+                row = (
+                    self._connect()
+                    .execute(
+                        "SELECT submitted_at FROM jobs WHERE key = ?",
+                        (task_key(*task),),
+                    )
+                    .fetchone()
+                )
+            if row is not None and row[0] is not None:
+                submitted_at = row[0]
+            self._update(task, COMPLETED, error=None)
+            self.output_finished(task)
+        if submitted_at is not None and os.path.exists(task[-1]):
+            self._transferred(
+                task[0], os.path.getsize(task[-1]), time.time() - submitted_at
+            )
+
+    def _transferred(self, name: str, nbytes: int, seconds: float) -> None:
+        """Record a transfer, keeping only the most recent ones of its dataset."""
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT INTO transfers (name, nbytes, seconds, finished_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (name, nbytes, seconds, time.time()),
+                )
+                connection.execute(
+                    "DELETE FROM transfers WHERE name = ? AND rowid NOT IN"
+                    " (SELECT rowid FROM transfers WHERE name = ?"
+                    " ORDER BY finished_at DESC LIMIT ?)",
+                    (name, name, MAX_TRANSFERS),
+                )
+
+    def transfers(self, name: Optional[str] = None) -> List[Tuple[int, float]]:
+        """The size and duration of the most recent transfers (of dataset `name`)."""
+        if not self._exists():
+            return []
+        where, parameters = ("WHERE name = ?", (name,)) if name else ("", ())
+        with self._lock:
+            return (
+                self._connect()
+                .execute(
+                    f"SELECT nbytes, seconds FROM transfers {where}"
+                    " ORDER BY finished_at DESC LIMIT ?",
+                    (*parameters, MAX_TRANSFERS),
+                )
+                .fetchall()
+            )
+
+    def failed(self, task: tuple, error: Exception) -> None:
+        """Record that a task failed, after all retries."""
+        if self.resumable:
+            self._update(task, FAILED, error=str(error))
+
+    def output_finished(self, task: tuple) -> None:
+        """Record that the output file of a task was written completely, with the
+        (normalized) request of the data it holds."""
+        if not self.resumable:
+            return
+        name, request, outputfile = task
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO finished"
+                    " (outputfile, request_key, finished_at) VALUES (?, ?, ?)",
+                    (
+                        os.path.abspath(outputfile),
+                        cache_key(name, request),
+                        time.time(),
+                    ),
+                )
+
+    def request_id(self, task: tuple) -> Optional[str]:
+        """The id of the CDS job of a task that was submitted, but not downloaded."""
+        if not self._exists():
+            return None
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT request_id FROM jobs WHERE key = ? AND state = ?",
+                    (task_key(*task), SUBMITTED),
+                )
+                .fetchone()
+            )
+        return None if row is None else row[0]
+
+    def finished(self, tasks: List[tuple]) -> Set[str]:
+        """The output files of tasks that were written completely, for the same
+        request. Files are compared by their absolute path."""
+        if not self._exists():
+            return set()
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute("SELECT outputfile, request_key FROM finished")
+                .fetchall()
+            )
+        finished = dict(rows)
+        return {
+            outputfile
+            for name, request, outputfile in tasks
+            if finished.get(os.path.abspath(outputfile)) == cache_key(name, request)
+        }
+
+    def _exists(self) -> bool:
+        return self._connection is not None or (self.path or ledger_path()).exists()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
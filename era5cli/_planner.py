@@ -0,0 +1,677 @@
+"""Plan the largest legal CDS requests, and map them onto the output files."""
+
+import calendar
+import datetime
+import itertools
+import math
+from typing import TYPE_CHECKING
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from era5cli import _request_size
+from era5cli._request_size import TooLargeRequestError
+
+
+if TYPE_CHECKING:
+    from era5cli.fetch import Fetch
+
+
+class Output(NamedTuple):
+    """An output file, and the period of a variable that is stored in it."""
+
+    variable: str
+    years: List[int]
+    months: List[str]
+    filename: str
+    levels: Optional[list] = None  # None: all requested pressure levels
+
+
+class Chunk(NamedTuple):
+    """The period covered by a single CDS request."""
+
+    years: List[int]
+    months: List[str]
+    days: Optional[List[str]] = None  # None: all requested days
+    hours: Optional[List[str]] = None  # None: all requested hours
+    levels: Optional[list] = None  # None: all requested pressure levels
+    area: Optional[list] = None  # None: the whole area of the fetch
+
+
+class Job(NamedTuple):
+    """One or more CDS requests of some variables, and the output files they fill.
+
+    A job is either a single request stored in one output file, a single request
+    split over several output files ("packed"), or several requests concatenated
+    into a single output file ("chunked"). Chunked requests either follow each other
+    in time, or hold groups of pressure levels of the same period. The requests of a
+    job contain all of its variables, which are split locally into a file per
+    variable. A job can also fill in the time steps missing from an existing output
+    file, which are merged into it.
+    """
+
+    variables: List[str]
+    chunks: List[Chunk]
+    outputs: List[Output]
+    fill: bool = False  # Whether the requests are added to an existing output
+
+    @property
+    def direct(self) -> bool:
+        """Whether the single request can be downloaded to the output file."""
+        return len(self.chunks) == 1 and len(self.outputs) == 1 and not self.fill
+
+    @property
+    def level_groups(self) -> bool:
+        """Whether the requests hold groups of pressure levels, to be merged."""
+        return len({tuple(chunk.levels or []) for chunk in self.chunks}) > 1
+
+    @property
+    def n_tiles(self) -> int:
+        """The number of tiles that the area of every request is split into."""
+        return len({tuple(chunk.area or []) for chunk in self.chunks})
+
+    def untiled(self) -> "Job":
+        """The same job, with requests of the whole area instead of tiles."""
+        return self._replace(
+            chunks=[chunk._replace(area=None) for chunk in self.chunks[:: self.n_tiles]]
+        )
+
+    @property
+    def targets(self) -> List[str]:
+        """The files that the requests of this job are downloaded to."""
+        if self.direct:
+            return [self.outputs[0].filename]
+        kind = "tile" if self.n_tiles > 1 else "chunk"
+        return [
+            temporary_filename(self.outputs[0].filename, i, kind)
+            for i in range(len(self.chunks))
+        ]
+
+
+def temporary_filename(outputfile: str, index: int, kind: str = "chunk") -> str:
+    """Filename for a request that still has to be split or concatenated."""
+    return f"{outputfile}.{kind}{index}"
+
+
+def _grid_blocks(
+    low: float, high: float, grid: float, n: int
+) -> List[Tuple[float, float]]:
+    """Split the range from `low` to `high` into `n` (or fewer) blocks of grid
+    points, as equal as possible.
+
+    The inner edges of the blocks are on the grid, so that every grid point of the
+    range is in exactly one block.
+    """
+    first = math.ceil(round(low / grid, 6))
+    last = math.floor(round(high / grid, 6))
+    n_points = last - first + 1
+    n = max(1, min(n, n_points))
+    bounds = [first + i * n_points // n for i in range(n + 1)]
+    edges = [
+        (round(start * grid, 2), round((end - 1) * grid, 2))
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+    edges[0] = (low, edges[0][1])
+    edges[-1] = (edges[-1][0], high)
+    return edges
+
+
+def tile_area(area: list, grid: float, n: int) -> List[list]:
+    """Split an area into (at most) `n` tiles, which are stitched back together
+    locally.
+
+    The tiles are as equal as possible, with the longer side of the area split into
+    more parts. An area that crosses the antimeridian is only split by latitude.
+
+    Args:
+        area: The area as [lat_max, lon_min, lat_min, lon_max].
+        grid: Resolution of the grid of the dataset, in degrees.
+        n: The number of tiles.
+
+    Returns:
+        The areas of the tiles, from north-west to south-east.
+    """
+    lat_max, lon_min, lat_min, lon_max = area
+    rows = max(i for i in range(1, math.isqrt(n) + 1) if n % i == 0)
+    cols = n // rows
+    if lon_min > lon_max:
+        rows, cols = n, 1
+    elif lat_max - lat_min > lon_max - lon_min:
+        rows, cols = cols, rows
+    lats = _grid_blocks(lat_min, lat_max, grid, rows)
+    lons = [(lon_min, lon_max)]
+    if cols > 1:
+        lons = _grid_blocks(lon_min, lon_max, grid, cols)
+    return [
+        [north, west, south, east]
+        for south, north in reversed(lats)
+        for west, east in lons
+    ]
+
+
+def tile(job: Job, areas: List[list]) -> Job:
+    """Split every request of a job into the tiles of its area."""
+    if len(areas) < 2:
+        return job
+    return job._replace(
+        chunks=[chunk._replace(area=area) for chunk in job.chunks for area in areas]
+    )
+
+
+def _blocks(values: list, size: int) -> List[list]:
+    return [values[i : i + size] for i in range(0, len(values), size)]
+
+
+def _pack(values: list, cost: Callable[[list], int], limit: int) -> List[list]:
+    """Split values into consecutive blocks, each as large as fits within `limit`."""
+    blocks: List[list] = [[]]
+    for value in values:
+        if blocks[-1] and cost(blocks[-1] + [value]) > limit:
+            blocks.append([])
+        blocks[-1].append(value)
+    return blocks
+
+
+def split_period(
+    fetch: "Fetch",
+    variables: List[str],
+    years: List[int],
+    months: List[str],
+    levels: Optional[list] = None,
+) -> List[Chunk]:
+    """Split a period into as few requests as possible, each below the size limit.
+
+    The period is split into blocks of years first. If a single year is too large,
+    every year is split into blocks of months, and, if required, every month into
+    blocks of days. Sizes are counted over the dates that exist (and have data), so
+    that every block is as large as the CDS allows.
+
+    Args:
+        fetch: The Fetch object, defining the request.
+        variables: The variables of the requests.
+        years: The years of the period.
+        months: The months of the period.
+        levels: The pressure levels of the requests, if not all requested levels.
+
+    Raises:
+        TooLargeRequestError: if a single day is already too large for the CDS.
+    """
+    limit = _request_size.max_fields(fetch)
+
+    def cost(years: List[int], months: list) -> int:
+        return _request_size.n_fields(fetch, variables, years, months, levels=levels)
+
+    if cost(years, months) <= limit:
+        return [Chunk(years, months, levels=levels)]
+    if all(cost([year], months) <= limit for year in years):
+        return [
+            Chunk(block, months, levels=levels)
+            for block in _pack(years, lambda block: cost(block, months), limit)
+        ]
+    if all(cost([year], [month]) <= limit for year in years for month in months):
+        return [
+            Chunk([year], block, levels=levels)
+            for year in years
+            for block in _pack(months, lambda block: cost([year], block), limit)
+        ]
+
+    if fetch.period == "monthly":
+        raise TooLargeRequestError(
+            "\n  A single month of your request is too large for the CDS API."
+            "\n  Consider requesting fewer pressure levels."
+        )
+    n_days = _days_per_request(fetch, variables, levels)
+    return [
+        Chunk([year], [month], block, levels=levels)
+        for year in years
+        for month in months
+        for block in _blocks(_existing_days(fetch, year, month), n_days)
+    ]
+
+
+def _days_per_request(
+    fetch: "Fetch", variables: List[str], levels: Optional[list] = None
+) -> int:
+    """The number of days that fit in a single request.
+
+    Raises:
+        TooLargeRequestError: if a single day is already too large for the CDS.
+    """
+    per_day = sum(
+        _request_size.fields_per_step(fetch, var, levels) for var in variables
+    )
+    limit = _request_size.max_fields(fetch)
+    if per_day > limit:
+        raise TooLargeRequestError(
+            "\n  A single day of your request is too large for the CDS API."
+            "\n  Consider requesting fewer hours or pressure levels."
+        )
+    return limit // per_day
+
+
+def _existing_days(fetch: "Fetch", year: int, month) -> list:
+    """The requested days of a month that exist in the calendar and have data (or
+    all requested days, if there are none)."""
+    days = [
+        day for day in fetch.days if _request_size.n_days(fetch, year, month, [day])
+    ]
+    return days or fetch.days
+
+
+def split_years(
+    fetch: "Fetch",
+    variables: List[str],
+    years: List[int],
+    months: List[str],
+    levels: Optional[list] = None,
+) -> List[Chunk]:
+    """Split a period into a request per year (or smaller, if a year is too large).
+
+    Small requests pass the CDS queue faster than a single large one, and can be
+    processed in parallel.
+    """
+    return [
+        chunk
+        for year in years
+        for chunk in split_period(fetch, variables, [year], months, levels)
+    ]
+
+
+def level_groups(
+    fetch: "Fetch", variables: List[str], periods: List["Period"]
+) -> Optional[List[list]]:
+    """Split the pressure levels into groups, if the period of an output file is too
+    large for a single request with all levels.
+
+    Every group is requested for the whole period of an output file, and the groups
+    are merged locally. This keeps the requests to the CDS aligned with the output
+    files, instead of splitting them into months or days.
+
+    Returns:
+        The groups of pressure levels, or None if the variables have no pressure
+        levels, if the requests fit with all levels, or if a single level is
+        already too large (the period is then split instead).
+    """
+    if not any(_request_size.has_levels(fetch, var) for var in variables):
+        return None
+    limit = _request_size.max_fields(fetch)
+
+    def cost(levels: Optional[list]) -> int:
+        return max(
+            _request_size.n_fields(
+                fetch, variables, list(p.years), list(p.months), levels=levels
+            )
+            for p in periods
+        )
+
+    if cost(None) <= limit or cost(fetch.pressure_levels[:1]) > limit:
+        return None
+    return _pack(fetch.pressure_levels, cost, limit)
+
+
+def _day_blocks(
+    fetch: "Fetch",
+    variables: List[str],
+    year: int,
+    month: int,
+    days,
+    levels: Optional[list] = None,
+):
+    """Request days of a month, in blocks of as many days as allowed."""
+    days = [f"{day:02d}" for day in days]
+    return [
+        Chunk([year], [f"{month:02d}"], block, levels=levels)
+        for block in _blocks(days, _days_per_request(fetch, variables, levels))
+    ]
+
+
+def _split_dates(
+    fetch: "Fetch",
+    variables: List[str],
+    first: datetime.date,
+    last: datetime.date,
+    levels: Optional[list] = None,
+) -> List[Chunk]:
+    """Split the days from `first` to `last` into requests, in chronological order.
+
+    Runs of whole months are requested like a period of years and months, with
+    consecutive years of the same months together. The days of partial months are
+    requested separately.
+    """
+    chunks: List[Chunk] = []
+    runs: List[Tuple[int, List[str]]] = []  # Whole months, per year
+
+    def flush():
+        for months, group in itertools.groupby(runs, key=lambda run: run[1]):
+            years = [year for year, _ in group]
+            chunks.extend(split_period(fetch, variables, years, months, levels))
+        runs.clear()
+
+    for index in range(first.year * 12 + first.month - 1, last.year * 12 + last.month):
+        year, month = divmod(index, 12)
+        month += 1
+        n_month_days = calendar.monthrange(year, month)[1]
+        low = first.day if (year, month) == (first.year, first.month) else 1
+        high = last.day if (year, month) == (last.year, last.month) else n_month_days
+        if fetch.period == "monthly" or (low, high) == (1, n_month_days):
+            if runs and runs[-1][0] == year:
+                runs[-1][1].append(f"{month:02d}")
+            else:
+                runs.append((year, [f"{month:02d}"]))
+        else:
+            flush()
+            chunks.extend(
+                _day_blocks(fetch, variables, year, month, range(low, high + 1), levels)
+            )
+    flush()
+    return chunks
+
+
+def _hours_between(fetch: "Fetch", low: int, high: int) -> List[str]:
+    """The requested hours from hour `low` up to and including hour `high`."""
+    return [hour for hour in fetch.hours if low <= int(hour[:2]) <= high]
+
+
+def range_selection(
+    fetch: "Fetch",
+) -> Tuple[List[str], Optional[List[str]], List[str]]:
+    """The months, days and hours that occur within the date range of a fetch.
+
+    Returns:
+        The months, days (None for monthly data) and hours of all time steps from
+        `fetch.start` to `fetch.end`.
+    """
+    start, end = fetch.start, fetch.end
+    if fetch.period == "monthly":
+        n_months = 12 * (end.year - start.year) + end.month - start.month + 1
+        months = {(start.month - 1 + i) % 12 + 1 for i in range(min(n_months, 12))}
+        return [f"{month:02d}" for month in sorted(months)], None, fetch.hours
+
+    months, days, hours = set(), set(), set()
+    day = start.date()
+    # Once every month and day occurred, the rest of a long range adds nothing.
+    while day <= end.date() and (len(months) < 12 or len(days) < 31):
+        low = start.hour if day == start.date() else 0
+        high = end.hour if day == end.date() else 23
+        selected = _hours_between(fetch, low, high)
+        if selected:
+            months.add(f"{day.month:02d}")
+            days.add(f"{day.day:02d}")
+            hours.update(selected)
+        day += datetime.timedelta(days=1)
+    if day <= end.date():
+        hours.update(fetch.hours)  # The range holds whole days as well.
+    return sorted(months), sorted(days), sorted(hours)
+
+
+def split_range(
+    fetch: "Fetch", variables: List[str], levels: Optional[list] = None
+) -> List[Chunk]:
+    """Split the date range of a fetch into as few requests as possible.
+
+    The requests cover exactly the range from `fetch.start` to `fetch.end`: whole
+    months and years are combined where possible, and the first and last month (or
+    day, for a range that starts or ends within a day) are requested separately.
+    A partial first or last day without any of the requested hours is left out.
+
+    Raises:
+        TooLargeRequestError: if a single day is already too large for the CDS.
+        ValueError: if none of the requested hours fall within the range.
+    """
+    start, end = fetch.start, fetch.end
+    first, last = start.date(), end.date()
+    if fetch.period == "monthly":
+        return _split_dates(fetch, variables, first, last, levels)
+
+    def single_day(day: datetime.date, low: int, high: int) -> List[Chunk]:
+        hours = _hours_between(fetch, low, high)
+        if not hours:
+            return []
+        return [
+            chunk._replace(hours=None if hours == fetch.hours else hours)
+            for chunk in _day_blocks(
+                fetch, variables, day.year, day.month, [day.day], levels
+            )
+        ]
+
+    if first == last:
+        chunks = single_day(first, start.hour, end.hour)
+    else:
+        head: List[Chunk] = []
+        tail: List[Chunk] = []
+        if start.hour > 0:
+            head = single_day(first, start.hour, 23)
+            first += datetime.timedelta(days=1)
+        if end.hour < 23:
+            tail = single_day(last, 0, end.hour)
+            last -= datetime.timedelta(days=1)
+        middle = []
+        if first <= last:
+            middle = _split_dates(fetch, variables, first, last, levels)
+        chunks = head + middle + tail
+    if not chunks:
+        raise ValueError(f"None of the requested hours fall within {start} - {end}.")
+    return chunks
+
+
+def split_steps(
+    fetch: "Fetch",
+    variables: List[str],
+    steps: Set[tuple],
+    levels: Optional[list] = None,
+) -> List[Chunk]:
+    """Request some time steps only, e.g. those that are missing from a file.
+
+    Days with the same hours are requested together, so that no time step is
+    requested that was not asked for.
+
+    Args:
+        steps: The time steps, as (year, month) for monthly data or as (year, month,
+            day, hour).
+    """
+    if fetch.period == "monthly":
+        months: Dict[int, List[str]] = {}
+        for year, month in sorted(steps):
+            months.setdefault(year, []).append(f"{month:02d}")
+        return [Chunk([year], months[year], levels=levels) for year in months]
+
+    hours: Dict[tuple, List[str]] = {}
+    for year, month, day, hour in sorted(steps):
+        hours.setdefault((year, month, day), []).append(f"{hour:02d}:00")
+    days: Dict[tuple, List[int]] = {}
+    for (year, month, day), selected in hours.items():
+        days.setdefault((year, month, tuple(selected)), []).append(day)
+    return [
+        chunk._replace(hours=None if list(selected) == fetch.hours else list(selected))
+        for (year, month, selected), month_days in days.items()
+        for chunk in _day_blocks(fetch, variables, year, month, month_days, levels)
+    ]
+
+
+def plan_range(fetch: "Fetch", outputs: List[Output]) -> List[Job]:
+    """Plan the requests of a date range, with an output file per variable."""
+    return [
+        Job([out.variable], split_range(fetch, [out.variable], out.levels), [out])
+        for out in outputs
+    ]
+
+
+class Period(NamedTuple):
+    """The years and months stored in an output file, for any of the variables."""
+
+    years: Tuple[int, ...]
+    months: Tuple[str, ...]
+
+
+def _period(output: Output) -> Period:
+    return Period(tuple(output.years), tuple(output.months))
+
+
+def _overlaps(chunk: Chunk, period: Period) -> bool:
+    return bool(set(chunk.years) & set(period.years)) and bool(
+        set(chunk.months) & set(period.months)
+    )
+
+
+def _is_grid(periods: List[Period]) -> bool:
+    """Check if the periods together cover every combination of their years/months."""
+    years = {year for period in periods for year in period.years}
+    months = {month for period in periods for month in period.months}
+    n_cells = sum(len(period.years) * len(period.months) for period in periods)
+    return n_cells == len(years) * len(months)
+
+
+def _plan_packed(
+    fetch: "Fetch",
+    variables: List[str],
+    periods: List[Period],
+    levels: Optional[list] = None,
+) -> List[Tuple[List[Chunk], List[Period]]]:
+    """Plan the requests for periods that together form a grid of years x months.
+
+    Returns:
+        The requests, and the periods of the output files that they fill.
+    """
+    years = sorted({year for period in periods for year in period.years})
+    months = sorted({month for period in periods for month in period.months})
+    chunks = split_period(fetch, variables, years, months, levels)
+
+    # Due to the order of splitting, every chunk either contains whole periods,
+    # or is entirely part of a single period.
+    plans = []
+    packed: Dict[int, List[Period]] = {}
+    for period in periods:
+        overlapping = [i for i, chunk in enumerate(chunks) if _overlaps(chunk, period)]
+        if len(overlapping) == 1:
+            packed.setdefault(overlapping[0], []).append(period)
+        else:
+            plans.append(([chunks[i] for i in overlapping], [period]))
+    plans += [([chunks[i]], periods) for i, periods in sorted(packed.items())]
+    return plans
+
+
+def bundle_variables(fetch: "Fetch", variables: List[str]) -> List[List[str]]:
+    """Bundle the variables of the same dataset, as long as a month of all variables
+    in a bundle fits in a single request.
+
+    Args:
+        fetch: The Fetch object, defining the request.
+        variables: The variables to bundle.
+
+    Returns:
+        The bundles of variables, grouped by dataset.
+    """
+    limit = _request_size.max_fields(fetch)
+    datasets: Dict[str, List[List[str]]] = {}
+    for variable in variables:
+        name, _ = fetch._build_name(variable)
+        bundles = datasets.setdefault(name, [[]])
+        # The largest month of the request must fit.
+        cost = max(
+            _request_size.n_fields(fetch, bundles[-1] + [variable], [year], [month])
+            for year in fetch.years
+            for month in fetch.months
+        )
+        if bundles[-1] and cost > limit:
+            bundles.append([])
+        bundles[-1].append(variable)
+    return [bundle for bundles in datasets.values() for bundle in bundles]
+
+
+def plan(
+    fetch: "Fetch",
+    outputs: List[Output],
+    pack: bool = True,
+    pack_variables: bool = False,
+    per_year: bool = False,
+) -> List[Job]:
+    """Plan the requests for all output files.
+
+    Outputs that are too large for a single request with all pressure levels are
+    requested in groups of levels (see `level_groups`).
+
+    Args:
+        fetch: The Fetch object, defining the request.
+        outputs: The output files to fill, in the order of the user's file layout.
+        pack: Whether several output files can be fetched in a single request, and be
+            split locally afterwards. If False, every request fills (a part of) only
+            a single output file.
+        pack_variables: Whether variables of the same dataset can be fetched in a
+            single request, and be split locally into a file per variable.
+        per_year: Whether to request every year separately, to be concatenated
+            locally, if outputs are not packed.
+
+    Returns:
+        A list of jobs, which together fill all output files.
+    """
+    variables = list(dict.fromkeys(out.variable for out in outputs))
+    if pack_variables:
+        bundles = bundle_variables(fetch, variables)
+    else:
+        bundles = [[variable] for variable in variables]
+
+    jobs = []
+    for bundle in bundles:
+        bundle_outputs = [out for out in outputs if out.variable in bundle]
+        # Outputs of separate pressure levels are planned separately.
+        for levels in dict.fromkeys(_levels(out) for out in bundle_outputs):
+            group = [out for out in bundle_outputs if _levels(out) == levels]
+            jobs += _plan_group(
+                fetch,
+                bundle,
+                group,
+                None if levels is None else list(levels),
+                pack,
+                per_year,
+            )
+    return jobs
+
+
+def _levels(output: Output) -> Optional[Tuple]:
+    return None if output.levels is None else tuple(output.levels)
+
+
+def _plan_group(
+    fetch: "Fetch",
+    variables: List[str],
+    group: List[Output],
+    levels: Optional[list],
+    pack: bool,
+    per_year: bool,
+) -> List[Job]:
+    """Plan the requests for the outputs of some variables, at the same levels."""
+    periods = list(dict.fromkeys(_period(out) for out in group))
+
+    groups = level_groups(fetch, variables, periods) if levels is None else None
+    if groups is not None:
+        # Every output is requested whole, with a request per group of levels.
+        plans = [
+            ([Chunk(list(p.years), list(p.months), levels=g) for g in groups], [p])
+            for p in periods
+        ]
+    elif pack and _is_grid(periods):
+        plans = _plan_packed(fetch, variables, periods, levels)
+    elif pack:
+        # Some outputs are missing from the grid (e.g. they already exist). Only
+        # pack the outputs of the same years, to not request unneeded data.
+        plans = [
+            packed
+            for _, subgroup in itertools.groupby(periods, key=lambda p: p.years)
+            for packed in _plan_packed(fetch, variables, list(subgroup), levels)
+        ]
+    else:
+        split = split_years if per_year else split_period
+        plans = [
+            (split(fetch, variables, list(p.years), list(p.months), levels), [p])
+            for p in periods
+        ]
+
+    jobs = []
+    for chunks, filled in plans:
+        outs = [out for out in group if _period(out) in filled]
+        job_variables = list(dict.fromkeys(out.variable for out in outs))
+        jobs.append(Job(job_variables, chunks, outs))
+    return jobs
@@ -0,0 +1,635 @@
+"""Combine and split downloaded files locally, to match the requested file layout."""
+
+import contextlib
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+import netCDF4
+from era5cli._catalog import CATALOG
+
+
+# Names of the time dimension in the netCDF files of the CDS (new and old CDS).
+TIME_DIMENSIONS = ["valid_time", "time"]
+# Names of the pressure level dimension (new and old CDS).
+LEVEL_DIMENSIONS = ["pressure_level", "level"]
+# Names of the horizontal dimensions, and whether the CDS stores them descending.
+GRID_DIMENSIONS = {"latitude": True, "longitude": False}
+# Number of time steps copied at once. Limits the memory use for large files.
+BLOCK_STEPS = 24
+# Attributes of netCDF variables with the (GRIB) short name of the variable.
+SHORT_NAME_ATTRIBUTES = ["GRIB_shortName", "GRIB_cfVarName"]
+# Attributes of netCDF variables that describe which variable they contain.
+NAME_ATTRIBUTES = ["long_name", "GRIB_name"]
+# Suffix of the files that outputs are written to, until they are complete.
+TEMPORARY_SUFFIX = ".tmp"
+
+
+@contextlib.contextmanager
+def _replacing(output: str) -> Iterator[str]:
+    """Write to a temporary file next to `output`, which only replaces `output` once
+    it is complete. An interrupted write never leaves a truncated output behind."""
+    tmp = f"{output}{TEMPORARY_SUFFIX}"
+    try:
+        yield tmp
+        os.replace(tmp, output)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _time_dimension(dataset: netCDF4.Dataset) -> str:
+    for name in TIME_DIMENSIONS:
+        if name in dataset.dimensions:
+            return name
+    for name, dim in dataset.dimensions.items():
+        if dim.isunlimited():
+            return name
+    raise ValueError(f"No time dimension found in {dataset.filepath()}")
+
+
+def _create_variable(dst: netCDF4.Dataset, src_var: netCDF4.Variable, sizes: dict):
+    """Create a variable in `dst` with the same definition as `src_var`."""
+    kwargs = {}
+    if dst.data_model.startswith("NETCDF4"):
+        filters = src_var.filters() or {}
+        if filters.get("zlib"):
+            kwargs.update(
+                zlib=True, complevel=filters["complevel"], shuffle=filters["shuffle"]
+            )
+        chunking = src_var.chunking()
+        if isinstance(chunking, list):
+            kwargs["chunksizes"] = [
+                min(chunk, sizes[dim] or chunk)
+                for chunk, dim in zip(chunking, src_var.dimensions)
+            ]
+    var = dst.createVariable(
+        src_var.name,
+        src_var.datatype,
+        src_var.dimensions,
+        fill_value=getattr(src_var, "_FillValue", None),
+        **kwargs,
+    )
+    var.setncatts(
+        {
+            attr: src_var.getncattr(attr)
+            for attr in src_var.ncattrs()
+            if attr != "_FillValue"  # Can only be set on creation.
+        }
+    )
+    return var
+
+
+def _create_like(
+    src: netCDF4.Dataset,
+    filename: str,
+    resize: Dict[str, int],
+    names: Optional[List[str]] = None,
+    history: Optional[str] = None,
+) -> netCDF4.Dataset:
+    """Create a file with the same structure as `src`, but with other sizes of the
+    dimensions in `resize` (e.g. the time dimension, or the pressure levels).
+
+    Variables without these dimensions are copied as well. If `names` is given,
+    only these variables are created. `history` is prepended to the history
+    attribute while the header is defined, so that the file never has to be
+    rewritten to make room for it (as for netCDF-3 files).
+    """
+    dst = netCDF4.Dataset(filename, "w", format=src.data_model)
+    dst.set_auto_maskandscale(False)
+    attributes = {attr: src.getncattr(attr) for attr in src.ncattrs()}
+    if history:
+        attributes["history"] = "\n".join(
+            text for text in [history, attributes.get("history")] if text
+        )
+    dst.setncatts(attributes)
+
+    sizes = {}
+    for name, src_dim in src.dimensions.items():
+        if src_dim.isunlimited():
+            sizes[name] = None
+        else:
+            sizes[name] = resize.get(name, len(src_dim))
+        dst.createDimension(name, sizes[name])
+
+    for src_var in src.variables.values():
+        if names is not None and src_var.name not in names:
+            continue
+        _create_variable(dst, src_var, sizes)
+        if not set(resize).intersection(src_var.dimensions):
+            dst.variables[src_var.name][...] = src_var[...]
+    return dst
+
+
+def _copy_steps(
+    src: netCDF4.Dataset,
+    dst: netCDF4.Dataset,
+    timedim: str,
+    src_start: int,
+    dst_start: int,
+    n_steps: int,
+) -> None:
+    """Copy `n_steps` time steps of all time-dependent variables, in blocks."""
+    for name, src_var in src.variables.items():
+        if timedim not in src_var.dimensions or name not in dst.variables:
+            continue
+        axis = src_var.dimensions.index(timedim)
+        for offset in range(0, n_steps, BLOCK_STEPS):
+            size = min(BLOCK_STEPS, n_steps - offset)
+            src_index = [slice(None)] * src_var.ndim
+            dst_index = [slice(None)] * src_var.ndim
+            src_index[axis] = slice(src_start + offset, src_start + offset + size)
+            dst_index[axis] = slice(dst_start + offset, dst_start + offset + size)
+            dst.variables[name][tuple(dst_index)] = src_var[tuple(src_index)]
+
+
+def _concatenate_netcdf(
+    inputs: List[str], output: str, history: Optional[str] = None
+) -> None:
+    sources = [netCDF4.Dataset(fname, "r") for fname in inputs]
+    try:
+        for src in sources:
+            src.set_auto_maskandscale(False)
+        timedim = _time_dimension(sources[0])
+        n_steps = sum(len(src.dimensions[timedim]) for src in sources)
+
+        dst = _create_like(sources[0], output, {timedim: n_steps}, history=history)
+        try:
+            position = 0
+            for src in sources:
+                src_steps = len(src.dimensions[timedim])
+                _copy_steps(src, dst, timedim, 0, position, src_steps)
+                position += src_steps
+        finally:
+            dst.close()
+    finally:
+        for src in sources:
+            src.close()
+
+
+def _level_dimension(dataset: netCDF4.Dataset) -> str:
+    for name in LEVEL_DIMENSIONS:
+        if name in dataset.dimensions:
+            return name
+    raise ValueError(f"No pressure level dimension found in {dataset.filepath()}")
+
+
+def _levels(dataset: netCDF4.Dataset, leveldim: str) -> list:
+    return list(dataset.variables[leveldim][:]) if leveldim in dataset.variables else []
+
+
+def _copy_block(
+    src: netCDF4.Dataset,
+    dst: netCDF4.Dataset,
+    timedim: str,
+    offsets: Dict[str, int],
+) -> None:
+    """Copy all time steps of `src` into a block of `dst`, which starts at the given
+    offsets along the other dimensions (e.g. levels, or latitude and longitude).
+
+    The variables with any of these dimensions are copied, in blocks of time steps.
+    """
+    n_steps = len(src.dimensions[timedim])
+    for name, src_var in src.variables.items():
+        if not set(offsets).intersection(src_var.dimensions):
+            continue
+        if name not in dst.variables:
+            continue
+        dims = src_var.dimensions
+        blocks = range(0, n_steps, BLOCK_STEPS) if timedim in dims else [0]
+        for offset in blocks:
+            src_index = [slice(None)] * src_var.ndim
+            if timedim in dims:
+                src_index[dims.index(timedim)] = slice(offset, offset + BLOCK_STEPS)
+            dst_index = list(src_index)
+            for dim, start in offsets.items():
+                if dim in dims:
+                    size = len(src.dimensions[dim])
+                    dst_index[dims.index(dim)] = slice(start, start + size)
+            dst.variables[name][tuple(dst_index)] = src_var[tuple(src_index)]
+
+
+def _merge_levels_netcdf(
+    inputs: List[str], output: str, history: Optional[str] = None
+) -> None:
+    sources = [netCDF4.Dataset(fname, "r") for fname in inputs]
+    try:
+        for src in sources:
+            src.set_auto_maskandscale(False)
+        timedim = _time_dimension(sources[0])
+        leveldim = _level_dimension(sources[0])
+        # Keep the levels in the order of the CDS (descending, unless a file says
+        # otherwise).
+        ascending = any(
+            levels[0] < levels[-1]
+            for levels in (_levels(src, leveldim) for src in sources)
+            if len(levels) > 1
+        )
+        sources.sort(key=lambda src: _levels(src, leveldim)[:1], reverse=not ascending)
+        n_levels = sum(len(src.dimensions[leveldim]) for src in sources)
+
+        dst = _create_like(sources[0], output, {leveldim: n_levels}, history=history)
+        try:
+            position = 0
+            for src in sources:
+                _copy_block(src, dst, timedim, {leveldim: position})
+                position += len(src.dimensions[leveldim])
+        finally:
+            dst.close()
+    finally:
+        for src in sources:
+            src.close()
+
+
+def _coordinates(dataset: netCDF4.Dataset, dim: str) -> List[float]:
+    # Rounded, so that the same grid point of different tiles has the same value.
+    return [round(float(value), 6) for value in dataset.variables[dim][:]]
+
+
+def _stitch_netcdf(
+    inputs: List[str], output: str, history: Optional[str] = None
+) -> None:
+    sources = [netCDF4.Dataset(fname, "r") for fname in inputs]
+    try:
+        for src in sources:
+            src.set_auto_maskandscale(False)
+        timedim = _time_dimension(sources[0])
+        # The grid points of all tiles together, and the position of every point.
+        positions = {}
+        for dim, descending in GRID_DIMENSIONS.items():
+            points = {point for src in sources for point in _coordinates(src, dim)}
+            positions[dim] = {
+                point: i for i, point in enumerate(sorted(points, reverse=descending))
+            }
+
+        dst = _create_like(
+            sources[0],
+            output,
+            {dim: len(points) for dim, points in positions.items()},
+            history=history,
+        )
+        try:
+            for src in sources:
+                offsets = {
+                    dim: points[_coordinates(src, dim)[0]]
+                    for dim, points in positions.items()
+                }
+                _copy_block(src, dst, timedim, offsets)
+        finally:
+            dst.close()
+    finally:
+        for src in sources:
+            src.close()
+
+
+def stitch(inputs: List[str], output: str, history: Optional[str] = None) -> None:
+    """Stitch netCDF files of adjacent tiles of an area into a single file.
+
+    The tiles must have the same time steps, and together cover a rectangle of grid
+    points. Every tile is copied into its place in blocks of time steps.
+
+    Args:
+        inputs: The files of the tiles, in any order.
+        output: The file to write.
+        history: Lines to prepend to the history of the output.
+    """
+    with _replacing(output) as tmp:
+        _stitch_netcdf(inputs, tmp, history)
+
+
+def _concatenate_bytes(inputs: List[str], output: str) -> None:
+    # GRIB files are a sequence of independent messages, and can be concatenated.
+    with open(output, "wb") as dst:
+        for fname in inputs:
+            with open(fname, "rb") as src:
+                shutil.copyfileobj(src, dst)
+
+
+def concatenate(inputs: List[str], output: str, history: Optional[str] = None) -> None:
+    """Concatenate files along time, without loading them in memory entirely.
+
+    netCDF files are concatenated along their time dimension, other (GRIB) files
+    are concatenated byte by byte.
+
+    Args:
+        inputs: The files to concatenate, in chronological order.
+        output: The file to write.
+        history: Lines to prepend to the history of a netCDF output.
+    """
+    with _replacing(output) as tmp:
+        if Path(output).suffix == ".nc":
+            _concatenate_netcdf(inputs, tmp, history)
+        else:
+            _concatenate_bytes(inputs, tmp)
+
+
+def merge_levels(inputs: List[str], output: str, history: Optional[str] = None) -> None:
+    """Merge files of groups of pressure levels, for the same time steps.
+
+    netCDF files are merged along their pressure level dimension, other (GRIB) files
+    are concatenated byte by byte, as every GRIB message holds a single level.
+
+    Args:
+        inputs: The files to merge.
+        output: The file to write.
+        history: Lines to prepend to the history of a netCDF output.
+    """
+    with _replacing(output) as tmp:
+        if Path(output).suffix == ".nc":
+            _merge_levels_netcdf(inputs, tmp, history)
+        else:
+            _concatenate_bytes(inputs, tmp)
+
+
+def _merge_steps_netcdf(
+    inputs: List[str], output: str, history: Optional[str] = None
+) -> None:
+    sources = [netCDF4.Dataset(fname, "r") for fname in inputs]
+    try:
+        for src in sources:
+            src.set_auto_maskandscale(False)
+        timedim = _time_dimension(sources[0])
+        origin: dict = {}  # date: (source, index)
+        for i, src in enumerate(sources):
+            for index, date in enumerate(_dates(src, timedim)):
+                origin.setdefault(date, (i, index))
+        dates = sorted(origin)
+
+        dst = _create_like(sources[0], output, {timedim: len(dates)}, history=history)
+        try:
+            # Copy runs of consecutive time steps of the same source at once.
+            runs: List[List[int]] = []  # [source, start, position, length]
+            for position, date in enumerate(dates):
+                i, index = origin[date]
+                if runs and runs[-1][0] == i and runs[-1][1] + runs[-1][3] == index:
+                    runs[-1][3] += 1  # The next step of the same run.
+                else:
+                    runs.append([i, index, position, 1])
+            for i, start, position, length in runs:
+                _copy_steps(sources[i], dst, timedim, start, position, length)
+            # The sources may count time in other units.
+            timevar = dst.variables[timedim]
+            timevar[:] = netCDF4.date2num(
+                dates, timevar.units, calendar=getattr(timevar, "calendar", "standard")
+            )
+        finally:
+            dst.close()
+    finally:
+        for src in sources:
+            src.close()
+
+
+def merge_steps(inputs: List[str], output: str, history: Optional[str] = None) -> None:
+    """Merge netCDF files with different time steps, in chronological order.
+
+    Unlike `concatenate`, the time steps of the inputs may interleave, e.g. to fill
+    in the time steps that are missing from an existing file. A time step that is
+    in several inputs is taken from the first of them.
+
+    Args:
+        inputs: The files to merge. The first one defines the structure of the
+            output.
+        output: The file to write.
+        history: Lines to prepend to the history of the output.
+    """
+    with _replacing(output) as tmp:
+        _merge_steps_netcdf(inputs, tmp, history)
+
+
+def _runs(indices: List[int]) -> List[Tuple[int, int]]:
+    """Group sorted indices into runs of consecutive values, as (start, length)."""
+    runs = []
+    for index in indices:
+        if runs and runs[-1][0] + runs[-1][1] == index:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((index, 1))
+    return runs
+
+
+def _dates(src: netCDF4.Dataset, timedim: str) -> list:
+    """The dates of the time steps of a file."""
+    timevar = src.variables[timedim]
+    return list(
+        netCDF4.num2date(
+            timevar[:],
+            timevar.units,
+            calendar=getattr(timevar, "calendar", "standard"),
+        )
+    )
+
+
+def _time_indices(src: netCDF4.Dataset, timedim: str) -> Dict[Tuple[int, int], list]:
+    """Map (year, month) to the indices of the time steps in that month."""
+    indices: Dict[Tuple[int, int], list] = {}
+    for i, date in enumerate(_dates(src, timedim)):
+        indices.setdefault((date.year, date.month), []).append(i)
+    return indices
+
+
+def _write_selection(
+    src: netCDF4.Dataset,
+    output: str,
+    timedim: str,
+    indices: List[int],
+    names: Optional[List[str]] = None,
+    history: Optional[str] = None,
+) -> None:
+    """Write the time steps at `indices` (of the variables `names`) to `output`."""
+    with _replacing(output) as tmp:
+        dst = _create_like(src, tmp, {timedim: len(indices)}, names, history)
+        try:
+            position = 0
+            for start, length in _runs(indices):
+                _copy_steps(src, dst, timedim, start, position, length)
+                position += length
+        finally:
+            dst.close()
+
+
+def _select(indices: Dict[Tuple[int, int], list], years: list, months: list) -> list:
+    """Get the sorted time indices of the given years and (zero-padded) months."""
+    return sorted(
+        i
+        for year in years
+        for month in months
+        for i in indices.get((year, int(month)), [])
+    )
+
+
+def split_by_period(
+    inputfile: str,
+    outputs: Dict[str, Tuple[list, list]],
+    history: Optional[str] = None,
+) -> None:
+    """Split a netCDF file along time into several files.
+
+    Args:
+        inputfile: The netCDF file to split.
+        outputs: The files to write, mapped to the years and months (zero-padded
+            strings) of the time steps that should be stored in them.
+        history: Lines to prepend to the history of the outputs.
+    """
+    with netCDF4.Dataset(inputfile, "r") as src:
+        src.set_auto_maskandscale(False)
+        timedim = _time_dimension(src)
+        indices = _time_indices(src, timedim)
+        for output, (years, months) in outputs.items():
+            _write_selection(
+                src,
+                output,
+                timedim,
+                _select(indices, years, months),
+                history=history,
+            )
+
+
+def _data_variables(dataset: netCDF4.Dataset, timedim: str) -> List[str]:
+    """List the time-dependent fields (not coordinates like 'expver') in a file."""
+    return [
+        name
+        for name, var in dataset.variables.items()
+        if timedim in var.dimensions and var.ndim > 1
+    ]
+
+
+def _request_name(description: str) -> str:
+    """Write a variable description like a CDS variable name, e.g. '2 metre
+    temperature' as '2m_temperature'."""
+    name = re.sub(r"(\d+)[\s_]*metres?\b", r"\1m", description.lower())
+    return "_".join(word for word in re.split(r"[^a-z0-9]+", name) if word)
+
+
+def _matches(variable: str, nc_var: netCDF4.Variable) -> bool:
+    """Whether a netCDF variable holds a requested (CDS) variable: by its (short)
+    name, or by a description that reads like the name of the variable."""
+    attributes = {attr: str(nc_var.getncattr(attr)) for attr in nc_var.ncattrs()}
+    catalogued = CATALOG.get(variable)
+    short_names = {variable, *(catalogued.short_names if catalogued else ())}
+    names = {nc_var.name} | {
+        attributes[attr] for attr in SHORT_NAME_ATTRIBUTES if attr in attributes
+    }
+    descriptions = {
+        _request_name(attributes[attr])
+        for attr in NAME_ATTRIBUTES
+        if attr in attributes
+    }
+    return bool(names & short_names) or variable in descriptions
+
+
+def match_variables(
+    variables: List[str], candidates: Dict[str, netCDF4.Variable]
+) -> Dict[str, str]:
+    """Match the requested (CDS) variable names to the variables in netCDF files.
+
+    The CDS stores variables under short names (e.g. 't2m' for '2m_temperature'),
+    but describes them in their attributes. A variable is found by its short names
+    in the catalog, or by its description (e.g. 'Total precipitation'). Every
+    variable has to match exactly one field, so that fields are never swapped.
+
+    Args:
+        variables: The requested variable names.
+        candidates: The fields in the downloaded files, by their netCDF name.
+
+    Returns:
+        The netCDF name of every requested variable.
+
+    Raises:
+        ValueError: if the number of fields does not match the number of variables,
+            or a variable matches no field, or several.
+    """
+    if len(variables) != len(candidates):
+        raise ValueError(
+            f"Expected {len(variables)} variables in the downloaded file, but found "
+            f"{len(candidates)}: {', '.join(candidates)}"
+        )
+    matches: Dict[str, str] = {}
+    for variable in variables:
+        found = [
+            nc_name
+            for nc_name, nc_var in candidates.items()
+            if _matches(variable, nc_var)
+        ]
+        if len(found) != 1:
+            raise ValueError(
+                f"Variable {variable} matches {len(found) or 'none'} of the fields in "
+                f"the downloaded file ({', '.join(found or candidates)}), instead of "
+                "exactly one."
+            )
+        matches[variable] = found[0]
+    taken = list(matches.values())
+    for nc_name in set(taken):
+        if taken.count(nc_name) > 1:
+            raise ValueError(
+                f"Field {nc_name} of the downloaded file matches several variables: "
+                + ", ".join(var for var, name in matches.items() if name == nc_name)
+            )
+    return matches
+
+
+def _extract(inputfile: str, directory: str) -> List[str]:
+    """List the netCDF files of a download, extracting it first if it is a zip.
+
+    The CDS returns a zip archive when the variables of a request do not fit in a
+    single netCDF file (e.g. accumulated and instantaneous variables).
+    """
+    if not zipfile.is_zipfile(inputfile):
+        return [inputfile]
+    with zipfile.ZipFile(inputfile) as archive:
+        archive.extractall(directory)
+        return [str(Path(directory) / name) for name in sorted(archive.namelist())]
+
+
+def split_by_variable(
+    inputfile: str,
+    outputs: Dict[str, Tuple[str, list, list]],
+    history: Optional[str] = None,
+) -> None:
+    """Split a netCDF file with several variables into a file per variable.
+
+    Every output file can additionally be limited to a part of the time period.
+
+    Args:
+        inputfile: The downloaded netCDF (or zip) file to split.
+        outputs: The files to write, mapped to the variable, and the years and months
+            (zero-padded strings) of the time steps that should be stored in them.
+        history: Lines to prepend to the history of the outputs.
+    """
+    variables = list(dict.fromkeys(variable for variable, _, _ in outputs.values()))
+    with tempfile.TemporaryDirectory(dir=Path(inputfile).parent) as tmpdir:
+        sources = [netCDF4.Dataset(fname, "r") for fname in _extract(inputfile, tmpdir)]
+        try:
+            candidates = {}
+            for src in sources:
+                src.set_auto_maskandscale(False)
+                for name in _data_variables(src, _time_dimension(src)):
+                    candidates[name] = src
+            matches = match_variables(
+                variables, {name: src[name] for name, src in candidates.items()}
+            )
+
+            indices = {}
+            for output, (variable, years, months) in outputs.items():
+                src = candidates[matches[variable]]
+                timedim = _time_dimension(src)
+                if src.filepath() not in indices:
+                    indices[src.filepath()] = _time_indices(src, timedim)
+                others = set(_data_variables(src, timedim)) - {matches[variable]}
+                _write_selection(
+                    src,
+                    output,
+                    timedim,
+                    _select(indices[src.filepath()], years, months),
+                    [name for name in src.variables if name not in others],
+                    history,
+                )
+        finally:
+            for src in sources:
+                src.close()
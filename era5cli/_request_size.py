@@ -1,7 +1,11 @@
 """Module to compute the size of the CDS request."""
 
+import calendar
+import datetime
 from typing import TYPE_CHECKING
-from era5cli import inputref
+from typing import List
+from typing import Optional
+from era5cli._catalog import CATALOG
 
 
 if TYPE_CHECKING:
@@ -16,6 +20,9 @@ if TYPE_CHECKING:
 MAX_REQUESTS = 120000  # Maximum requests for non-land data
 MAX_REQUESTS_LAND = 1000  # Max requests for "reanalysis-era5-land"
 VALID_HOURS_ENSEMBLE = [0, 3, 6, 9, 12, 15, 18, 21]
+# ERA5T, the preliminary data, is published with a delay of about five days. Later
+# dates have no data, and do not count towards the size of a request.
+ERA5T_DELAY = datetime.timedelta(days=5)
 
 
 class TooLargeRequestError(Exception):
@@ -29,19 +36,122 @@ def n_hours(fetch: "Fetch") -> int:
     return len(fetch.hours)
 
 
-def request_too_large(fetch: "Fetch") -> bool:
-    """Determine if a request will raise a Too Large Request error at the CDS."""
-    n_months = 1 if fetch.splitmonths else len(fetch.months)
+def last_available_date() -> datetime.date:
+    """The last date for which ERA5 (ERA5T) data is available."""
+    return datetime.date.today() - ERA5T_DELAY
+
+
+def count_days(year: int, month, days: Optional[list] = None) -> int:
+    """Count the days of a month that exist in the calendar and have data.
+
+    Args:
+        year: The year of the month.
+        month: The month, as a number or a zero-padded string.
+        days: The requested days, or None for monthly data, which counts as a single
+            step once the month has ended.
+    """
+    month = int(month)
+    last = last_available_date()
+    if (year, month) > (last.year, last.month):
+        return 0
+    if days is None:
+        # Monthly means are published after the month has ended.
+        return 1 if (year, month) < (last.year, last.month) else 0
+
+    n_month_days = calendar.monthrange(year, month)[1]
+    if (year, month) == (last.year, last.month):
+        n_month_days = last.day
+    return sum(1 <= int(day) <= n_month_days for day in days)
+
+
+def n_days(fetch: "Fetch", year: int, month, days: Optional[list] = None) -> int:
+    """Get the number of steps of a month: the days (default `fetch.days`) that exist
+    and have data, or a single step for monthly data."""
+    if fetch.period == "monthly":
+        return count_days(year, month)
+    return count_days(year, month, fetch.days if days is None else days)
+
+
+def max_fields(fetch: "Fetch") -> int:
+    """Get the maximum number of fields allowed in a single request to the CDS."""
+    return MAX_REQUESTS_LAND if fetch.land else MAX_REQUESTS
+
+
+def has_levels(fetch: "Fetch", variable: str) -> bool:
+    """Whether a variable is requested from the pressure level data."""
+    return (
+        not fetch.land
+        and CATALOG.is_pressure_level(variable)
+        and fetch.pressure_levels != ["surface"]
+    )
+
+
+def fields_per_step(
+    fetch: "Fetch", variable: str, levels: Optional[list] = None
+) -> int:
+    """Get the number of fields of a variable for a single day (or month, for
+    monthly data), i.e. the cost of a single step of the request.
+
+    Args:
+        fetch: The Fetch object, defining the request.
+        variable: The variable to count the fields of.
+        levels: The pressure levels of the request, if not all requested levels.
+    """
+    n_fields = n_hours(fetch)
+    if fetch.land:
+        return n_fields
+
+    # Every pressure level is a separate request
+    if has_levels(fetch, variable):
+        n_fields *= len(fetch.pressure_levels if levels is None else levels)
 
-    # Each time step counts as a request
-    request_size = n_months * len(fetch.days) * n_hours(fetch)
+    # Each (ensemble) statistic counts as a separate request
+    if fetch.statistics:
+        n_fields *= 3  # Mean and spread are added.
+    return n_fields
+
+
+def n_fields(
+    fetch: "Fetch",
+    variables: List[str],
+    years: List[int],
+    months: list,
+    days: Optional[list] = None,
+    levels: Optional[list] = None,
+) -> int:
+    """Get the number of fields of a request, counting only the dates that exist."""
+    per_day = sum(fields_per_step(fetch, var, levels) for var in variables)
+    return per_day * sum(
+        n_days(fetch, year, month, days) for year in years for month in months
+    )
+
+
+def request_too_large(fetch: "Fetch", n_levels: Optional[int] = None) -> bool:
+    """Determine if a request will raise a Too Large Request error at the CDS.
+
+    Args:
+        fetch: The Fetch object, defining the request.
+        n_levels: The number of pressure levels per request, if not all requested
+            levels.
+    """
+    # Each time step of the largest request counts as a request
+    if fetch.splitmonths:
+        steps = max(
+            n_days(fetch, year, month) for year in fetch.years for month in fetch.months
+        )
+    else:
+        steps = max(
+            sum(n_days(fetch, year, month) for month in fetch.months)
+            for year in fetch.years
+        )
+    request_size = steps * n_hours(fetch)
 
     if fetch.land:
         return True if request_size > MAX_REQUESTS_LAND else False
 
     # Every pressure level is a separate request
-    if any([var in inputref.PLVARS for var in fetch.variables]):
-        request_size *= len(fetch.pressure_levels)
+    if any(CATALOG.is_pressure_level(var) for var in fetch.variables):
+        request_size *= n_levels or len(fetch.pressure_levels)
 
     # Each (ensemble) statistic counts as a separate request
     if fetch.statistics:
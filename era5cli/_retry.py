@@ -0,0 +1,175 @@
+"""Retry failed requests where it makes sense, and keep track of the ones that fail."""
+
+import random
+import time
+from typing import Callable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+import requests
+from era5cli._download import IncompleteDownloadError
+from era5cli.key_management import NO_DATA_ERR_MSG
+from era5cli.key_management import InvalidLoginError
+
+
+# Total number of attempts for a task that keeps failing with transient errors.
+MAX_ATTEMPTS = 5
+# The delay (in seconds) before a retry doubles with every attempt, up to the maximum.
+# A random part (jitter) avoids that all failed tasks retry at the same moment.
+BACKOFF_BASE = 10
+BACKOFF_MAX = 600
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+REJECTED = "rejected"
+
+# Parts of error messages of the CDS that will not change by trying again.
+PERMANENT_MARKERS = [
+    NO_DATA_ERR_MSG,
+    "cost limits exceeded",
+    "request is too large",
+    "invalid request",
+]
+# Lower-case parts of the error messages of the CDS when a user has too many requests
+# in flight. The HTTP status code for this is 429.
+REJECTION_MARKERS = [
+    "too many requests",
+    "rate limit",
+    "temporarily limited",
+    "temporally limited",
+]
+TOO_MANY_REQUESTS = 429
+# HTTP status code of a rejected login (an invalid key).
+UNAUTHORIZED = 401
+# HTTP status codes of errors that are likely resolved by trying again later.
+TRANSIENT_STATUS_CODES = [408, 500, 502, 503, 504]
+TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ContentDecodingError,
+    IncompleteDownloadError,
+)
+
+
+class Failure(NamedTuple):
+    """A task that could not be completed, and the error it failed with."""
+
+    task: tuple
+    error: Exception
+    attempts: int
+
+
+class FailedRequestsError(Exception):
+    """Raised when some requests failed after all others were completed."""
+
+
+class GaveUpError(Exception):
+    """Raised when a step of a task failed after retrying it, so that the task is
+    not retried as a whole (e.g. resubmitted to the CDS for a failed download)."""
+
+    def __init__(self, failure: Failure):
+        super().__init__(str(failure.error))
+        self.failure = failure
+
+
+def is_rejection(error: Exception) -> bool:
+    """Check if an error means the CDS refused the request because of its limits."""
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == TOO_MANY_REQUESTS:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in REJECTION_MARKERS)
+
+
+def classify(error: Exception) -> str:
+    """Classify an error as transient, permanent, or a rejection by the CDS.
+
+    Rejections (too many requests) are transient as well, but are kept apart so
+    that the number of requests in flight can be lowered.
+    """
+    response = getattr(error, "response", None)
+    status_code = getattr(response, "status_code", None)
+    if isinstance(error, InvalidLoginError) or status_code == UNAUTHORIZED:
+        return PERMANENT
+    message = str(error).lower()
+    if any(marker.lower() in message for marker in PERMANENT_MARKERS):
+        return PERMANENT
+    if is_rejection(error):
+        return REJECTED
+    if isinstance(error, TRANSIENT_ERRORS):
+        return TRANSIENT
+    if status_code in TRANSIENT_STATUS_CODES:
+        return TRANSIENT
+    return PERMANENT
+
+
+def backoff_delay(attempt: int) -> float:
+    """Seconds to wait before the next attempt, after `attempt` failed attempts."""
+    delay = min(BACKOFF_BASE * 2 ** (attempt - 1), BACKOFF_MAX)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def should_retry(error: Exception, attempt: int, rejections: bool = True) -> bool:
+    """Decide if a task is tried again after its `attempt`th attempt failed.
+
+    Args:
+        error: The error of the failed attempt.
+        attempt: The number of attempts made so far.
+        rejections: Whether rejections by the CDS are retried as well.
+    """
+    kind = classify(error)
+    retryable = kind == TRANSIENT or (rejections and kind == REJECTED)
+    return retryable and attempt < MAX_ATTEMPTS
+
+
+def call(work: Callable, *task, rejections: bool = True) -> Optional[Failure]:
+    """Run a task, retrying transient errors with exponential backoff.
+
+    Errors never propagate, so that one failing task does not stop the others.
+    A step of the task that already gave up (see `GaveUpError`) is not retried.
+
+    Args:
+        work: Callable with the signature (name, request, outputfile).
+        task: The (name, request, outputfile) of the task.
+        rejections: Whether rejections by the CDS are retried as well. If False,
+            they are returned as a failure immediately.
+
+    Returns:
+        None if the task succeeded, otherwise the final failure.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            work(*task)
+            return None
+        except GaveUpError as error:
+            return Failure(task, error.failure.error, error.failure.attempts)
+        except Exception as error:
+            if not should_retry(error, attempt, rejections):
+                return Failure(task, error, attempt)
+            delay = backoff_delay(attempt)
+            print(
+                f"Request for {task[-1]} failed ({error}). "
+                f"Retrying in {delay:.0f} seconds."
+            )
+            time.sleep(delay)
+
+
+def summarize(failures: List[Failure], n_tasks: int) -> None:
+    """Report the failed tasks at the end of a run.
+
+    Raises:
+        FailedRequestsError: if any of the tasks failed.
+    """
+    if not failures:
+        return
+    lines = [f"{len(failures)} of {n_tasks} request(s) failed:"]
+    for failure in failures:
+        message = str(failure.error).strip().splitlines() or [""]
+        lines.append(
+            f"  {failure.task[-1]}: {type(failure.error).__name__}: {message[0]} "
+            f"({classify(failure.error)}, {failure.attempts} attempt(s))"
+        )
+    raise FailedRequestsError("\n".join(lines))
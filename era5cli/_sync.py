@@ -0,0 +1,217 @@
+"""Find the output files that are missing, or do not cover their whole period, and
+plan the requests for the time steps that they miss."""
+
+import calendar
+import datetime
+import os
+from typing import TYPE_CHECKING
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+import netCDF4
+import era5cli.utils
+from era5cli import _planner
+from era5cli import _postprocess
+from era5cli import _request_size
+from era5cli._cache import normalize
+from era5cli._inventory import Record
+from era5cli._planner import Job
+from era5cli._planner import Output
+
+
+if TYPE_CHECKING:
+    from era5cli.fetch import Fetch
+
+
+# A time step, as (year, month) for monthly data or (year, month, day, hour).
+Step = Tuple[int, ...]
+# The first bytes of netCDF-3, netCDF-4 (HDF5) and GRIB files.
+SIGNATURES = (b"CDF", b"\x89HDF", b"GRIB")
+# Fields of a request that a file has to hold exactly, and their inventory columns.
+# The dataset (and thereby the grid) is compared as well.
+RECORDED_FIELDS = {
+    "area": "area",
+    "pressure_level": "levels",
+    "product_type": "product_type",
+    "format": "format",
+}
+
+
+def is_valid(filename: str) -> bool:
+    """Whether a file exists, and starts like a netCDF or GRIB file."""
+    try:
+        with open(filename, "rb") as file:
+            return file.read(4).startswith(SIGNATURES)
+    except OSError:
+        return False
+
+
+def _is_published(step: Step, last: datetime.date) -> bool:
+    """Whether the CDS has data for a time step, if `last` is its last date."""
+    if len(step) == 2:
+        # Monthly means are published after the month has ended.
+        return step < (last.year, last.month)
+    return datetime.date(*step[:3]) <= last
+
+
+def expected_steps(fetch: "Fetch", output: Output) -> Set[Step]:
+    """The time steps that an output file should contain: those of its period that
+    exist, and have been published by the CDS."""
+    last = _request_size.last_available_date()
+    if fetch.period == "monthly":
+        steps = {
+            (year, int(month))
+            for year in output.years
+            for month in output.months
+            if _is_published((year, int(month)), last)
+        }
+        if fetch.start is not None:
+            first = (fetch.start.year, fetch.start.month)
+            final = (fetch.end.year, fetch.end.month)
+            steps = {step for step in steps if first <= step <= final}
+        return steps
+    hours = [int(hour.split(":")[0]) for hour in fetch.hours]
+    if fetch.ensemble:
+        hours = [hour for hour in hours if hour in _request_size.VALID_HOURS_ENSEMBLE]
+    steps = {
+        (year, int(month), int(day), hour)
+        for year in output.years
+        for month in output.months
+        for day in fetch.days
+        if int(day) <= calendar.monthrange(year, int(month))[1]
+        and _is_published((year, int(month), int(day)), last)
+        for hour in hours
+    }
+    if fetch.start is not None:
+        steps = {
+            step
+            for step in steps
+            if fetch.start <= datetime.datetime(*step) <= fetch.end
+        }
+    return steps
+
+
+def stored_steps(filename: str, monthly: bool) -> Optional[Set[Step]]:
+    """The time steps in a netCDF file, or None if it can not be read."""
+    try:
+        with netCDF4.Dataset(filename) as dataset:
+            timevar = dataset.variables[_postprocess._time_dimension(dataset)]
+            dates = netCDF4.num2date(
+                timevar[:],
+                timevar.units,
+                calendar=getattr(timevar, "calendar", "standard"),
+            )
+    except (OSError, ValueError, KeyError, AttributeError):
+        return None  # Not a (complete) netCDF file.
+    if monthly:
+        return {(date.year, date.month) for date in dates}
+    return {(date.year, date.month, date.day, date.hour) for date in dates}
+
+
+def missing_steps(
+    fetch: "Fetch", output: Output, exists: Optional[bool] = None
+) -> Optional[Set[Step]]:
+    """The time steps of its period that an output file does not contain.
+
+    Only the existence of GRIB files is checked, as reading their time steps would
+    require decoding every message.
+
+    Args:
+        fetch: The Fetch object, defining the request.
+        output: The output file to check.
+        exists: Whether the file exists, if already known.
+
+    Returns:
+        The missing time steps (none if the file is complete), or None if the file
+        has to be fetched whole: if it does not exist, can not be read, or holds
+        none of the time steps of its period.
+    """
+    if exists is None:
+        exists = os.path.exists(output.filename)
+    if not exists:
+        return None
+    if not output.filename.endswith(".nc"):
+        return set()
+    stored = stored_steps(output.filename, fetch.period == "monthly")
+    if stored is None:
+        return None
+    expected = expected_steps(fetch, output)
+    missing = expected - stored
+    if missing and missing == expected:
+        return None
+    return missing
+
+
+def _same_request(fetch: "Fetch", output: Output, record: Record) -> bool:
+    """Whether a file was written for the same dataset, area, levels, product type
+    (e.g. ensemble members) and format as an output."""
+    name, request = fetch._output_request(output)
+    recorded = {
+        field: getattr(record, column)
+        for field, column in RECORDED_FIELDS.items()
+        if getattr(record, column) is not None
+    }
+    requested = {
+        field: request[field] for field in RECORDED_FIELDS if field in request
+    }
+    return record.dataset == name and normalize(recorded) == normalize(requested)
+
+
+def covers(fetch: "Fetch", output: Output, record: Optional[Record]) -> bool:
+    """Whether the inventory record of a file holds the whole period of an output,
+    for the same request.
+
+    Time steps that were not published yet when the file was written are missing
+    from it, even if they were requested.
+    """
+    if record is None or record.variable != output.variable:
+        return False
+    if not _same_request(fetch, output, record):
+        return False
+    if fetch.start is not None:
+        return False  # Records hold whole months, not date ranges.
+    last = datetime.date.fromtimestamp(record.written_at) - _request_size.ERA5T_DELAY
+    if max(output.years) >= last.year and not all(
+        _is_published(step, last) for step in expected_steps(fetch, output)
+    ):
+        return False
+    return (
+        set(output.years) <= set(record.years)
+        and set(output.months) <= set(record.months)
+        and set(fetch.hours) <= set(record.hours)
+        and (fetch.days is None or set(fetch.days) <= set(record.days or []))
+    )
+
+
+def plan_missing(
+    fetch: "Fetch", outputs: List[Output]
+) -> Tuple[List[Output], List[Job]]:
+    """Find the output files that are missing or incomplete.
+
+    Files in the inventory of era5cli are checked without opening them. Only the
+    missing time steps of an incomplete netCDF file are requested, to be merged
+    into the file.
+
+    Returns:
+        The output files that have to be fetched whole, and the jobs that fill in
+        the missing time steps of the other incomplete files.
+    """
+    existing = era5cli.utils.existing_files([out.filename for out in outputs])
+    missing = []
+    fills = []
+    for out in outputs:
+        exists = out.filename in existing
+        if exists and covers(fetch, out, fetch._inventory.lookup(out.filename)):
+            continue
+        steps = missing_steps(fetch, out, exists)
+        if steps is None:
+            missing.append(out)
+        elif steps:
+            chunks = _planner.split_steps(fetch, [out.variable], steps, out.levels)
+            fills.append(Job([out.variable], chunks, [out], fill=True))
+    n_complete = len(outputs) - len(missing) - len(fills)
+    print(f"{n_complete} of {len(outputs)} file(s) are up to date.")
+    if fills:
+        print(f"Fetching the missing time steps of {len(fills)} file(s).")
+    return missing, fills
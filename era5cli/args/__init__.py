@@ -1,7 +1,9 @@
 from era5cli.args import common
 from era5cli.args import config
+from era5cli.args import estimate
 from era5cli.args import info
+from era5cli.args import inventory
 from era5cli.args import periods
 
 
-__all__ = ["common", "config", "periods", "info"]
+__all__ = ["common", "config", "periods", "info", "inventory", "estimate"]
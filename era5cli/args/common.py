@@ -1,8 +1,10 @@
 import textwrap
 from argparse import ArgumentParser
+from argparse import ArgumentTypeError
 from datetime import datetime
 from typing import Union
 import era5cli.inputref as ref
+from era5cli._catalog import DATASETS
 
 
 def _level_parse(level: str) -> Union[str, int]:
@@ -10,6 +12,30 @@ def _level_parse(level: str) -> Union[str, int]:
     return level if level == "surface" else int(level)
 
 
+def _date_parse(value: str) -> str:
+    """Check that a date (and time) is in the ISO 8601 format."""
+    try:
+        datetime.fromisoformat(value)
+    except ValueError as err:
+        raise ArgumentTypeError(
+            f"invalid date: '{value}', use YYYY-MM-DD or YYYY-MM-DDTHH:MM"
+        ) from err
+    return value
+
+
+def _tiles_parse(value: str) -> Union[str, int]:
+    """Parse the number of tiles, or 'auto'."""
+    if value == "auto":
+        return value
+    try:
+        tiles = int(value)
+    except ValueError as err:
+        raise ArgumentTypeError(f"invalid number of tiles: '{value}'") from err
+    if tiles < 1:
+        raise ArgumentTypeError("the number of tiles should be at least 1")
+    return tiles
+
+
 def add_common_args(argument_parser: ArgumentParser) -> None:
     """Populate the ArgumentParser with common (shared) arguments.
 
@@ -17,16 +43,32 @@ def add_common_args(argument_parser: ArgumentParser) -> None:
         --variables,
         --startyear,
         --endyear,
+        --start,
+        --end,
         --levels,
+        --split-levels,
         --outputprefix,
         --format,
         --merge,
         --threads,
+        --min-threads,
+        --max-threads,
         --ensemble,
         --dryrun,
         --land,
         --area,
-        --overwrite
+        --tiles,
+        --overwrite,
+        --dashed-varname,
+        --async,
+        --autochunk,
+        --pack-variables,
+        --resume,
+        --cache,
+        --cache-size,
+        --segments,
+        --sync,
+        --skip-existing
 
     Args:
         argument_parser: the ArgumentParser that the arguments are added to.
@@ -50,11 +92,12 @@ def add_common_args(argument_parser: ArgumentParser) -> None:
     argument_parser.add_argument(
         "--startyear",
         type=int,
-        required=True,
+        required=False,
         help=textwrap.dedent(
             """
             Single year or first year of range for which
-            data should be downloaded.
+            data should be downloaded. Required, unless a
+            date range is given with `--start` and `--end`.
             Every year will be downloaded in a separate file
             by default. Set `--split false` to change this
 
@@ -80,6 +123,39 @@ def add_common_args(argument_parser: ArgumentParser) -> None:
         ),
     )
 
+    argument_parser.add_argument(
+        "--start",
+        type=_date_parse,
+        required=False,
+        default=None,
+        help=textwrap.dedent(
+            """
+            Start of a date range to download, instead of
+            whole years, e.g. `2001-11-15` or
+            `2001-11-15T06:00`. Requires `--end`.
+            Every variable is downloaded in a single file
+            covering exactly the range; `--months` and
+            `--days` are ignored.
+
+            """
+        ),
+    )
+
+    argument_parser.add_argument(
+        "--end",
+        type=_date_parse,
+        required=False,
+        default=None,
+        help=textwrap.dedent(
+            """
+            End of the date range to download (inclusive),
+            e.g. `2002-02-10`, or `2002-02-10T18:00`. A date
+            without a time includes the whole day.
+
+            """
+        ),
+    )
+
     argument_parser.add_argument(
         "--levels",
         nargs="+",
@@ -100,6 +176,24 @@ def add_common_args(argument_parser: ArgumentParser) -> None:
         ),
     )
 
+    argument_parser.add_argument(
+        "--split-levels",
+        dest="split_levels",
+        action="store_true",
+        default=False,
+        help=textwrap.dedent(
+            """
+            Whether to write a file per pressure level of 3D
+            variables, e.g. `era5_temperature_500hPa_2008_
+            hourly.nc`. Without this option, all levels are
+            stored in a single file; requests that are too
+            large for the CDS with all levels are then made
+            in groups of levels, and merged locally.
+
+            """
+        ),
+    )
+
     argument_parser.add_argument(
         "--outputprefix",
         type=str,
@@ -134,7 +228,9 @@ def add_common_args(argument_parser: ArgumentParser) -> None:
             """
             Merge yearly output files.
             Default is split output files into separate files
-            for every year
+            for every year. The years are requested separately
+            (in parallel when using `--threads`), and merged
+            locally
 
             """
         ),
@@ -155,6 +251,43 @@ def add_common_args(argument_parser: ArgumentParser) -> None:
         ),
     )
 
+    argument_parser.add_argument(
+        "--max-threads",
+        dest="max_threads",
+        type=int,
+        required=False,
+        default=None,
+        help=textwrap.dedent(
+            """
+            Adapt the number of parallel requests to the
+            CDS, up to this maximum, instead of using a
+            fixed number of threads. The number grows while
+            this improves the download throughput, and
+            shrinks when requests wait longer in the CDS
+            queue, or when the CDS rejects requests because
+            of too many requests. Cannot be combined with
+            `--threads`
+
+            """
+        ),
+    )
+
+    argument_parser.add_argument(
+        "--min-threads",
+        dest="min_threads",
+        type=int,
+        required=False,
+        default=None,
+        help=textwrap.dedent(
+            """
+            Minimum number of parallel requests when
+            adapting the number of threads with
+            `--max-threads`. Defaults to 1
+
+            """
+        ),
+    )
+
     argument_parser.add_argument(
         "--ensemble",
         action="store_true",
@@ -180,8 +313,9 @@ def add_common_args(argument_parser: ArgumentParser) -> None:
             Whether to print the cdsapi request to the screen,
             or make the request to start downloading the data.
             Providing the `--dryrun` argument will print the
-            request to stdout. By default, the data will be
-            downloaded
+            request to stdout. A dry run does not connect to
+            the CDS, and does not require a login. By default,
+            the data will be downloaded
 
             """
         ),
@@ -225,6 +359,28 @@ def add_common_args(argument_parser: ArgumentParser) -> None:
         ),
     )
 
+    argument_parser.add_argument(
+        "--tiles",
+        type=_tiles_parse,
+        required=False,
+        default=None,
+        help=textwrap.dedent(
+            """
+            Split the `--area` of every request into this
+            many tiles, aligned to the grid of the dataset.
+            The tiles are downloaded in parallel, and
+            stitched together locally into the usual output
+            files. With `--tiles auto`, era5cli chooses the
+            number of tiles with the shortest estimated
+            duration, based on earlier downloads (see
+            `era5cli estimate`). Tiling does not reduce the
+            number of fields per request. Only supported for
+            netCDF files.
+
+            """
+        ),
+    )
+
     argument_parser.add_argument(
         "--overwrite",
         action="store_true",
@@ -259,24 +415,195 @@ def add_common_args(argument_parser: ArgumentParser) -> None:
         ),
     )
 
+    argument_parser.add_argument(
+        "--async",
+        dest="asynchronous",
+        action="store_true",
+        default=False,
+        help=textwrap.dedent(
+            """
+            Whether to submit all requests to the CDS at once,
+            and download the results as soon as they are
+            ready. This lets the queueing of all requests
+            overlap, instead of queueing them one thread at a
+            time. `--threads` then sets the number of
+            parallel downloads. By default, every thread
+            waits for its own request to complete
+
+            """
+        ),
+    )
+
+    argument_parser.add_argument(
+        "--autochunk",
+        action="store_true",
+        default=False,
+        help=textwrap.dedent(
+            """
+            Whether to let era5cli choose how to split up the
+            requests to the CDS. Requests are then made as
+            large as the CDS allows (e.g. several months or
+            years at once), and split or concatenated locally
+            into the output files. This results in fewer
+            requests waiting in the CDS queue. Splitting is
+            only done for netCDF files; GRIB files are only
+            concatenated. By default, every output file is a
+            separate request
+
+            """
+        ),
+    )
+
+    argument_parser.add_argument(
+        "--pack-variables",
+        dest="pack_variables",
+        action="store_true",
+        default=False,
+        help=textwrap.dedent(
+            """
+            Whether to request variables of the same dataset
+            together, as far as the CDS size limit allows. The
+            results are split locally into a file per
+            variable, with the usual file names. This reduces
+            the number of requests that have to wait in the
+            CDS queue. Only supported for netCDF files. By
+            default, every variable is a separate request.
+
+            """
+        ),
+    )
+
+    argument_parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help=textwrap.dedent(
+            """
+            Resume an earlier run of the same command, for
+            example after it was interrupted. Files that were
+            already finished are skipped, and requests that
+            were already submitted to the CDS are picked up
+            again instead of being queued anew. Implies
+            `--async`
+
+            """
+        ),
+    )
+
+    argument_parser.add_argument(
+        "--cache",
+        action="store_true",
+        default=False,
+        help=textwrap.dedent(
+            """
+            Keep the downloaded files in a local cache, and
+            reuse them instead of requesting the same data
+            from the CDS again, also when they are written
+            under another file name. The cache is stored in
+            `~/.cache/era5cli`, or in the directory set with
+            the ERA5CLI_CACHE_DIR environment variable
+
+            """
+        ),
+    )
+
+    argument_parser.add_argument(
+        "--cache-size",
+        dest="cache_size",
+        type=float,
+        required=False,
+        default=None,
+        help=textwrap.dedent(
+            """
+            Maximum size of the cache in GB. The least
+            recently used files are removed from the cache
+            when it grows larger. Defaults to 20 GB
+
+            """
+        ),
+    )
+
+    argument_parser.add_argument(
+        "--segments",
+        type=int,
+        required=False,
+        default=1,
+        help=textwrap.dedent(
+            """
+            Download large files over up to this many
+            connections at once, each fetching a part of the
+            file. This speeds up downloads of large (e.g.
+            merged) files on connections where a single
+            stream is slow. Defaults to 1
+
+            """
+        ),
+    )
+
+    argument_parser.add_argument(
+        "--sync",
+        action="store_true",
+        default=False,
+        help=textwrap.dedent(
+            """
+            Only download the output files that are missing,
+            or that do not contain all requested time steps
+            (e.g. the last month of a rolling archive).
+            Only the missing time steps of incomplete netCDF
+            files are downloaded and added to them, complete
+            files are left untouched. Of GRIB files, only the
+            existence is checked
+
+            """
+        ),
+    )
+
+    argument_parser.add_argument(
+        "--skip-existing",
+        dest="skip_existing",
+        action="store_true",
+        default=False,
+        help=textwrap.dedent(
+            """
+            Skip output files that already exist, instead of
+            asking to overwrite them. This makes re-running an
+            interrupted command safe. If all files exist,
+            era5cli exits without connecting to the CDS
+
+            """
+        ),
+    )
+
 
 def construct_year_list(args):
-    """Make a continous list of years from the startyear and endyear arguments."""
+    """Make a continous list of years from the startyear and endyear arguments, or
+    from the start and end of a date range."""
+    if args.start or args.end:
+        assert args.start and args.end, "a date range needs both --start and --end"
+        assert (
+            args.startyear is None and args.endyear is None
+        ), "use either --start and --end, or --startyear and --endyear"
+        args.startyear = datetime.fromisoformat(args.start).year
+        args.endyear = datetime.fromisoformat(args.end).year
+    assert args.startyear is not None, "--startyear (or --start and --end) is required"
+
     if not args.endyear:
         endyear = args.startyear
     else:
         endyear = args.endyear
 
     # check whether correct years have been entered
+    dataset = "reanalysis-era5-land" if args.land else "reanalysis-era5-single-levels"
+    first_year = DATASETS[dataset].first_year
     for year in (args.startyear, endyear):
         if args.land:
             assert (
-                1950 <= year <= datetime.now().year
-            ), "for ERA5-Land, year should be between 1950 and present"
+                first_year <= year <= datetime.now().year
+            ), f"for ERA5-Land, year should be between {first_year} and present"
         else:
             assert (
-                1940 <= year <= datetime.now().year
-            ), "year should be between 1940 and present"
+                first_year <= year <= datetime.now().year
+            ), f"year should be between {first_year} and present"
 
     assert endyear >= args.startyear, "endyear should be >= startyear or None"
 
@@ -12,6 +12,7 @@ def add_config_args(subparsers: argparse._SubParsersAction) -> None:
         --show
         --key
         --url
+        --revalidate
 
     Args:
         subparsers: Subparsers to which the 'config' parser should be added to.
@@ -76,6 +77,20 @@ def add_config_args(subparsers: argparse._SubParsersAction) -> None:
         ),
     )
 
+    config.add_argument(
+        "--revalidate",
+        action="store_true",
+        default=False,
+        help=textwrap.dedent(
+            f"""
+            Validate the stored keys with the CDS. A successful
+            validation is remembered for
+            {key_management.VALIDATION_TTL // 3600} hours, during which
+            era5cli does not check the keys again.
+            """
+        ),
+    )
+
     config.add_argument(
         "--uid",
         type=str,
@@ -97,7 +112,7 @@ def run_config(args):
     """Control flow for the config subparser.
 
     This custom control flow is required to implement the exclusive
-    groups [show] and [uid + key (+ url)], and specifies the behavior
+    groups [show], [revalidate] and [uid + key (+ url)], and specifies the behavior
     of these arguments.
 
     Args:
@@ -110,11 +125,16 @@ def run_config(args):
         )
         raise InputError(msg)
 
-    if args.show and args.key is not None:
-        raise InputError("Either call `show` or set the key. Not both.")
-    if not args.show and args.key is None:
+    if (args.show or args.revalidate) and args.key is not None:
+        raise InputError("Call `show` or `revalidate`, or set the key. Not both.")
+    if args.show and args.revalidate:
+        raise InputError("Either call `show` or `revalidate`. Not both.")
+    if not (args.show or args.revalidate) and args.key is None:
         raise InputError("Your CDS API key is a required input.")
-    if args.show:
+    if args.revalidate:
+        key_management.check_era5cli_config(revalidate=True)
+        print("The stored keys were succesfully validated by the CDS.")
+    elif args.show:
         url, key = key_management.load_era5cli_config()
         print(
             "Contents of .config/era5cli.txt:\n" f"    key: {key}\n" f"    url: {url}\n"
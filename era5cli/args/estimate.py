@@ -0,0 +1,93 @@
+import argparse
+import textwrap
+from era5cli import _estimate
+from era5cli.args import periods
+
+
+def add_estimate_args(
+    subparsers: argparse._SubParsersAction, common: argparse.ArgumentParser
+) -> None:
+    """Populate the subparsers with the 'estimate' parser.
+
+    The estimate parser reports the size and duration of a fetch, before anything is
+    requested from the CDS. It takes the 'hourly' and 'monthly' subcommands, with all
+    their arguments, e.g.: `era5cli estimate hourly --variables ...`.
+
+    Args:
+        subparsers: Subparsers to which the 'estimate' parser should be added to.
+        common: Parser with the arguments shared by the 'hourly' and 'monthly'
+            parsers.
+    """
+    estimate = subparsers.add_parser(
+        "estimate",
+        description=(
+            "Estimate the size of the files and the duration of a fetch, without "
+            "sending any requests to the CDS."
+        ),
+        prog=textwrap.dedent(
+            """
+            Use `era5cli estimate hourly --help` for more information
+
+            """
+        ),
+        help=textwrap.dedent(
+            """
+            Estimate the size and duration of an hourly or
+            monthly fetch, e.g.
+            `era5cli estimate hourly --variables ...`
+
+            """
+        ),
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    estimate.set_defaults(estimate=True)
+    periods_parsers = estimate.add_subparsers(dest="command")
+    periods_parsers.required = True
+    periods.add_period_args(periods_parsers, common)
+
+
+def _duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def run_estimate(era5):
+    """Print the estimated size and duration of every request of a fetch.
+
+    The duration of all requests assumes as many requests in parallel as the fetch
+    would use threads.
+    """
+    import prettytable
+
+    estimates = era5.estimate()
+    if not estimates:
+        print("Nothing to fetch.")
+        return True
+    parallel = _estimate.parallel_requests(era5)
+
+    table = prettytable.PrettyTable(["file", "fields", "size (MB)", "duration"])
+    table.align = "l"
+    for est in estimates:
+        table.add_row(
+            [
+                est.outputfile,
+                est.fields,
+                round(est.nbytes / 1e6, 1),
+                _duration(est.seconds),
+            ]
+        )
+    print(table)
+
+    total = sum(est.nbytes for est in estimates)
+    wall_clock = _estimate.wall_clock(estimates, parallel)
+    print(
+        f"{len(estimates)} request(s), {total / 1e9:.2f} GB in total. Expected "
+        f"duration: {_duration(wall_clock)}, with {parallel} request(s) in parallel."
+    )
+    if not all(est.measured for est in estimates):
+        print(
+            "Durations are rough: there are too few earlier downloads to base them "
+            "on."
+        )
+    return True
@@ -0,0 +1,136 @@
+import argparse
+import textwrap
+from era5cli import _inventory
+
+
+def add_inventory_args(subparsers: argparse._SubParsersAction) -> None:
+    """Populate the subparsers with the 'inventory' parser.
+
+    The inventory parser allows users to see which files era5cli has written.
+
+    Adds the 'inventory' parser with the 'query' subcommand, which has the following
+    arguments:
+        --variables
+        --startyear
+        --endyear
+        --months
+
+    Args:
+        subparsers: Subparsers to which the 'inventory' parser should be added to.
+    """
+    inventory = subparsers.add_parser(
+        "inventory",
+        description="Show the files that were downloaded with era5cli.",
+        prog=textwrap.dedent(
+            """
+            Use `era5cli inventory query --help` for more information
+
+            """
+        ),
+        help=textwrap.dedent(
+            """
+            Show the files that were downloaded with era5cli.
+            Use `era5cli inventory query --help` for more
+            information
+
+            """
+        ),
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    actions = inventory.add_subparsers(dest="action")
+    actions.required = True
+
+    query = actions.add_parser(
+        "query",
+        description="List the downloaded files with the given variables and period.",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    query.add_argument(
+        "--variables",
+        type=str,
+        nargs="+",
+        required=False,
+        help=textwrap.dedent(
+            """
+            Only list files of these variables.
+
+            """
+        ),
+    )
+    query.add_argument(
+        "--startyear",
+        type=int,
+        required=False,
+        help=textwrap.dedent(
+            """
+            Only list files with data of this year, or later.
+
+            """
+        ),
+    )
+    query.add_argument(
+        "--endyear",
+        type=int,
+        required=False,
+        help=textwrap.dedent(
+            """
+            Only list files with data of this year, or earlier.
+
+            """
+        ),
+    )
+    query.add_argument(
+        "--months",
+        type=int,
+        nargs="+",
+        required=False,
+        help=textwrap.dedent(
+            """
+            Only list files with data of these months.
+
+            """
+        ),
+    )
+
+
+def _years(years: list) -> str:
+    if years == list(range(years[0], years[-1] + 1)) and len(years) > 1:
+        return f"{years[0]}-{years[-1]}"
+    return ",".join(str(year) for year in years)
+
+
+def run_inventory(args):
+    """Run the inventory routine."""
+    import prettytable
+
+    inventory = _inventory.Inventory()
+    try:
+        records = inventory.query(
+            variables=args.variables,
+            startyear=args.startyear,
+            endyear=args.endyear,
+            months=args.months,
+        )
+    finally:
+        inventory.close()
+
+    if not records:
+        print("No files found in the inventory.")
+        return True
+    table = prettytable.PrettyTable(
+        ["path", "variable", "years", "months", "format", "size (MB)"]
+    )
+    table.align = "l"
+    for record in records:
+        table.add_row(
+            [
+                record.path,
+                record.variable,
+                _years(record.years),
+                ",".join(record.months),
+                record.format,
+                round(record.size / 1e6, 1),
+            ]
+        )
+    print(table)
+    return True
@@ -3,7 +3,6 @@
 
 import argparse
 import sys
-import era5cli.fetch as efetch
 from era5cli import args
 
 
@@ -25,6 +24,10 @@ def _build_parser():
 
     args.config.add_config_args(subparsers)
 
+    args.inventory.add_inventory_args(subparsers)
+
+    args.estimate.add_estimate_args(subparsers, common)
+
     return parser
 
 
@@ -43,7 +46,21 @@ def _execute(input_args: argparse.Namespace) -> True:
     if input_args.command == "config":
         return args.config.run_config(input_args)
 
-    # the fetching subroutines
+    if input_args.command == "inventory":
+        return args.inventory.run_inventory(input_args)
+
+    era5 = _build_fetch(input_args)
+    if getattr(input_args, "estimate", False):
+        return args.estimate.run_estimate(era5)
+    era5.fetch(dryrun=input_args.dryrun)
+    return True
+
+
+def _build_fetch(input_args: argparse.Namespace):
+    """Build the Fetch of an hourly or monthly command."""
+    # the fetching subroutines; their dependencies are only imported when needed
+    import era5cli.fetch as efetch
+
     years = args.common.construct_year_list(input_args)
     synoptic, statistics, splitmonths, days, hours = args.periods.set_period_args(
         input_args
@@ -57,6 +74,7 @@ def _execute(input_args: argparse.Namespace) -> True:
         hours=hours,
         variables=input_args.variables,
         area=input_args.area,
+        tiles=input_args.tiles,
         outputformat=input_args.format,
         outputprefix=input_args.outputprefix,
         period=input_args.command,
@@ -64,15 +82,28 @@ def _execute(input_args: argparse.Namespace) -> True:
         synoptic=synoptic,
         statistics=statistics,
         pressurelevels=input_args.levels,
+        split_levels=input_args.split_levels,
         threads=input_args.threads,
+        min_threads=input_args.min_threads,
+        max_threads=input_args.max_threads,
+        resume=input_args.resume,
+        cache=input_args.cache,
+        cache_size=input_args.cache_size,
+        segments=input_args.segments,
+        sync=input_args.sync,
+        skip_existing=input_args.skip_existing,
+        start=input_args.start,
+        end=input_args.end,
         splitmonths=splitmonths,
         merge=input_args.merge,
         land=input_args.land,
         overwrite=input_args.overwrite,
         dashed_vars=input_args.dashed_varname,
+        asynchronous=input_args.asynchronous,
+        autochunk=input_args.autochunk,
+        pack_variables=input_args.pack_variables,
     )
-    era5.fetch(dryrun=input_args.dryrun)
-    return True
+    return era5
 
 
 def main(argv=None):
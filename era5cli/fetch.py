@@ -1,15 +1,34 @@
 """Fetch ERA5 variables."""
 
+import datetime
+import functools
 import itertools
 import logging
 import os
 import sys
-import cdsapi
 from pathos.threading import ThreadPool as Pool
 import era5cli.inputref as ref
 import era5cli.utils
+from era5cli import _concurrency
+from era5cli import _deferred
+from era5cli import _download
+from era5cli import _estimate
+from era5cli import _inventory
+from era5cli import _jobs
+from era5cli import _ledger
+from era5cli import _planner
+from era5cli import _postprocess
+from era5cli import _retry
+from era5cli import _sync
 from era5cli import key_management
+from era5cli._cache import DEFAULT_CACHE_SIZE
+from era5cli._cache import ResultCache
+from era5cli._catalog import CATALOG
+from era5cli._client_pool import DEFAULT_POOL_MAXSIZE
+from era5cli._client_pool import ClientPool
+from era5cli._concurrency import ConcurrencyController
 from era5cli._request_size import TooLargeRequestError
+from era5cli._request_size import has_levels
 from era5cli._request_size import request_too_large
 
 
@@ -69,7 +88,8 @@ class Fetch:
         merge: bool
             Merge yearly output files (`merge = True`), or split
             output files into separate files for every year
-            (`merge = False`).
+            (`merge = False`). Merged files are requested per year,
+            and concatenated locally.
         threads: None, int
             Number of parallel threads to use when downloading.
             Defaults to a single process.
@@ -93,6 +113,67 @@ class Fetch:
             Whether to use dashed variable names in the output
             files, or the normal names ('temperature-of-snow-layer'
             instead of 'temperature_of_snow_layer').
+        asynchronous: bool
+            Whether to submit all requests to the CDS up front, and download
+            the results as soon as they are ready (`asynchronous = True`), or
+            have every thread wait for its own request to complete before
+            submitting the next one (`asynchronous = False`).
+        autochunk: bool
+            Whether to let era5cli choose the requests to the CDS
+            (`autochunk = True`). Requests are then made as large as the CDS
+            allows, and split or concatenated locally to get the output files
+            of the requested layout. Otherwise, there is one request per
+            output file (`autochunk = False`).
+        pack_variables: bool
+            Whether to request variables of the same dataset together
+            (`pack_variables = True`), and split the results locally into
+            a file per variable. Only supported for netCDF output.
+        min_threads: None, int
+            Minimum number of requests in flight, when the number of
+            threads is adapted to the CDS. Defaults to 1.
+        max_threads: None, int
+            Maximum number of requests in flight. If set, the number of
+            threads is adapted to the queue times, throughput and
+            rejections of the CDS, instead of the fixed `threads`.
+        resume: bool
+            Whether to resume an earlier, interrupted fetch (`resume = True`).
+            Output files that were finished are skipped, and jobs that were
+            already submitted to the CDS are reattached to instead of being
+            submitted again. Implies `asynchronous`.
+        cache: bool
+            Whether to keep downloaded results in a local cache, and reuse
+            them for identical requests (`cache = True`), even if these are
+            stored under a different file name.
+        cache_size: None, float
+            Size limit of the cache in GB. The least recently used results
+            are removed when the cache grows beyond it. Defaults to 20 GB.
+        segments: int
+            Maximum number of connections to download a single large result
+            with, each fetching a segment of the file. Defaults to 1.
+        sync: bool
+            Whether to only fetch the output files that are missing, or that
+            do not contain all of their time steps (`sync = True`). Incomplete
+            files are replaced.
+        skip_existing: bool
+            Whether to skip output files that already exist, instead of
+            asking to overwrite them (`skip_existing = True`). Files that do
+            not start like a netCDF or GRIB file are fetched again.
+        start: str or datetime
+            Start of a date range to fetch, instead of the years, months and
+            days. Dates without a time start at 00:00.
+        end: str or datetime
+            End of the date range (inclusive). Dates without a time end at
+            23:00.
+        split_levels: bool
+            Whether to write a file per pressure level of 3D variables
+            (`split_levels = True`). Requests that are too large with all
+            pressure levels are split into groups of levels anyway, and merged
+            locally.
+        tiles: int or str
+            The number of tiles to split the area of every request into, to be
+            downloaded in parallel and stitched together locally. With
+            `tiles = 'auto'`, the number of tiles with the shortest estimated
+            duration is chosen. Requires an area, and netCDF files.
     """
 
     def __init__(
@@ -116,9 +197,51 @@ class Fetch:
         land=False,
         overwrite=False,
         dashed_vars=False,
+        asynchronous=False,
+        autochunk=False,
+        pack_variables=False,
+        min_threads=None,
+        max_threads=None,
+        resume=False,
+        cache=False,
+        cache_size=None,
+        segments=1,
+        sync=False,
+        skip_existing=False,
+        start=None,
+        end=None,
+        split_levels=False,
+        tiles=None,
     ):
         """Initialization of Fetch class."""
-        self._get_login()  # Get login info from config file.
+        if segments < 1:
+            raise ValueError("The number of segments should be at least 1.")
+        if (start is None) != (end is None):
+            raise ValueError("A date range needs both a start and an end.")
+        self._clients = ClientPool(
+            maxsize=max(max_threads or threads or DEFAULT_POOL_MAXSIZE, segments)
+        )
+        """ClientPool: Reusable CDS clients, shared by all tasks of this fetch."""
+        self._ledger = _ledger.Ledger(resumable=resume)
+        """Ledger: Record of the duration of transfers, and with `resume`, of the
+        submitted jobs and finished output files to resume from."""
+        self._inventory = _inventory.Inventory()
+        """Inventory: Record of the files written, and the data they hold."""
+        self._cache = None
+        """ResultCache: Local cache of downloaded results, if enabled."""
+        self._stage = None
+        """DeferredStage: Finishes downloaded files while others are downloaded."""
+        self._intermediate = set()
+        """set(str): Downloaded files that are only split or concatenated."""
+        self._planned = None
+        """list(tuple): Collects the planned tasks instead of printing them."""
+        if cache:
+            self._cache = ResultCache(max_size=cache_size or DEFAULT_CACHE_SIZE)
+        self.url = None
+        """str: URL to the CDS API. Only loaded before the first real request, so
+        that dry runs work offline."""
+        self.key = None
+        """str: The CDS API key. Only loaded before the first real request."""
 
         self.months = era5cli.utils._zpad_months(months)
         """list(str): List of zero-padded strings of months
@@ -176,6 +299,58 @@ class Fetch:
         self.dashed_vars = dashed_vars
         """bool: Whether to use dashed variable names in the output
         files, or the normal names."""
+        self.asynchronous = asynchronous or resume
+        """bool: Whether to submit all requests up front and poll for their
+        results, instead of waiting for each request in its own thread."""
+        self.resume = resume
+        """bool: Whether to skip finished output files, and reattach to the jobs
+        submitted by an earlier fetch."""
+        self.autochunk = autochunk
+        """bool: Whether to make requests as large as allowed, and split or
+        concatenate them locally into the output files."""
+        self.pack_variables = pack_variables
+        """bool: Whether to request variables of the same dataset together, and
+        split them locally into a file per variable."""
+        self.segments = segments
+        """int: Maximum number of connections to download a single result with."""
+        self.sync = sync
+        """bool: Whether to only fetch missing or incomplete output files."""
+        self.skip_existing = skip_existing
+        """bool: Whether to skip valid output files that already exist."""
+        self.start = None
+        """datetime: Start of the date range to fetch, if any. A date range replaces
+        the years, months and days."""
+        self.end = None
+        """datetime: End of the date range to fetch (inclusive), if any."""
+        if start is not None:
+            self._set_range(start, end)
+        self.split_levels = split_levels
+        """bool: Whether to write a file per pressure level of 3D variables."""
+        self.tiles = tiles
+        """int or str: The number of tiles to split the area of every request into,
+        'auto' to choose it from the estimated duration, or None."""
+        if tiles is not None:
+            if not area:
+                raise ValueError("Splitting requests into tiles requires an area.")
+            if tiles != "auto" and not (isinstance(tiles, int) and tiles >= 1):
+                raise ValueError("The number of tiles should be at least 1, or 'auto'.")
+        self._level_groups = False
+        """bool: Whether the requests are too large with all pressure levels, and
+        are requested in groups of levels instead."""
+        self.controller = None
+        """ConcurrencyController: Adapts the number of requests in flight, if a
+        maximum number of threads is given."""
+        if threads is not None and max_threads is not None:
+            raise ValueError(
+                "Use either a fixed number of threads, or a maximum number of "
+                "threads. Not both."
+            )
+        if min_threads is not None and max_threads is None:
+            raise ValueError("A minimum number of threads requires a maximum.")
+        if max_threads is not None:
+            self.controller = ConcurrencyController(
+                floor=min_threads or 1, ceiling=max_threads
+            )
 
         if self.merge and self.splitmonths:
             self.splitmonths = False
@@ -183,20 +358,32 @@ class Fetch:
         vars = list(self.variables)  # Use list() to avoid copying by reference
         if "geopotential" in vars and pressurelevels == ["surface"]:
             vars.remove("geopotential")
-        if any([var in ref.PLVARS for var in vars]):
+        if any(CATALOG.is_pressure_level(var) for var in vars):
             self._check_levels()
 
-        if self.period == "hourly" and request_too_large(self):
-            raise TooLargeRequestError(
-                "\n  Your request is too large for the CDS API."
-                "\n  Consider splitting up your request in months, "
-                "\n  by using '--splitmonths True'."
-                "\n  For more info see 'era5cli hourly --help'."
-            )
+        if (
+            self.period == "hourly"
+            and not autochunk
+            and self.start is None
+            and request_too_large(self)
+        ):
+            if not request_too_large(self, n_levels=1):
+                # Only all pressure levels together are too large.
+                self._level_groups = True
+            else:
+                raise TooLargeRequestError(
+                    "\n  Your request is too large for the CDS API."
+                    "\n  Consider splitting up your request in months, "
+                    "\n  by using '--splitmonths True', or let era5cli"
+                    "\n  split up your request by using '--autochunk'."
+                    "\n  For more info see 'era5cli hourly --help'."
+                )
 
     def _get_login(self):
+        if self.url is not None:
+            return  # Already logged in during an earlier fetch.
         # First check if the config exists, and guide the user if it does not.
-        key_management.check_era5cli_config()
+        key_management.check_era5cli_config(session=self._clients.session())
         # Only then load the keys (as they should be there now).
         self.url, self.key = key_management.load_era5cli_config()
 
@@ -215,12 +402,87 @@ class Fetch:
         self._extension()
         # define fetch call depending on split argument
 
-        if self.splitmonths:
-            self._split_variable_yr_month()
-        elif not self.merge:
-            self._split_variable_yr()
-        else:
-            self._split_variable()
+        if self.pack_variables and self.ext != "nc":
+            logging.warning(
+                "Variables can only be split locally from netCDF files. "
+                "Every variable is requested separately.\n"
+            )
+        if self.tiles is not None and self.ext != "nc":
+            logging.warning(
+                "Tiles can only be stitched together locally from netCDF files. "
+                "Every request covers the whole area.\n"
+            )
+        try:
+            if (
+                self.autochunk
+                or self.pack_variables
+                or self.merge
+                or self.sync
+                or self.start is not None
+                or self.split_levels
+                or self._level_groups
+                or self.tiles is not None
+            ):
+                self._split_auto()
+            elif self.splitmonths:
+                self._split_variable_yr_month()
+            else:
+                self._split_variable_yr()
+        finally:
+            self._clients.close()
+            self._ledger.close()
+            self._inventory.close()
+            if self._cache is not None:
+                self._cache.close()
+
+    def _set_range(self, start, end):
+        """Fetch the date range from `start` to `end`, instead of a period.
+
+        Dates without a time cover the whole day. All months and days are requested
+        within the range.
+        """
+        self.start = _as_datetime(start, hour=0)
+        self.end = _as_datetime(end, hour=23)
+        if self.end < self.start:
+            raise ValueError("The end of the date range is before its start.")
+        self.years = list(range(self.start.year, self.end.year + 1))
+        self.months = era5cli.utils._zpad_months(list(range(1, 13)))
+        if self.period != "monthly":
+            self.days = era5cli.utils._zpad_days(list(range(1, 32)))
+
+    def _range_label(self) -> str:
+        """Label of the date range, for the output filenames."""
+        if self.period == "monthly":
+            return f"{self.start:%Y%m}-{self.end:%Y%m}"
+        start, end = f"{self.start:%Y%m%d}", f"{self.end:%Y%m%d}"
+        if self.start.hour > 0:
+            start += f"T{self.start:%H}"
+        if self.end.hour < 23:
+            end += f"T{self.end:%H}"
+        return f"{start}-{end}"
+
+    def estimate(self):
+        """Estimate the size and duration of the requests, without fetching them.
+
+        Returns
+        -------
+        list(_estimate.Estimate)
+            The estimate for every request that would be sent to the CDS.
+        """
+        self._planned = []
+        try:
+            self.fetch(dryrun=True)
+            return _estimate.estimate(self, self._planned)
+        finally:
+            self._planned = None
+
+    def _dryrun(self, tasks: list):
+        """Print the tasks of a dry run, or collect them for an estimate."""
+        if self._planned is not None:
+            self._planned.extend(tasks)
+            return
+        for name, request, outputfile in tasks:
+            print(name, request, outputfile)
 
     def _extension(self):
         """Set filename extension."""
@@ -243,17 +505,22 @@ class Fetch:
         name = f"_{lon(lon_min)}-{lon(lon_max)}_{lat(lat_min)}-{lat(lat_max)}"
         return name
 
-    def _define_outputfilename(self, var, years, month=None):
+    def _define_outputfilename(self, var, years, month=None, level=None):
         """Define output filename."""
         start, end = years[0], years[-1]
 
         prefix = f"{self.outputprefix}-land" if self.land else self.outputprefix
 
         yearblock = f"{start}-{end}" if start != end else f"{start}"
+        if self.start is not None:
+            yearblock = self._range_label()
 
         varname = var.replace("_", "-") if self.dashed_vars else var
 
-        fname = f"{prefix}_{varname}_{yearblock}"
+        fname = f"{prefix}_{varname}"
+        if level is not None:
+            fname += f"_{level}hPa"
+        fname += f"_{yearblock}"
 
         if month is not None:
             fname += f"-{month}"
@@ -270,19 +537,6 @@ class Fetch:
         fname += f".{self.ext}"
         return fname
 
-    def _split_variable(self):
-        """Split by variable."""
-        outputfiles = [
-            self._define_outputfilename(var, self.years) for var in self.variables
-        ]
-        if not self.overwrite:
-            era5cli.utils.assert_outputfiles_not_exist(outputfiles)
-
-        years = len(outputfiles) * [self.years]
-
-        pool = Pool(nodes=self.threads) if self.threads else Pool()
-        pool.map(self._getdata, self.variables, years, outputfiles)
-
     def _split_variable_yr(self):
         """Fetch variable split by variable and year."""
         outputfiles = []
@@ -291,13 +545,9 @@ class Fetch:
             outputfiles += [self._define_outputfilename(var, [yr]) for yr in self.years]
             variables += len(self.years) * [var]
 
-        if not self.overwrite:
-            era5cli.utils.assert_outputfiles_not_exist(outputfiles)
-
         years = len(self.variables) * self.years
 
-        pool = Pool(nodes=self.threads) if self.threads else Pool()
-        pool.map(self._getdata, variables, years, outputfiles)
+        self._run(variables, years, outputfiles)
 
     def _split_variable_yr_month(self):
         """Fetch variable split by variable, year, and month."""
@@ -314,11 +564,445 @@ class Fetch:
             years += [year]
             months += [month]
 
+        self._run(variables, years, outputfiles, months)
+
+    def _skipped_outputs(self, tasks: list) -> set:
+        """Output files that are not fetched again: those that an earlier, resumed
+        fetch already finished for the same request, and (with `skip_existing`)
+        valid existing files.
+
+        Parameters
+        ----------
+        tasks: list(tuple)
+            List of (name, request, outputfile) tuples, with the request of the
+            data that each output file holds.
+        """
+        skipped = set()
+        if self.resume:
+            skipped.update(
+                outputfile
+                for outputfile in self._ledger.finished(tasks)
+                if os.path.exists(outputfile)
+            )
+        if self.skip_existing:
+            existing = era5cli.utils.existing_files(
+                [task[-1] for task in tasks if task[-1] not in skipped]
+            )
+            skipped.update(
+                outputfile
+                for outputfile in existing
+                if self._inventory.lookup(outputfile) or _sync.is_valid(outputfile)
+            )
+        return skipped
+
+    def _check_outputfiles(self, outputfiles: list):
+        """Check that the output files do not exist yet (or may be overwritten)."""
         if not self.overwrite:
             era5cli.utils.assert_outputfiles_not_exist(outputfiles)
 
-        pool = Pool(nodes=self.threads) if self.threads else Pool()
-        pool.map(self._getdata, variables, years, outputfiles, months)
+    def _planned_outputs(self) -> list:
+        """List the output files of the requested file layout."""
+        outputs = []
+        for var in self.variables:
+            if self.split_levels and has_levels(self, var):
+                for level in self.pressure_levels:
+                    outputs += self._variable_outputs(var, level)
+            else:
+                outputs += self._variable_outputs(var)
+        return outputs
+
+    def _variable_outputs(self, var, level=None) -> list:
+        """List the output files of a variable (at a single pressure level)."""
+        levels = None if level is None else [level]
+        if self.start is not None:
+            return [
+                _planner.Output(
+                    var,
+                    self.years,
+                    self.months,
+                    self._define_outputfilename(var, self.years, level=level),
+                    levels,
+                )
+            ]
+        if self.splitmonths:
+            return [
+                _planner.Output(
+                    var,
+                    [year],
+                    [month],
+                    self._define_outputfilename(var, [year, year], month, level),
+                    levels,
+                )
+                for year, month in itertools.product(self.years, self.months)
+            ]
+        if not self.merge:
+            return [
+                _planner.Output(
+                    var,
+                    [year],
+                    self.months,
+                    self._define_outputfilename(var, [year], level=level),
+                    levels,
+                )
+                for year in self.years
+            ]
+        return [
+            _planner.Output(
+                var,
+                self.years,
+                self.months,
+                self._define_outputfilename(var, self.years, level=level),
+                levels,
+            )
+        ]
+
+    def _split_auto(self):
+        """Fetch variables in the largest requests allowed by the CDS.
+
+        With `autochunk`, requests cover as many years and months as allowed. With
+        `pack_variables`, variables of the same dataset are requested together.
+        Otherwise, merged outputs are requested per year, in parallel. The results
+        are split or concatenated locally into the output files. With `sync`, only
+        the output files that are missing are fetched, and the time steps missing
+        from incomplete netCDF files are added to them.
+        Splitting results is only supported for netCDF files.
+        """
+        outputs = self._planned_outputs()
+        skipped = self._skipped_outputs(
+            [(*self._output_request(out), out.filename) for out in outputs]
+        )
+        outputs = [out for out in outputs if out.filename not in skipped]
+        fills = []
+        if self.sync:
+            outputs, fills = _sync.plan_missing(self, outputs)
+        else:
+            self._check_outputfiles([out.filename for out in outputs])
+
+        if self.start is not None:
+            jobs = _planner.plan_range(self, outputs)
+        else:
+            jobs = _planner.plan(
+                self,
+                outputs,
+                pack=self.autochunk and self.ext == "nc",
+                pack_variables=self.pack_variables and self.ext == "nc",
+                per_year=self.merge,
+            )
+        jobs += fills
+        if self.tiles is not None and self.ext == "nc":
+            jobs = self._tile(jobs)
+        job_tasks = [
+            [
+                (*self._chunk_request(job, chunk), target)
+                for chunk, target in zip(job.chunks, job.targets)
+            ]
+            for job in jobs
+        ]
+        if self.dryrun:
+            for job, tasks in zip(jobs, job_tasks):
+                self._dryrun(tasks)
+                if not job.direct and self._planned is None:
+                    if job.fill:
+                        how = "added"
+                    elif job.n_tiles > 1:
+                        how = "stitched"
+                    elif job.level_groups:
+                        how = "merged"
+                    elif len(job.chunks) > 1:
+                        how = "concatenated"
+                    else:
+                        how = "split"
+                    files = ", ".join(out.filename for out in job.outputs)
+                    print(f"  {how} into: {files}")
+            return
+
+        all_tasks = [task for tasks in job_tasks for task in tasks]
+        self._intermediate = {
+            target for job in jobs if not job.direct for target in job.targets
+        }
+        failures = self._retrieve_all(all_tasks)
+        failed = {failure.task[-1] for failure in failures}
+        for job, tasks in zip(jobs, job_tasks):
+            if job.direct:
+                continue
+            if failed.intersection(job.targets):
+                # The outputs are incomplete without all requests of the job.
+                for target in job.targets:
+                    if os.path.exists(target):
+                        os.remove(target)
+                _deferred.keep_books(self._inventory.forget, job.targets)
+            else:
+                self._assemble(job, tasks)
+        _retry.summarize(failures, len(all_tasks))
+
+    def _chunk_request(self, job: _planner.Job, chunk: _planner.Chunk):
+        """Build the request for a chunk of a job."""
+        return self._build_request(
+            job.variables,
+            chunk.years,
+            chunk.months,
+            chunk.days,
+            chunk.hours,
+            chunk.levels,
+            chunk.area,
+        )
+
+    def _tile(self, jobs: list) -> list:
+        """Split the area of every request into tiles, to be downloaded in parallel
+        and stitched together locally."""
+        requests = [self._chunk_request(job, job.chunks[0]) for job in jobs]
+        n_tiles = self.tiles
+        if n_tiles == "auto":
+            n_tiles = _estimate.best_tiles(
+                self,
+                [
+                    self._chunk_request(job, chunk)
+                    for job in jobs
+                    for chunk in job.chunks
+                ],
+            )
+        area = self._parse_area()
+        return [
+            _planner.tile(
+                job, _planner.tile_area(area, _estimate.request_grid(*request), n_tiles)
+            )
+            for job, request in zip(jobs, requests)
+        ]
+
+    def _stitch(self, job: _planner.Job, history: str) -> _planner.Job:
+        """Stitch the downloaded tiles of every request of a job together.
+
+        Returns:
+            The job of the stitched results, which are the outputs themselves if the
+            job has a single request and output.
+        """
+        untiled = job.untiled()
+        tiles = job.targets
+        n_tiles = job.n_tiles
+        for i, target in enumerate(untiled.targets):
+            _postprocess.stitch(
+                tiles[i * n_tiles : (i + 1) * n_tiles],
+                target,
+                history if untiled.direct else None,
+            )
+        for tile in tiles:
+            os.remove(tile)
+        _deferred.keep_books(self._inventory.forget, tiles)
+        return untiled
+
+    def _assemble(self, job: _planner.Job, tasks: list):
+        """Split, concatenate or stitch the downloaded results of a job into its
+        outputs.
+
+        The history of all requests is written when the outputs are created, so that
+        their headers never have to be rewritten afterwards.
+        """
+        history = "\n".join(
+            era5cli.utils.history_line(name, request)
+            for name, request, _ in reversed(tasks)
+        )
+        if job.n_tiles > 1:
+            job = self._stitch(job, history)
+            if job.direct:
+                self._record_outputs(job.outputs)
+                return
+        targets = job.targets
+        if job.level_groups:
+            combine = _postprocess.merge_levels
+        else:
+            combine = _postprocess.concatenate
+        if job.fill:
+            self._fill(job.outputs[0].filename, targets, history)
+        elif len(job.variables) > 1 and len(job.chunks) > 1:
+            # Split every request into a file per variable, then concatenate those.
+            pieces = {out.filename: [] for out in job.outputs}
+            for i, target in enumerate(targets):
+                split = {
+                    _planner.temporary_filename(out.filename, i, "split"): (
+                        out.variable,
+                        out.years,
+                        out.months,
+                    )
+                    for out in job.outputs
+                }
+                _postprocess.split_by_variable(target, split)
+                for piece, out in zip(split, job.outputs):
+                    pieces[out.filename].append(piece)
+            for outputfile, files in pieces.items():
+                combine(files, outputfile, history)
+            targets += [piece for files in pieces.values() for piece in files]
+        elif len(job.variables) > 1:
+            _postprocess.split_by_variable(
+                targets[0],
+                {
+                    out.filename: (out.variable, out.years, out.months)
+                    for out in job.outputs
+                },
+                history,
+            )
+        elif len(job.chunks) > 1:
+            combine(targets, job.outputs[0].filename, history)
+        else:
+            _postprocess.split_by_period(
+                targets[0],
+                {out.filename: (out.years, out.months) for out in job.outputs},
+                history,
+            )
+
+        self._record_outputs(job.outputs)
+        for target in targets:
+            os.remove(target)
+        _deferred.keep_books(self._inventory.forget, targets)
+
+    def _fill(self, outputfile: str, targets: list, history: str):
+        """Merge the downloaded time steps into an existing output file."""
+        _postprocess.merge_steps([outputfile] + targets, outputfile, history)
+
+    def _output_request(self, out: _planner.Output):
+        """The request of the data that an output file holds."""
+        months = days = hours = None
+        if self.start is not None:
+            months, days, hours = _planner.range_selection(self)
+        return self._build_request(
+            out.variable,
+            out.years,
+            out.months if months is None else months,
+            days,
+            hours,
+            levels=out.levels,
+        )
+
+    def _record_outputs(self, outputs: list):
+        """Record the assembled output files in the inventory and the ledger."""
+        for out in outputs:
+            name, request = self._output_request(out)
+            _deferred.keep_books(self._inventory.record, out.filename, name, request)
+            _deferred.keep_books(
+                self._ledger.output_finished, (name, request, out.filename)
+            )
+
+    def _run(self, variables, years, outputfiles, months=None):
+        """Fetch the requests for all variables, years and months."""
+        if months is None:
+            months = len(variables) * [None]
+
+        tasks = [
+            (*self._build_request(var, yrs, mnth), outputfile)
+            for var, yrs, outputfile, mnth in zip(variables, years, outputfiles, months)
+        ]
+        skipped = self._skipped_outputs(tasks)
+        tasks = [task for task in tasks if task[-1] not in skipped]
+        self._check_outputfiles([task[-1] for task in tasks])
+        if len(tasks) < len(outputfiles) and not self.dryrun:
+            print(f"Skipping {len(outputfiles) - len(tasks)} finished file(s).")
+        _retry.summarize(self._retrieve_all(tasks), len(tasks))
+
+    def _retrieve_all(self, tasks: list) -> list:
+        """Retrieve all tasks, either in a thread pool or asynchronously.
+
+        All requests are built (and validated) before connecting to the CDS, so that
+        planning never needs a network connection. Dry runs only print the requests.
+
+        Every task is retried on transient errors, and a failing task does not stop
+        the other tasks.
+
+        Parameters
+        ----------
+        tasks: list(tuple)
+            List of (name, request, outputfile) tuples.
+
+        Returns
+        -------
+        list(_retry.Failure)
+            The tasks that failed.
+        """
+        if self.dryrun:
+            self._dryrun(tasks)
+            return []
+        if not tasks:
+            return []  # Nothing to fetch, no need to log in.
+
+        self._stage = _deferred.DeferredStage()
+        failures = []
+        try:
+            failures = self._retrieve_remaining(tasks)
+        finally:
+            failures += self._stage.wait()
+            self._stage = None
+
+        for failure in failures:
+            _deferred.keep_books(self._ledger.failed, failure.task, failure.error)
+        return failures
+
+    def _retrieve_remaining(self, tasks: list) -> list:
+        """Retrieve the tasks that are not cached, and return the failed ones."""
+        if self._cache is not None:
+            tasks = self._from_cache(tasks)
+            if not tasks:
+                return []  # Everything was cached, no need to log in.
+
+        self._get_login()  # Get login info from config file.
+
+        if self.asynchronous:
+            connection = self._clients.client(
+                self.url, self.key, wait_until_complete=False
+            )
+            failures = _jobs.run_async(
+                connection,
+                tasks,
+                self._download,
+                threads=self.threads,
+                controller=self.controller,
+                ledger=self._ledger,
+                resume=self.resume,
+            )
+        elif self.controller is not None:
+            failures = _concurrency.run_adaptive(tasks, self._getdata, self.controller)
+        else:
+            pool = Pool(nodes=self.threads) if self.threads else Pool()
+            results = pool.map(
+                functools.partial(_retry.call, self._getdata), *zip(*tasks)
+            )
+            failures = [failure for failure in results if failure is not None]
+        return failures
+
+    def _from_cache(self, tasks: list) -> list:
+        """Fill the output files of cached requests, and return the other tasks."""
+        remaining = []
+        for name, request, outputfile in tasks:
+            if self._cache.get(name, request, outputfile):
+                self._defer(name, request, outputfile)
+            else:
+                remaining.append((name, request, outputfile))
+        if len(remaining) < len(tasks):
+            print(f"Reused {len(tasks) - len(remaining)} cached result(s).")
+        return remaining
+
+    def _finalize(self, name: str, request: dict, outputfile: str):
+        """Cache a downloaded result, and have it stamped and recorded."""
+        if self._cache is not None:
+            _deferred.keep_books(self._cache.put, name, request, outputfile)
+        self._defer(name, request, outputfile)
+
+    def _defer(self, name: str, request: dict, outputfile: str):
+        """Finish a file in the background stage, so that the download thread can
+        continue with the next request."""
+        if self._stage is None:
+            self._finish(name, request, outputfile)
+        else:
+            task = (name, request, outputfile)
+            self._stage.submit(task, self._finish, *task)
+
+    def _finish(self, name: str, request: dict, outputfile: str):
+        """Stamp and record a file; it only counts as completed afterwards.
+
+        Intermediate files are not stamped: their outputs get the history when they
+        are created.
+        """
+        if outputfile not in self._intermediate:
+            era5cli.utils.append_history(name, request, outputfile)
+            _deferred.keep_books(self._inventory.record, outputfile, name, request)
+        _deferred.keep_books(self._ledger.completed, (name, request, outputfile))
 
     def _product_type(self):
         """Construct the product type name from the options."""
@@ -360,32 +1044,42 @@ class Fetch:
                 "Requested 3D variable(s), but no pressure levels specified."
                 "Aborting."
             )
-        if not all(level in ref.PLEVELS for level in self.pressure_levels):
+        if not all(level in CATALOG.levels for level in self.pressure_levels):
             raise ValueError(
                 f"Invalid pressure levels. Allowed values are: {ref.PLEVELS}"
             )
 
     def _check_variable(self, variable):
         """Check variable available and compatible with other inputs."""
+        info = CATALOG.get(variable)
         # if land then the variable must be in era5 land
         if self.land:
-            if variable not in ref.ERA5_LAND_VARS:
+            if info is None or not info.is_land:
                 raise ValueError(
                     f"Variable {variable} is not available in ERA5-Land.\n"
                     f"Choose from {ref.ERA5_LAND_VARS}"
                 )
-        elif variable in ref.PLVARS + ref.SLVARS:
-            if self.period == "monthly" and variable in ref.MISSING_MONTHLY_VARS:
-                header = (
-                    "There is no monthly data available for the "
-                    "following variables:\n"
-                )
-                raise ValueError(
-                    era5cli.utils.print_multicolumn(header, ref.MISSING_MONTHLY_VARS)
-                )
-        else:
+        elif info is None or not (info.is_pressure_level or info.is_single_level):
             raise ValueError(f"Invalid variable name: {variable}")
 
+        dataset = CATALOG.dataset(
+            variable,
+            land=self.land,
+            surface=self.pressure_levels == ["surface"],
+            monthly=self.period == "monthly",
+        )
+        if dataset.level_type in info.level_types and dataset not in info.datasets:
+            header = (
+                f"There is no {self.period} data available for the "
+                "following variables:\n"
+            )
+            missing = (
+                ref.MISSING_MONTHLY_VARS
+                if self.period == "monthly"
+                else ref.MISSING_HOURLY_VARS
+            )
+            raise ValueError(era5cli.utils.print_multicolumn(header, missing))
+
     def _check_area(self):
         """Confirm that area parameters are correct."""
         (lat_max, lon_min, lat_min, lon_max) = self.area
@@ -414,10 +1108,9 @@ class Fetch:
     def _build_name(self, variable):
         """Build up name of dataset to use"""
 
-        name = "reanalysis-era5"
-
+        info = CATALOG.get(variable)
         # report to user in case of ambiguous vars
-        if (variable in ref.PLVARS) and (variable in ref.SLVARS):
+        if info is not None and info.is_pressure_level and info.is_single_level:
             instruction_pressure = (
                 "Getting variable from pressure level data. To get the "
                 "surface variable instead, add `--levels surface` or "
@@ -436,40 +1129,57 @@ class Fetch:
                 f"The variable name '{variable}' is ambiguous. {instruction}"
             )
 
-        if self.land:
-            name += "-land"
-        elif self.pressure_levels == ["surface"]:
-            name += "-single-levels"
-        elif variable in ref.PLVARS:
-            name += "-pressure-levels"
-        elif variable in ref.SLVARS:
-            name += "-single-levels"
-        else:
+        dataset = CATALOG.dataset(
+            variable,
+            land=self.land,
+            surface=self.pressure_levels == ["surface"],
+            monthly=self.period == "monthly",
+        )
+        if dataset is None:
             raise ValueError(f"Invalid variable name: {variable}")
+        return dataset.name, variable
 
-        if self.period == "monthly":
-            name += "-monthly-means"
-
-        return name, variable
-
-    def _build_request(self, variable, years, months=None):
-        """Build the download request for the retrieve method of cdsapi."""
-        self._check_variable(variable)
+    def _build_request(
+        self,
+        variable,
+        years,
+        months=None,
+        days=None,
+        hours=None,
+        levels=None,
+        area=None,
+    ):
+        """Build the download request for the retrieve method of cdsapi.
 
-        name, variable = self._build_name(variable)
+        `variable` can also be a list of variables of the same dataset. `months`,
+        `days`, `hours`, (pressure) `levels` and `area` default to those of the fetch.
+        """
+        if isinstance(variable, list) and len(variable) == 1:
+            variable = variable[0]
+        if isinstance(variable, list):
+            for var in variable:
+                self._check_variable(var)
+            name, _ = self._build_name(variable[0])
+        else:
+            self._check_variable(variable)
+            name, variable = self._build_name(variable)
 
         request = {
             "variable": variable,
             "year": years,
             "month": self.months if months is None else months,
-            "time": self.hours,
+            "time": self.hours if hours is None else hours,
             "format": self.outputformat,
         }
 
         if "pressure-levels" in name:
-            request["pressure_level"] = self.pressure_levels
+            request["pressure_level"] = (
+                self.pressure_levels if levels is None else levels
+            )
 
-        if self.area:
+        if area is not None:
+            request["area"] = area
+        elif self.area:
             request["area"] = self._parse_area()
 
         product_type = self._product_type()
@@ -477,34 +1187,61 @@ class Fetch:
             request["product_type"] = product_type
 
         if self.period == "hourly":
-            request["day"] = self.days
+            request["day"] = self.days if days is None else days
 
         return (name, request)
 
     def _exit(self):
         pass
 
-    def _getdata(self, variables: list, years: list, outputfile: str, months=None):
+    def _getdata(self, name: str, request: dict, outputfile: str):
         """Fetch variables using cds api call."""
-        name, request = self._build_request(variables, years, months)
-
-        if self.dryrun:
-            print(name, request, outputfile)
-        else:
-            queueing_message = (
-                os.linesep,
-                "Download request is being queued at Copernicus.",
-                os.linesep,
-                "It can take some time before downloading starts, ",
-                "please do not kill this process in the meantime.",
-                os.linesep,
-            )
-            connection = cdsapi.Client(
-                url=self.url,
-                key=self.key,
-                verify=True,
-                progress=sys.stdin.isatty(),  # only show progress in interactive sesh.
-            )
-            print("".join(queueing_message))  # print queueing message
-            connection.retrieve(name, request, outputfile)
-            era5cli.utils.append_history(name, request, outputfile)
+        queueing_message = (
+            os.linesep,
+            "Download request is being queued at Copernicus.",
+            os.linesep,
+            "It can take some time before downloading starts, ",
+            "please do not kill this process in the meantime.",
+            os.linesep,
+        )
+        connection = self._clients.client(self.url, self.key)
+        print("".join(queueing_message))  # print queueing message
+        _deferred.keep_books(self._ledger.submitted, (name, request, outputfile), None)
+        result = connection.retrieve(name, request)
+        self._fetch_result(result, name, request, outputfile)
+
+    def _download(self, remote, name: str, request: dict, outputfile: str):
+        """Download the result of a completed asynchronous request."""
+        results = remote.get_results()
+        self._fetch_result(results, name, request, outputfile)
+
+    def _fetch_result(self, result, name: str, request: dict, outputfile: str):
+        """Download a completed result, retrying only the download itself: the
+        request is not submitted to the CDS again if the download keeps failing."""
+        fetch = functools.partial(self._fetch_once, result)
+        failure = _retry.call(fetch, name, request, outputfile)
+        if failure is not None:
+            raise _retry.GaveUpError(failure)
+        self._finalize(name, request, outputfile)
+
+    def _fetch_once(self, result, name: str, request: dict, outputfile: str):
+        _download.fetch_result(
+            result,
+            outputfile,
+            self._clients.session(),
+            self.segments,
+            # Only show progress in interactive sessions, like the cdsapi client.
+            progress=sys.stdin.isatty(),
+        )
+
+
+def _as_datetime(value, hour: int) -> datetime.datetime:
+    """Convert a date (at `hour`), datetime or ISO 8601 string to a datetime."""
+    if isinstance(value, str):
+        parsed = datetime.datetime.fromisoformat(value)
+        if "T" not in value and " " not in value:
+            parsed = parsed.replace(hour=hour)
+        return parsed
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime(value.year, value.month, value.day, hour)
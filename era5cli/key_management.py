@@ -1,15 +1,21 @@
+import hashlib
+import json
 import os
 import sys
+import time
 from pathlib import Path
 from typing import Tuple
-import cdsapi
-from requests.exceptions import ConnectionError  # pylint: disable=redefined-builtin
 
 
 ERA5CLI_CONFIG_PATH = Path.home() / ".config" / "era5cli" / "cds_key.txt"
 CDSAPI_CONFIG_PATH = Path.home() / ".cdsapirc"
 DEFAULT_CDS_URL = "https://cds.climate.copernicus.eu/api"
 
+# A successful validation of the URL + key is cached for this many seconds, to avoid
+# a test request to the CDS on every invocation of era5cli.
+VALIDATION_TTL = 24 * 60 * 60
+VALIDATION_CACHE_FILENAME = "validated_logins.json"
+
 AUTH_ERR_MSG = "401"
 NO_DATA_ERR_MSG = "There is no data matching your request"
 
@@ -22,12 +28,14 @@ class InvalidLoginError(Exception):
     "Raised when an invalid login is provided to the cds server."
 
 
-def attempt_cds_login(url: str, key: str) -> True:
+def attempt_cds_login(url: str, key: str, session=None) -> True:
     """Attempt to connect to the CDS, to validate the URL and UID + key.
 
     Args:
         url: URL to the CDS API.
         key: Combination of your UID and key, separated with a colon.
+        session: (optional) requests session to use for connecting to the CDS, so
+            the connection can be reused afterwards.
 
     Raises:
         ConnectionError: If no connection to the CDS could be made.
@@ -35,7 +43,12 @@ def attempt_cds_login(url: str, key: str) -> True:
         InvalidRequestError: If the test request failed, likely due to changes in the
             CDS API's variable naming.
     """
-    client = cdsapi.Client(key=key, url=url, verify=True)
+    # cdsapi and requests are only imported when needed, for a fast start up.
+    import cdsapi
+    import requests
+
+    kwargs = {} if session is None else {"session": session}
+    client = cdsapi.Client(key=key, url=url, verify=True, **kwargs)
     try:
         # Check the URL
         client.status()  # pragma: no cover
@@ -52,8 +65,8 @@ def attempt_cds_login(url: str, key: str) -> True:
             },
         )
         return True
-    except ConnectionError as err:
-        raise ConnectionError(
+    except requests.ConnectionError as err:
+        raise requests.ConnectionError(
             f"{os.linesep}Failed to connect to CDS. Please check your internet "
             "connection and/or the"
             f" URL in the era5cli configuration: {ERA5CLI_CONFIG_PATH.resolve()}"
@@ -85,6 +98,7 @@ def set_config(
     try:
         attempt_cds_login(url, key)
         write_era5cli_config(url, key)
+        store_validated_login(url, key)
         print(
             f"Keys succesfully validated and stored in {ERA5CLI_CONFIG_PATH.resolve()}"
         )
@@ -94,16 +108,26 @@ def set_config(
     return False
 
 
-def check_era5cli_config() -> None:
+def check_era5cli_config(session=None, revalidate: bool = False) -> None:
     """Validate if the era5cli config exists, and can connect to the CDS.
 
     If no era5cli config file exists, but a CDS api file exists in the default location,
     This routine will attempt to use those keys, and ask the user if they want to use
     these.
+
+    A successful validation is cached for VALIDATION_TTL seconds. Within that time the
+    CDS is not contacted again, unless `revalidate` is True.
+
+    Args:
+        session: (optional) requests session to use for connecting to the CDS.
+        revalidate: Always validate the keys with the CDS, even if a recent
+            successful validation is cached.
     """
     if ERA5CLI_CONFIG_PATH.exists():
         url, fullkey = load_era5cli_config()
-        attempt_cds_login(url, fullkey)
+        if revalidate or not login_recently_validated(url, fullkey):
+            attempt_cds_login(url, fullkey, session=session)
+            store_validated_login(url, fullkey)
     else:
         print("era5cli configuration file not found. Looking for CDSAPI key.")
         if not valid_cdsapi_config():
@@ -113,12 +137,63 @@ def check_era5cli_config() -> None:
             )
 
 
+def _validation_cache_path() -> Path:
+    return ERA5CLI_CONFIG_PATH.parent / VALIDATION_CACHE_FILENAME
+
+
+def _login_hash(url: str, key: str) -> str:
+    """Hash the URL + key, so the key itself is not stored in the validation cache."""
+    return hashlib.sha256(f"{url}\n{key}".encode("utf-8")).hexdigest()
+
+
+def _load_validation_cache() -> dict:
+    try:
+        with open(_validation_cache_path(), encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def login_recently_validated(url: str, key: str) -> bool:
+    """Check if the URL + key were successfully validated within VALIDATION_TTL."""
+    validated_at = _load_validation_cache().get(_login_hash(url, key))
+    if not isinstance(validated_at, (int, float)):
+        return False
+    return 0 <= time.time() - validated_at < VALIDATION_TTL
+
+
+def store_validated_login(url: str, key: str) -> None:
+    """Store the time of a successful validation of the URL + key.
+
+    Expired entries are dropped from the cache file while writing.
+    """
+    now = time.time()
+    cache = {
+        keyhash: validated_at
+        for keyhash, validated_at in _load_validation_cache().items()
+        if isinstance(validated_at, (int, float))
+        and now - validated_at < VALIDATION_TTL
+    }
+    cache[_login_hash(url, key)] = now
+
+    path = _validation_cache_path()
+    try:
+        path.parent.mkdir(exist_ok=True, parents=True)
+        with open(path, mode="w", encoding="utf-8") as f:
+            json.dump(cache, f)
+    except OSError:
+        pass  # Caching is an optimization only. The keys will be validated next run.
+
+
 def valid_cdsapi_config() -> bool:
     """Validate the default cdsapirc file. Promts the user for using these for era5cli.
 
     Returns:
         True if a valid key has been found & written to file. Otherwise False.
     """
+    import requests
+
     if CDSAPI_CONFIG_PATH.exists():
         url, key = load_cdsapi_config()
         try:
@@ -130,7 +205,7 @@ def valid_cdsapi_config() -> bool:
                 if userinput.lower() in ["y", "yes", ""]:
                     set_config(url, key)
                     return True
-        except (ConnectionError, InvalidLoginError, InvalidRequestError):
+        except (requests.ConnectionError, InvalidLoginError, InvalidRequestError):
             return False
     return False
 
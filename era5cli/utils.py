@@ -1,13 +1,14 @@
 """Utility functions."""
 
 import datetime
+import os
 import shutil
 import sys
 import textwrap
 from pathlib import Path
+from typing import Dict
 from typing import List
-import prettytable
-from netCDF4 import Dataset
+from typing import Set
 import era5cli
 from era5cli.__version__ import __version__ as era5cliversion
 
@@ -123,6 +124,8 @@ def print_multicolumn(header: str, info: list):
     info: list()
         Data to be printed.
     """
+    import prettytable
+
     # get size of terminal window
     columns, _ = shutil.get_terminal_size(fallback=(80, 24))
     # maximum width of string in list
@@ -147,6 +150,22 @@ def print_multicolumn(header: str, info: list):
     print(table)
 
 
+def history_line(name, request) -> str:
+    """Describe a download by era5cli, for the history of a netCDF file.
+
+    Parameters
+    ----------
+    name: str
+        Name of the CDS dataset.
+    request: dict
+        The request sent to the CDS.
+    """
+    dtime = datetime.datetime.now(tz=datetime.timezone.utc).strftime(
+        "%Y-%m-%d %H:%M:%S %Z"
+    )
+    return f"{dtime} by {era5cli.__name__} {era5cliversion}: {name} {request}"
+
+
 def append_history(name, request, fname):
     """Append era5cli version information.
 
@@ -155,13 +174,9 @@ def append_history(name, request, fname):
     fname: str
         Filename.
     """
-    dtime = datetime.datetime.now(tz=datetime.timezone.utc).strftime(
-        "%Y-%m-%d %H:%M:%S %Z"
-    )
-    appendtxt = f"{dtime} by {era5cli.__name__} {era5cliversion}: {name} {request}"
     extension = Path(fname).suffix
     if extension == ".nc":
-        _append_netcdf_history(fname, appendtxt)
+        _append_netcdf_history(fname, history_line(name, request))
 
 
 def _append_netcdf_history(ncfile: str, appendtxt: str):
@@ -174,6 +189,8 @@ def _append_netcdf_history(ncfile: str, appendtxt: str):
     appendtxt: str
         Text to append to history of netCDF file.
     """
+    from netCDF4 import Dataset
+
     # open netCDF file rw and append to history
     ncfile = Dataset(ncfile, "r+")
     try:
@@ -209,9 +226,53 @@ def strtobool(value: str) -> bool:
     )
 
 
+def existing_files(files: List[str]) -> Set[str]:
+    """Return the files that exist.
+
+    Gives the same result as `Path(file).exists()` for every file, but lists every
+    directory once (`os.scandir`) instead of calling `stat` for every file. On
+    parallel and network file systems, this is much faster for many files.
+
+    Parameters
+    ----------
+    files: list(str)
+        Paths of the files to check.
+
+    Returns
+    -------
+    set(str)
+        The paths (as given) of the files that exist.
+    """
+    by_directory: Dict[str, List[str]] = {}
+    for file in files:
+        by_directory.setdefault(os.path.dirname(file) or os.curdir, []).append(file)
+
+    existing = set()
+    for directory, dir_files in by_directory.items():
+        try:
+            with os.scandir(directory) as entries:
+                listed = {os.path.normcase(entry.name): entry for entry in entries}
+        except (FileNotFoundError, NotADirectoryError):
+            continue  # None of its files can exist.
+        except OSError:  # e.g. a directory that can not be listed.
+            existing.update(file for file in dir_files if Path(file).exists())
+            continue
+
+        for file in dir_files:
+            name = os.path.basename(file)
+            entry = listed.get(os.path.normcase(name))
+            if name in ("", os.curdir, os.pardir) or (entry and entry.is_symlink()):
+                # Not listed by scandir, or a link that may be broken.
+                if Path(file).exists():
+                    existing.add(file)
+            elif entry is not None:
+                existing.add(file)
+    return existing
+
+
 def assert_outputfiles_not_exist(outputfiles: List[str]) -> None:
     """Check if files already exist, and prompt the user if they do."""
-    if any(Path(file).exists() for file in outputfiles):
+    if existing_files(outputfiles):
         answer = "no"  # default answer for non-interactive sessions
         if sys.stdin.isatty():  # only ask for input if the user can reply.
             answer = input(
@@ -0,0 +1,20 @@
+"""Fixtures shared by all tests."""
+
+import unittest.mock as mock
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def ledger_path(tmp_path_factory):
+    """Keep the ledger of every test out of the user's configuration directory."""
+    path = tmp_path_factory.mktemp("config") / "jobs.sqlite"
+    with mock.patch("era5cli._ledger.ledger_path", return_value=path):
+        yield path
+
+
+@pytest.fixture(autouse=True)
+def inventory_path(tmp_path_factory):
+    """Keep the inventory of every test out of the user's configuration directory."""
+    path = tmp_path_factory.mktemp("config") / "inventory.sqlite"
+    with mock.patch("era5cli._inventory.inventory_path", return_value=path):
+        yield path
@@ -0,0 +1,134 @@
+"""Tests for the local cache of downloaded results."""
+
+import os
+import sqlite3
+import unittest.mock as mock
+import pytest
+from era5cli import _cache
+
+
+NAME = "reanalysis-era5-single-levels"
+REQUEST = {
+    "variable": "2m_temperature",
+    "year": [2008, 2009],
+    "month": ["02", "01"],
+    "area": [90, -180, -90, 180],
+}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return _cache.ResultCache(tmp_path / "cache", max_size=1e-6)  # 1000 bytes
+
+
+def write(path, nbytes):
+    path.write_bytes(b"x" * nbytes)
+    return path
+
+
+def test_default_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("ERA5CLI_CACHE_DIR", str(tmp_path / "a"))
+    assert _cache.default_cache_dir() == tmp_path / "a"
+    monkeypatch.delenv("ERA5CLI_CACHE_DIR")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "b"))
+    assert _cache.default_cache_dir() == tmp_path / "b" / "era5cli"
+
+
+def test_cache_key():
+    equivalent = {
+        "month": ["01", "02"],
+        "year": ["2009", "2008"],
+        "area": [90, -180, -90, 180],
+        "variable": ["2m_temperature"],
+    }
+    assert _cache.cache_key(NAME, REQUEST) == _cache.cache_key(NAME, equivalent)
+
+    flipped = dict(REQUEST, area=[-90, -180, 90, 180])
+    assert _cache.cache_key(NAME, REQUEST) != _cache.cache_key(NAME, flipped)
+    assert _cache.cache_key(NAME, REQUEST) != _cache.cache_key("other", REQUEST)
+
+
+def test_materialize(tmp_path):
+    source = write(tmp_path / "source", 10)
+    target = write(tmp_path / "target", 3)
+    _cache.materialize(source, target)
+
+    assert target.read_bytes() == source.read_bytes()
+    assert source.stat().st_ino != target.stat().st_ino
+    assert sorted(os.listdir(tmp_path)) == ["source", "target"]
+
+    # The files never share their data: modifying one leaves the other intact.
+    with open(target, "ab") as file:
+        file.write(b"y")
+    assert source.read_bytes() == b"x" * 10
+
+
+def test_round_trip(cache, tmp_path):
+    output = write(tmp_path / "a.grb", 100)
+    assert not cache.get(NAME, REQUEST, str(tmp_path / "b.grb"))
+
+    cache.put(NAME, REQUEST, str(output))
+    assert cache.get(NAME, REQUEST, str(tmp_path / "b.grb"))
+    assert (tmp_path / "b.grb").read_bytes() == output.read_bytes()
+
+
+@pytest.mark.parametrize(
+    "target, error",
+    [
+        ("era5cli._cache.materialize", FileNotFoundError("Evicted")),
+        ("era5cli._cache.materialize", OSError(28, "No space left on device")),
+        ("era5cli._cache.sqlite3.connect", sqlite3.OperationalError("locked")),
+    ],
+)
+def test_unusable(cache, tmp_path, caplog, target, error):
+    """Test that a cached result that can not be used counts as a miss."""
+    cache.put(NAME, REQUEST, str(write(tmp_path / "a.nc", 100)))
+    cache.close()
+    with mock.patch(target, side_effect=error):
+        assert not cache.get(NAME, REQUEST, str(tmp_path / "b.nc"))
+    assert "Cached result for" in caplog.text
+    assert not (tmp_path / "b.nc").exists()
+
+
+def test_too_large(cache, tmp_path):
+    output = write(tmp_path / "a.nc", 2000)
+    cache.put(NAME, REQUEST, str(output))
+    assert not cache.get(NAME, REQUEST, str(tmp_path / "b.nc"))
+
+
+def test_evicts_least_recently_used(cache, tmp_path):
+    requests = [dict(REQUEST, year=year) for year in range(2000, 2003)]
+    for i, request in enumerate(requests[:2]):
+        output = write(tmp_path / f"{i}.nc", 400)
+        with mock.patch("era5cli._cache.time.time", return_value=i):
+            cache.put(NAME, request, str(output))
+
+    # Using the oldest entry makes the other one the least recently used.
+    with mock.patch("era5cli._cache.time.time", return_value=2):
+        assert cache.get(NAME, requests[0], str(tmp_path / "x.nc"))
+    with mock.patch("era5cli._cache.time.time", return_value=3):
+        cache.put(NAME, requests[2], str(write(tmp_path / "2.nc", 400)))
+
+    assert cache._path(NAME, requests[0]).exists()
+    assert not cache._path(NAME, requests[1]).exists()
+    assert cache._path(NAME, requests[2]).exists()
+
+
+def test_put_keeps_total(cache, tmp_path):
+    """The total size is kept in the index, instead of listing the cache."""
+    with mock.patch("pathlib.Path.glob") as glob:
+        cache.put(NAME, REQUEST, str(write(tmp_path / "a.nc", 400)))
+        cache.put(NAME, REQUEST, str(write(tmp_path / "a.nc", 300)))
+        cache.put(NAME, dict(REQUEST, year=2000), str(write(tmp_path / "b.nc", 200)))
+    glob.assert_called_once()  # Only to index the (empty) new cache.
+    assert cache._connect().execute("SELECT bytes FROM total").fetchone() == (500,)
+
+
+def test_rebuilds_index(cache, tmp_path):
+    cache.put(NAME, REQUEST, str(write(tmp_path / "a.nc", 400)))
+    cache.close()
+    (cache.directory / _cache.INDEX_FILENAME).unlink()
+
+    cache.put(NAME, dict(REQUEST, year=2000), str(write(tmp_path / "b.nc", 700)))
+    assert not cache._path(NAME, REQUEST).exists()
+    assert cache.get(NAME, dict(REQUEST, year=2000), str(tmp_path / "c.nc"))
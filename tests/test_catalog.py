@@ -0,0 +1,45 @@
+"""Tests for the index of ERA5 variables and datasets."""
+
+import era5cli.inputref as ref
+from era5cli._catalog import CATALOG
+from era5cli._catalog import LAND
+from era5cli._catalog import PRESSURE
+from era5cli._catalog import SINGLE
+
+
+def test_all_variables():
+    for variables in [ref.SLVARS, ref.PLVARS, ref.ERA5_LAND_VARS]:
+        assert all(variable in CATALOG for variable in variables)
+    assert "invalid_precipitation" not in CATALOG
+    assert CATALOG.get("invalid_precipitation") is None
+    assert 1000 in CATALOG.levels
+
+
+def test_metadata():
+    geopotential = CATALOG.get("geopotential")
+    assert geopotential.level_types == {SINGLE, PRESSURE}
+    assert CATALOG.is_pressure_level("geopotential")
+    assert not CATALOG.is_pressure_level("total_precipitation")
+    assert CATALOG.get("total_precipitation").level_types == {SINGLE, LAND}
+
+    gust = CATALOG.get("10m_wind_gust_since_previous_post_processing")
+    assert gust.hourly and not gust.monthly
+    assert [dataset.name for dataset in gust.datasets] == [
+        "reanalysis-era5-single-levels"
+    ]
+
+
+def test_dataset():
+    def name(variable, land=False, surface=False, monthly=False):
+        return CATALOG.dataset(variable, land, surface, monthly).name
+
+    assert name("temperature") == "reanalysis-era5-pressure-levels"
+    assert name("geopotential", surface=True) == "reanalysis-era5-single-levels"
+    assert name("2m_temperature", monthly=True) == (
+        "reanalysis-era5-single-levels-monthly-means"
+    )
+    assert name("2m_temperature", land=True) == "reanalysis-era5-land"
+    assert CATALOG.dataset("invalid", False, False, False) is None
+
+    land = CATALOG.dataset("2m_temperature", True, False, False)
+    assert (land.grid, land.first_year) == (0.1, 1950)
@@ -1,5 +1,7 @@
 """Tests for era5cli utility functions."""
 
+import subprocess
+import sys
 import unittest.mock as mock
 import pytest
 import era5cli.args
@@ -192,6 +194,43 @@ def test_period_args():
         assert era5cli.args.periods.set_period_args(args)
 
 
+def test_date_range_args():
+    """Test the --start and --end arguments of a date range."""
+    argv = [
+        "hourly",
+        "--variables",
+        "2m_temperature",
+        "--start",
+        "2001-11-15",
+        "--end",
+        "2002-02-10T18:00",
+    ]
+    args = cli._parse_args(argv)
+    assert (args.start, args.end) == ("2001-11-15", "2002-02-10T18:00")
+    assert era5cli.args.common.construct_year_list(args) == [2001, 2002]
+
+    with pytest.raises(AssertionError, match="both --start and --end"):
+        era5cli.args.common.construct_year_list(cli._parse_args(argv[:-2]))
+    with pytest.raises(AssertionError, match="either --start and --end"):
+        era5cli.args.common.construct_year_list(
+            cli._parse_args(argv + ["--startyear", "2001"])
+        )
+    with pytest.raises(AssertionError, match="--startyear"):
+        era5cli.args.common.construct_year_list(cli._parse_args(argv[:3]))
+    with pytest.raises(SystemExit):
+        cli._parse_args(argv[:-1] + ["10-02-2002"])
+
+
+def test_tiles_argument():
+    argv = ["hourly", "--startyear", "2008", "--variables", "2m_temperature"]
+    assert cli._parse_args(argv).tiles is None
+    assert cli._parse_args(argv + ["--tiles", "4"]).tiles == 4
+    assert cli._parse_args(argv + ["--tiles", "auto"]).tiles == "auto"
+    for invalid in ["0", "many"]:
+        with pytest.raises(SystemExit):
+            cli._parse_args(argv + ["--tiles", invalid])
+
+
 def test_level_arguments():
     """Test if levels are parsed correctly"""
     argv = [
@@ -311,7 +350,8 @@ def test_config_parse():
 
 @mock.patch("era5cli.key_management.attempt_cds_login", return_value=True)
 @mock.patch("era5cli.key_management.write_era5cli_config")
-def test_config_write(mock_a, mock_b):
+@mock.patch("era5cli.key_management.store_validated_login")
+def test_config_write(mock_a, mock_b, mock_c):
     """Assuming the CDS login is valid, see if the write function is called"""
     args = cli._parse_args(config_args)
     cli._execute(args)
@@ -349,13 +389,38 @@ class TestConfigControlFlow:
         out, _ = capsys.readouterr()
         assert expected in out
 
+    @mock.patch("era5cli.key_management.check_era5cli_config")
+    def test_config_revalidate(self, check, capsys):
+        args = cli._parse_args(["config", "--revalidate"])
+        cli._execute(args)
+        check.assert_called_once_with(revalidate=True)
+        out, _ = capsys.readouterr()
+        assert "succesfully validated" in out
+
     @pytest.mark.parametrize(
         "input_args",
         [
             ["config", "--show", "--key", "abc-def"],
+            ["config", "--revalidate", "--key", "abc-def"],
+            ["config", "--revalidate", "--show"],
+            ["config"],
         ],
     )
     def test_config_inputerror(self, input_args):
         with pytest.raises(era5cli.args.config.InputError):
             args = cli._parse_args(input_args)
             cli._execute(args)
+
+
+# Packages that are only needed for downloading and processing files.
+HEAVY_MODULES = ["cdsapi", "requests", "pathos", "dill", "netCDF4", "numpy"]
+
+
+def test_lazy_imports():
+    """Test that `era5cli info`, `--help` etc. do not import heavy dependencies."""
+    script = "import sys, era5cli.cli; print(' '.join(sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    modules = result.stdout.split()
+    assert [module for module in HEAVY_MODULES if module in modules] == []
@@ -0,0 +1,73 @@
+"""Tests for the reusable CDS client pool."""
+
+import threading
+import unittest.mock as mock
+import pytest
+from era5cli._client_pool import ClientPool
+from era5cli._client_pool import new_session
+
+
+@pytest.fixture()
+def cds():
+    with mock.patch("cdsapi.Client", autospec=True) as _fixture:
+        _fixture.side_effect = lambda *args, **kwargs: mock.MagicMock()
+        yield _fixture
+
+
+def test_new_session():
+    session = new_session(maxsize=4)
+    adapter = session.get_adapter("https://cds.climate.copernicus.eu/api")
+    assert adapter._pool_maxsize == 4
+
+
+def test_client_reused(cds):
+    pool = ClientPool()
+    client = pool.client("url", "key")
+    assert pool.client("url", "key") is client
+    cds.assert_called_once()
+    assert cds.call_args.kwargs["session"] is pool.session()
+    assert cds.call_args.kwargs["verify"] is True
+
+
+def test_client_options(cds):
+    pool = ClientPool()
+    blocking = pool.client("url", "key")
+    nonblocking = pool.client("url", "key", wait_until_complete=False)
+    assert cds.call_count == 2
+    assert blocking is not nonblocking
+    # Both clients share the connections of this thread.
+    sessions = [call.kwargs["session"] for call in cds.call_args_list]
+    assert sessions[0] is sessions[1]
+
+
+def test_client_per_thread(cds):
+    pool = ClientPool()
+    clients = []
+    barrier = threading.Barrier(3)  # Keep all threads alive at the same time.
+
+    def worker():
+        clients.append(pool.client("url", "key"))
+        barrier.wait()
+        clients.append(pool.client("url", "key"))
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cds.call_count == 3
+    sessions = {id(call.kwargs["session"]) for call in cds.call_args_list}
+    assert len(sessions) == 3
+
+
+def test_close(cds):
+    pool = ClientPool()
+    session = pool.session()
+    pool.client("url", "key")
+    with mock.patch.object(session, "close") as close:
+        pool.close()
+        close.assert_called_once()
+    assert pool.session() is not session
+    pool.client("url", "key")
+    assert cds.call_count == 2
@@ -0,0 +1,139 @@
+"""Tests for the adaptive number of requests in flight."""
+
+import threading
+import unittest.mock as mock
+import pytest
+import requests
+from era5cli import _concurrency
+from era5cli._concurrency import ConcurrencyController
+
+
+TASKS = [
+    ("reanalysis-era5-single-levels", {"year": year}, f"{year}.nc")
+    for year in range(2000, 2010)
+]
+
+
+@pytest.fixture
+def clock():
+    """Control the time seen by the controller."""
+    with mock.patch("era5cli._concurrency.time.monotonic", return_value=0.0) as now:
+        yield now
+
+
+def rejection():
+    response = requests.Response()
+    response.status_code = 429
+    return requests.HTTPError("429 Client Error", response=response)
+
+
+def test_invalid_limits():
+    with pytest.raises(ValueError, match="Invalid thread limits"):
+        ConcurrencyController(floor=4, ceiling=2)
+    with pytest.raises(ValueError, match="Invalid thread limits"):
+        ConcurrencyController(floor=0, ceiling=2)
+
+
+def test_grows_to_ceiling(clock):
+    controller = ConcurrencyController(floor=1, ceiling=3)
+    assert controller.limit == 1
+
+    # Every round (of `limit` requests) with a higher throughput raises the limit.
+    for rounds in range(1, 6):
+        for _ in range(controller.limit):
+            clock.return_value += 1
+            controller.record_success(nbytes=rounds * 100)
+    assert controller.limit == 3
+
+
+def test_undo_without_throughput_gain(clock):
+    controller = ConcurrencyController(floor=1, ceiling=6)
+    clock.return_value = 10
+    controller.record_success(nbytes=1000)  # 100 B/s: raise to 2
+    assert controller.limit == 2
+
+    clock.return_value = 30
+    controller.record_success(nbytes=1000)
+    controller.record_success(nbytes=1000)  # Still 100 B/s: back to 1
+    assert controller.limit == 1
+
+
+def test_shrinks_on_rejection():
+    controller = ConcurrencyController(floor=2, ceiling=8)
+    controller.limit = 8
+    controller.record_rejection()
+    assert controller.limit == 4
+    controller.record_rejection()
+    controller.record_rejection()
+    assert controller.limit == 2  # Never below the floor.
+
+
+def test_shrinks_on_congestion(clock):
+    controller = ConcurrencyController(floor=1, ceiling=6)
+    controller.limit = 2
+    controller.record_success(nbytes=100, queue_time=100)
+    controller.record_success(nbytes=100, queue_time=100)
+    assert controller.limit == 3
+
+    # Queue times of all jobs have tripled: the CDS runs all it allows already.
+    for _ in range(3):
+        clock.return_value += 1
+        controller.record_success(nbytes=10_000, queue_time=300)
+    assert controller.limit == 2
+
+
+def test_run_adaptive_limits_in_flight():
+    controller = ConcurrencyController(floor=2, ceiling=2)
+    lock = threading.Lock()
+    in_flight = []
+    seen = []
+
+    def work(name, request, outputfile):
+        with lock:
+            in_flight.append(outputfile)
+            assert len(in_flight) <= 2
+        with lock:
+            in_flight.remove(outputfile)
+            seen.append(outputfile)
+
+    _concurrency.run_adaptive(TASKS, work, controller)
+    assert sorted(seen) == sorted(task[-1] for task in TASKS)
+
+
+@mock.patch("era5cli._concurrency.REJECTION_DELAY", 0)
+def test_run_adaptive_retries_rejections():
+    controller = ConcurrencyController(floor=1, ceiling=4)
+    controller.limit = 4
+    attempts = []
+
+    def work(name, request, outputfile):
+        attempts.append(outputfile)
+        if outputfile == "2003.nc" and attempts.count(outputfile) < 3:
+            raise rejection()
+
+    _concurrency.run_adaptive(TASKS, work, controller)
+    assert attempts.count("2003.nc") == 3
+    assert len(attempts) == len(TASKS) + 2
+
+
+@mock.patch("era5cli._concurrency.REJECTION_DELAY", 0)
+def test_run_adaptive_gives_up():
+    controller = ConcurrencyController(floor=1, ceiling=1)
+    work = mock.MagicMock(side_effect=rejection())
+    failures = _concurrency.run_adaptive(TASKS[:1], work, controller)
+    assert work.call_count == _concurrency.MAX_REJECTIONS + 1
+    assert [failure.task for failure in failures] == TASKS[:1]
+
+
+def test_run_adaptive_error():
+    """Test that a failing task does not stop the other tasks."""
+    controller = ConcurrencyController(floor=1, ceiling=1)
+
+    def work(name, request, outputfile):
+        if outputfile == "2004.nc":
+            raise RuntimeError("There is no data matching your request")
+
+    failures = _concurrency.run_adaptive(TASKS, work, controller)
+    assert len(failures) == 1
+    assert failures[0].task == TASKS[4]
+    assert failures[0].attempts == 1
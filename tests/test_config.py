@@ -62,6 +62,61 @@ class TestEra5CliConfig:
                 key_management.load_era5cli_config()
 
 
+class TestValidationCache:
+    """Test that successful validations are cached, and reused within the TTL."""
+
+    def test_cached_validation(self, valid_path_era5):
+        mp1 = patch("era5cli.key_management.ERA5CLI_CONFIG_PATH", valid_path_era5)
+        mp2 = patch("era5cli.key_management.attempt_cds_login", return_value=True)
+        with mp1, mp2 as login:
+            key_management.check_era5cli_config()
+            key_management.check_era5cli_config()
+            login.assert_called_once()
+
+            key_management.check_era5cli_config(revalidate=True)
+            assert login.call_count == 2
+
+    def test_key_not_stored(self, valid_path_era5):
+        with patch("era5cli.key_management.ERA5CLI_CONFIG_PATH", valid_path_era5):
+            key_management.store_validated_login("https://www.github.com/", "abc-def")
+            cachefile = key_management._validation_cache_path()
+            assert "abc-def" not in cachefile.read_text(encoding="utf-8")
+
+    def test_expired_validation(self, valid_path_era5):
+        url, key = "https://www.github.com/", "abc-def"
+        with patch("era5cli.key_management.ERA5CLI_CONFIG_PATH", valid_path_era5):
+            assert not key_management.login_recently_validated(url, key)
+            with patch("time.time", return_value=1e9):
+                key_management.store_validated_login(url, key)
+            ttl = key_management.VALIDATION_TTL
+            with patch("time.time", return_value=1e9 + ttl - 1):
+                assert key_management.login_recently_validated(url, key)
+                assert not key_management.login_recently_validated(url, "other")
+            with patch("time.time", return_value=1e9 + ttl + 1):
+                assert not key_management.login_recently_validated(url, key)
+
+    def test_failed_validation_not_cached(self, valid_path_era5):
+        mp1 = patch("era5cli.key_management.ERA5CLI_CONFIG_PATH", valid_path_era5)
+        mp2 = patch(
+            "era5cli.key_management.attempt_cds_login",
+            side_effect=key_management.InvalidLoginError,
+        )
+        with mp1, mp2:
+            with pytest.raises(key_management.InvalidLoginError):
+                key_management.check_era5cli_config()
+            assert not key_management.login_recently_validated(
+                "https://www.github.com/", "abc-def"
+            )
+
+    def test_corrupt_cache(self, valid_path_era5):
+        cachefile = valid_path_era5.parent / key_management.VALIDATION_CACHE_FILENAME
+        cachefile.write_text("{not json", encoding="utf-8")
+        with patch("era5cli.key_management.ERA5CLI_CONFIG_PATH", valid_path_era5):
+            assert not key_management.login_recently_validated("url", "key")
+            key_management.store_validated_login("url", "key")
+            assert key_management.login_recently_validated("url", "key")
+
+
 class TestConfigCdsrc:
     """Test the cases where a .cdsapirc file exists.
 
@@ -160,3 +215,9 @@ class TestAttemptCdsLogin:
         mp2 = patch("cdsapi.Client.retrieve")
         with mp1, mp2:
             assert key_management.attempt_cds_login(url="test", key="abc:def") is True
+
+    def test_session_reused(self):
+        session = object()
+        with patch("cdsapi.Client", autospec=True) as client:
+            key_management.attempt_cds_login(url="test", key="abc", session=session)
+            assert client.call_args.kwargs["session"] is session
@@ -0,0 +1,244 @@
+"""Tests for resumable downloads."""
+
+import io
+import json
+import os
+import unittest.mock as mock
+import pytest
+import requests
+from era5cli import _download
+from era5cli import _retry
+
+
+DATA = bytes(range(256)) * 40
+URL = "https://download.example/result.nc"
+
+
+class FakeServer:
+    """Serves DATA, optionally breaking the connection after `limit` bytes."""
+
+    def __init__(self, limit=None, ranges=True, etag='"v1"', if_range=True):
+        self.limit = limit
+        self.ranges = ranges
+        self.etag = etag
+        self.if_range = if_range
+        self.requests = []
+        self.validators = []
+
+    def get(self, url, headers, stream, timeout):
+        self.requests.append(headers.get("Range"))
+        self.validators.append(headers.get("If-Range"))
+        response = requests.Response()
+        if self.etag is not None:
+            response.headers["ETag"] = self.etag
+        changed = self.if_range and headers.get("If-Range", self.etag) != self.etag
+        start, end = 0, len(DATA)
+        if self.ranges and "Range" in headers and not changed:
+            first, last = headers["Range"][len("bytes=") :].split("-")
+            start, end = int(first), int(last or len(DATA) - 1) + 1
+            if start >= len(DATA):
+                response.status_code = _download.RANGE_NOT_SATISFIABLE
+                response.raw = io.BytesIO()
+                return response
+            response.status_code = _download.PARTIAL_CONTENT
+            response.headers["Content-Range"] = (
+                f"bytes {start}-{end - 1}/{len(DATA)}"
+            )
+        else:
+            response.status_code = 200
+        response.headers["Content-Length"] = str(end - start)
+        body = DATA[start:end]
+        if self.limit is not None:
+            body = body[: self.limit]
+        response.raw = io.BytesIO(body)
+        return response
+
+
+@pytest.fixture
+def outputfile(tmp_path):
+    return str(tmp_path / "result.nc")
+
+
+def test_download(outputfile, tmp_path):
+    server = FakeServer()
+    _download.download(server, URL, outputfile, len(DATA))
+    assert open(outputfile, "rb").read() == DATA
+    assert server.requests == [None]
+    assert [path.name for path in tmp_path.iterdir()] == ["result.nc"]
+
+
+def test_resume(outputfile):
+    server = FakeServer(limit=1000)
+    with pytest.raises(_download.IncompleteDownloadError, match="1000 of 10240"):
+        _download.download(server, URL, outputfile, len(DATA))
+    assert _retry.classify(_download.IncompleteDownloadError()) == _retry.TRANSIENT
+
+    server.limit = None
+    _download.download(server, URL, outputfile, len(DATA))
+    assert open(outputfile, "rb").read() == DATA
+    assert server.requests == [None, "bytes=1000-"]
+
+
+def test_size_from_headers(outputfile):
+    server = FakeServer(limit=1000)
+    with pytest.raises(_download.IncompleteDownloadError):
+        _download.download(server, URL, outputfile)
+    server.limit = None
+    _download.download(server, URL, outputfile)
+    assert open(outputfile, "rb").read() == DATA
+
+
+def test_no_range_support(outputfile):
+    with open(_download.part_path(outputfile), "wb") as file:
+        file.write(b"\0" * 1000)
+    _download.download(FakeServer(ranges=False), URL, outputfile, len(DATA))
+    assert open(outputfile, "rb").read() == DATA
+
+
+def write_part(outputfile, data, url=URL, size=len(DATA), validator='"v1"'):
+    with open(_download.part_path(outputfile), "wb") as file:
+        file.write(data)
+    with open(_download.source_path(outputfile), "w") as file:
+        json.dump({"url": url, "size": size, "validator": validator}, file)
+
+
+def test_complete_part(outputfile, tmp_path):
+    """Test that a complete partial file of the same result is only renamed."""
+    write_part(outputfile, DATA)
+    server = FakeServer()
+    _download.download(server, URL, outputfile, len(DATA))
+    assert server.requests == []
+    assert open(outputfile, "rb").read() == DATA
+    assert [path.name for path in tmp_path.iterdir()] == ["result.nc"]
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        None,  # Unknown
+        {"url": "https://download.example/other.nc"},
+        {"size": len(DATA) + 10},
+    ],
+)
+def test_other_result(outputfile, source):
+    """Test that a partial file of another (or an unknown) result is not resumed,
+    even if it looks complete."""
+    if source is None:
+        with open(_download.part_path(outputfile), "wb") as file:
+            file.write(b"\0" * len(DATA))
+    else:
+        write_part(outputfile, b"\0" * len(DATA), **source)
+    server = FakeServer()
+    _download.download(server, URL, outputfile, len(DATA))
+    assert server.requests == [None]
+    assert open(outputfile, "rb").read() == DATA
+
+
+def test_if_range(outputfile):
+    server = FakeServer(limit=1000)
+    with pytest.raises(_download.IncompleteDownloadError):
+        _download.download(server, URL, outputfile, len(DATA))
+    server.limit = None
+    _download.download(server, URL, outputfile, len(DATA))
+    assert server.validators == [None, '"v1"']
+    assert open(outputfile, "rb").read() == DATA
+
+
+def test_changed_result(outputfile):
+    """Test that a server honouring If-Range sends the whole changed file."""
+    write_part(outputfile, b"\0" * 1000, validator='"v0"')
+    server = FakeServer()
+    _download.download(server, URL, outputfile, len(DATA))
+    assert server.requests == ["bytes=1000-"]
+    assert open(outputfile, "rb").read() == DATA
+
+
+@mock.patch("era5cli._download.MIN_SEGMENT_SIZE", 1000)
+@pytest.mark.parametrize("segments", [1, 2])
+def test_changed_result_no_if_range(outputfile, segments):
+    """Test that a part of a changed file is discarded, if the server ignores
+    If-Range."""
+    server = FakeServer(limit=1000)
+    with pytest.raises(_download.IncompleteDownloadError):
+        _download.download(server, URL, outputfile, len(DATA), segments)
+
+    server = FakeServer(etag='"v2"', if_range=False)
+    with pytest.raises(_download.ChangedSourceError):
+        _download.download(server, URL, outputfile, len(DATA), segments)
+    assert not os.path.exists(_download.part_path(outputfile))
+    assert not os.path.exists(_download.source_path(outputfile))
+
+    _download.download(server, URL, outputfile, len(DATA), segments)
+    assert open(outputfile, "rb").read() == DATA
+
+
+def test_fetch_result(outputfile):
+    result = mock.MagicMock(location=URL, content_length=str(len(DATA)))
+    _download.fetch_result(result, outputfile, FakeServer())
+    assert open(outputfile, "rb").read() == DATA
+
+
+@pytest.mark.parametrize("segments", [1, 4])
+def test_progress(outputfile, segments):
+    server = FakeServer(limit=1000)
+    with mock.patch("era5cli._download.MIN_SEGMENT_SIZE", 1000), mock.patch(
+        "tqdm.tqdm"
+    ) as tqdm:
+        with pytest.raises(_download.IncompleteDownloadError):
+            _download.download(server, URL, outputfile, len(DATA), segments)
+        tqdm.assert_not_called()
+
+        server.limit = None
+        _download.download(server, URL, outputfile, len(DATA), segments, True)
+
+    bar = tqdm.return_value.__enter__.return_value
+    assert tqdm.call_args.kwargs["total"] == len(DATA)
+    received = tqdm.call_args.kwargs["initial"]
+    assert received > 0  # Resumed.
+    updates = sum(call.args[0] for call in bar.update.call_args_list)
+    assert received + updates == len(DATA)
+
+
+def test_split_segments():
+    assert _download.split_segments(10, 3) == [[0, 3, 0], [3, 6, 0], [6, 10, 0]]
+
+
+@mock.patch("era5cli._download.MIN_SEGMENT_SIZE", 1000)
+def test_segments(outputfile, tmp_path):
+    server = FakeServer()
+    _download.download(server, URL, outputfile, len(DATA), segments=4)
+    assert open(outputfile, "rb").read() == DATA
+    assert sorted(server.requests) == [
+        "bytes=0-2559",
+        "bytes=2560-5119",
+        "bytes=5120-7679",
+        "bytes=7680-10239",
+    ]
+    assert [path.name for path in tmp_path.iterdir()] == ["result.nc"]
+
+
+@mock.patch("era5cli._download.MIN_SEGMENT_SIZE", 1000)
+def test_segments_resume(outputfile):
+    server = FakeServer(limit=1000)
+    with pytest.raises(_download.IncompleteDownloadError):
+        _download.download(server, URL, outputfile, len(DATA), segments=2)
+
+    server.limit = None
+    server.requests.clear()
+    _download.download(server, URL, outputfile, len(DATA), segments=2)
+    assert open(outputfile, "rb").read() == DATA
+    assert sorted(server.requests) == ["bytes=1000-5119", "bytes=6120-10239"]
+
+
+@mock.patch("era5cli._download.MIN_SEGMENT_SIZE", 1000)
+def test_segments_not_supported(outputfile):
+    server = FakeServer(ranges=False)
+    _download.download(server, URL, outputfile, len(DATA), segments=4)
+    assert open(outputfile, "rb").read() == DATA
+    assert not os.path.exists(_download.segments_path(outputfile))
+
+
+def test_segments_small_file(outputfile):
+    server = FakeServer()
+    _download.download(server, URL, outputfile, len(DATA), segments=4)
+    assert server.requests == [None]  # Smaller than MIN_SEGMENT_SIZE
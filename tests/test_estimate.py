@@ -0,0 +1,118 @@
+"""Tests for estimating the size and duration of requests."""
+
+import pytest
+from era5cli import _estimate
+from era5cli import cli
+from era5cli.fetch import Fetch
+
+
+def request(**fields):
+    request = {
+        "variable": "2m_temperature",
+        "year": [2008],
+        "month": ["01", "02"],
+        "day": ["01", "02", "03"],
+        "time": ["00:00", "06:00", "12:00", "18:00"],
+        "format": "netcdf",
+        "product_type": "reanalysis",
+    }
+    request.update(fields)
+    return request
+
+
+def test_grid_points():
+    assert _estimate.grid_points(0.25) == 721 * 1440
+    assert _estimate.grid_points(0.1, [60, -10, 50, 5]) == 101 * 151
+    assert _estimate.grid_points(0.25, [10, 170, 0, -170]) == 41 * 81  # Dateline
+
+
+def test_n_fields():
+    assert _estimate.n_fields(request()) == 2 * 3 * 4
+    assert _estimate.n_fields(request(pressure_level=[500, 850])) == 2 * 3 * 4 * 2
+    # The ensemble is only available every 3 hours, and statistics are extra fields.
+    ensemble = request(
+        time=["00:00", "01:00", "03:00"],
+        product_type=["ensemble_members", "ensemble_mean", "ensemble_spread"],
+    )
+    assert _estimate.n_fields(ensemble) == 2 * 3 * 2 * 3
+
+
+def test_request_bytes():
+    single = "reanalysis-era5-single-levels"
+    netcdf = _estimate.request_bytes(single, request())
+    assert netcdf == 24 * 721 * 1440 * 4
+    assert _estimate.request_bytes(single, request(format="grib")) == netcdf // 2
+
+    land = _estimate.request_bytes("reanalysis-era5-land", request())
+    assert land == 24 * 1801 * 3600 * 4
+
+    members = _estimate.request_bytes(single, request(product_type="ensemble_members"))
+    assert members == 24 * 361 * 720 * 10 * 4
+
+
+def test_fit_timing():
+    assert _estimate.fit_timing([(1, 1.0)]) == _estimate.DEFAULT_TIMING
+    timing = _estimate.fit_timing([(0, 100.0), (1000, 110.0), (2000, 120.0)])
+    assert timing.overhead == pytest.approx(100)
+    assert timing.seconds(5000) == pytest.approx(150)
+    assert timing.measured
+
+    # Larger files that happened to be faster do not give a negative rate.
+    timing = _estimate.fit_timing([(0, 120.0), (1000, 110.0), (2000, 100.0)])
+    assert timing.seconds_per_byte == 0
+
+
+def test_best_tiles():
+    era5 = Fetch(
+        years=[2008],
+        months=[1],
+        days=list(range(1, 32)),
+        hours=list(range(24)),
+        variables=["2m_temperature"],
+        outputformat="netcdf",
+        outputprefix="era5",
+        period="hourly",
+        ensemble=False,
+        land=True,
+        max_threads=16,
+    )
+    assert _estimate.parallel_requests(era5) == 16
+    land = ("reanalysis-era5-land", request())
+    # A single large request downloads faster in tiles, in parallel.
+    assert _estimate.best_tiles(era5, [land]) == _estimate.MAX_TILES
+    # But tiles only add to the queue if there are more requests than threads.
+    assert _estimate.best_tiles(era5, 32 * [land]) == 1
+
+
+def test_fetch_estimate(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    era5 = Fetch(
+        years=[2008],
+        months=[1, 2],
+        days=list(range(1, 32)),
+        hours=[0, 12],
+        variables=["2m_temperature"],
+        outputformat="grib",
+        outputprefix="era5",
+        period="hourly",
+        ensemble=False,
+        splitmonths=True,
+    )
+    estimates = era5.estimate()
+    assert [est.outputfile for est in estimates] == [
+        "era5_2m_temperature_2008-01_hourly.grb",
+        "era5_2m_temperature_2008-02_hourly.grb",
+    ]
+    assert estimates[0].fields == 31 * 2
+    assert estimates[0].nbytes == 31 * 2 * 721 * 1440 * 2
+    assert not estimates[0].measured
+    assert not list(tmp_path.iterdir())  # Nothing is fetched
+
+
+def test_cli_estimate(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    argv = ["era5cli", "estimate", "monthly", "--variables", "2m_temperature"]
+    assert cli.main(argv + ["--startyear", "2008"]) is None
+    out = capsys.readouterr().out
+    assert "era5_2m_temperature_2008_monthly.nc" in out
+    assert "1 request(s)" in out
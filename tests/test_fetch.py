@@ -1,9 +1,15 @@
 """Tests for era5cli Fetch class."""
 
+import os
 import pathlib
+import sqlite3
+import threading
 import unittest.mock as mock
 import pytest
+import requests
+import era5cli.inputref as ref
 from era5cli import _request_size
+from era5cli import _retry
 from era5cli import fetch
 
 
@@ -32,6 +38,37 @@ def my_thing_mock():
         yield _fixture
 
 
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run every test in its own directory, to not leave downloads behind."""
+    monkeypatch.chdir(tmp_path)
+
+
+def touch(result, outputfile, session, segments, progress):
+    pathlib.Path(outputfile).touch()
+
+
+def concatenate(inputs, output, history=None):
+    pathlib.Path(output).touch()
+
+
+@pytest.fixture(autouse=True)
+def fetch_result():
+    with mock.patch(
+        "era5cli.fetch._download.fetch_result", autospec=True, side_effect=touch
+    ) as _fixture:
+        yield _fixture
+
+
+@pytest.fixture(scope="module", autouse=True)
+def mock_load_config():
+    with mock.patch(
+        "era5cli.fetch.key_management.load_era5cli_config",
+        return_value=("url", "key:uid"),
+    ) as _fixture:
+        yield _fixture
+
+
 def initialize(
     outputformat="netcdf",
     merge=False,
@@ -50,6 +87,18 @@ def initialize(
     land=False,
     splitmonths=True,
     overwrite=False,
+    asynchronous=False,
+    autochunk=False,
+    pack_variables=False,
+    min_threads=None,
+    max_threads=None,
+    resume=False,
+    cache=False,
+    skip_existing=False,
+    start=None,
+    end=None,
+    split_levels=False,
+    tiles=None,
 ):
     with mock.patch(
         "era5cli.fetch.key_management.load_era5cli_config",
@@ -75,6 +124,18 @@ def initialize(
             land=land,
             splitmonths=splitmonths,
             overwrite=overwrite,
+            asynchronous=asynchronous,
+            autochunk=autochunk,
+            pack_variables=pack_variables,
+            min_threads=min_threads,
+            max_threads=max_threads,
+            resume=resume,
+            cache=cache,
+            skip_existing=skip_existing,
+            start=start,
+            end=end,
+            split_levels=split_levels,
+            tiles=tiles,
         )
 
 
@@ -136,19 +197,26 @@ def test_init(mockpatch):
 
 @mock.patch("cdsapi.Client", autospec=True)
 @mock.patch("era5cli.utils.append_history", autospec=True)
-def test_fetch_nodryrun(cds, era5cli_utilsappend_history):
+@mock.patch("era5cli.fetch._postprocess", autospec=True)
+def test_fetch_nodryrun(postprocess, cds, era5cli_utilsappend_history):
     """Test fetch function of Fetch class."""
-    era5 = initialize()
+    postprocess.concatenate.side_effect = concatenate
+    era5 = initialize(overwrite=True)
     assert era5.fetch() is None
 
-    era5 = initialize(outputformat="grib", merge=True)
+    era5 = initialize(outputformat="grib", merge=True, overwrite=True)
     assert era5.fetch() is None
 
-    era5 = initialize(outputformat="grib", merge=True, threads=None)
+    era5 = initialize(outputformat="grib", merge=True, threads=None, overwrite=True)
     assert era5.fetch() is None
 
     era5 = initialize(
-        outputformat="grib", merge=True, threads=None, ensemble=True, statistics=True
+        outputformat="grib",
+        merge=True,
+        threads=None,
+        ensemble=True,
+        statistics=True,
+        overwrite=True,
     )
     assert era5.fetch() is None
 
@@ -158,6 +226,7 @@ def test_fetch_nodryrun(cds, era5cli_utilsappend_history):
         threads=None,
         pressurelevels=[1, 2],
         variables=["temperature"],
+        overwrite=True,
     )
     assert era5.fetch() is None
 
@@ -168,6 +237,7 @@ def test_fetch_nodryrun(cds, era5cli_utilsappend_history):
         pressurelevels=[1, 2],
         variables=["temperature"],
         period="monthly",
+        overwrite=True,
     )
     assert era5.fetch() is None
 
@@ -200,12 +270,590 @@ def test_fetch_nodryrun(cds, era5cli_utilsappend_history):
         assert era5.fetch()
 
 
+@mock.patch("era5cli._jobs.run_async", autospec=True, return_value=[])
+@mock.patch("cdsapi.Client", autospec=True)
+def test_fetch_asynchronous(cds, run_async):
+    """Test that all requests are handed to the asynchronous pipeline at once."""
+    era5 = initialize(asynchronous=True, variables=["total_precipitation", "runoff"])
+    era5.fetch()
+
+    assert cds.call_args.kwargs["wait_until_complete"] is False
+    run_async.assert_called_once()
+    _, tasks, download = run_async.call_args.args
+    assert len(tasks) == 2 * 2 * 12
+    name, request, outputfile = tasks[0]
+    assert name == "reanalysis-era5-single-levels"
+    assert request["variable"] == "total_precipitation"
+    assert request["month"] == "01"
+    assert outputfile == "era5_total_precipitation_2008-01_hourly_ensemble.nc"
+    assert download == era5._download
+
+    # Dry runs never submit anything
+    run_async.reset_mock()
+    era5.fetch(dryrun=True)
+    run_async.assert_not_called()
+
+
+@mock.patch(
+    "era5cli.fetch._concurrency.run_adaptive", autospec=True, return_value=[]
+)
+def test_fetch_adaptive_threads(run_adaptive):
+    """Test that the number of threads is adapted if a maximum is given."""
+    era5 = initialize(threads=None, min_threads=2, max_threads=8)
+    assert era5.controller.floor == 2
+    assert era5.controller.ceiling == 8
+    era5.fetch()
+
+    run_adaptive.assert_called_once()
+    tasks, work, controller = run_adaptive.call_args.args
+    assert len(tasks) == 2 * 12
+    assert work == era5._getdata
+    assert controller is era5.controller
+
+
+def test_fetch_thread_limits():
+    with pytest.raises(ValueError, match="Not both"):
+        initialize(threads=2, max_threads=8)
+    with pytest.raises(ValueError, match="requires a maximum"):
+        initialize(threads=None, min_threads=2)
+    with pytest.raises(ValueError, match="segments"):
+        fetch.Fetch(
+            years=[2008],
+            months=[1],
+            days=[1],
+            hours=[0],
+            variables=["total_precipitation"],
+            outputformat="netcdf",
+            outputprefix="era5",
+            period="hourly",
+            ensemble=False,
+            segments=0,
+        )
+    with pytest.raises(ValueError, match="Invalid thread limits"):
+        initialize(threads=None, min_threads=4, max_threads=2)
+
+
+@mock.patch("era5cli.utils.append_history", autospec=True)
+def test_fetch_failed_requests(append_history):
+    """Test that a failing request does not stop the others, and is reported."""
+    with mock.patch("cdsapi.Client", autospec=True) as cds:
+        cds.return_value.retrieve.side_effect = [
+            None,
+            RuntimeError("There is no data matching your request"),
+            None,
+        ]
+        era5 = initialize(splitmonths=False, years=[2008, 2009, 2010], threads=1)
+        with pytest.raises(_retry.FailedRequestsError) as error:
+            era5.fetch()
+
+    assert cds.return_value.retrieve.call_count == 3
+    assert append_history.call_count == 2
+    assert str(error.value).splitlines()[:2] == [
+        "1 of 3 request(s) failed:",
+        "  era5_total_precipitation_2009_hourly_ensemble.nc: RuntimeError: "
+        "There is no data matching your request (permanent, 1 attempt(s))",
+    ]
+
+
+@mock.patch("era5cli._retry.time.sleep", autospec=True)
+@mock.patch("era5cli.utils.append_history", autospec=True)
+def test_fetch_download_retried(append_history, sleep, fetch_result):
+    """Test that a failing download is retried without resubmitting the request."""
+    fetch_result.side_effect = requests.ConnectionError("Connection reset")
+    with mock.patch("cdsapi.Client", autospec=True) as cds:
+        era5 = initialize(splitmonths=False, years=[2008], threads=1)
+        with pytest.raises(_retry.FailedRequestsError) as error:
+            era5.fetch()
+
+    assert cds.return_value.retrieve.call_count == 1
+    assert fetch_result.call_count == _retry.MAX_ATTEMPTS
+    assert append_history.call_count == 0
+    assert "ConnectionError: Connection reset (transient, 5 attempt(s))" in str(
+        error.value
+    )
+
+
+@mock.patch("era5cli.utils.append_history", autospec=True)
+@mock.patch("era5cli.fetch._postprocess", autospec=True)
+def test_fetch_autochunk_failed(
+    postprocess, append_history, fetch_result, tmp_path, monkeypatch
+):
+    """Test that jobs with a failed request are not assembled, but cleaned up."""
+    monkeypatch.chdir(tmp_path)
+    fetch_result.side_effect = touch
+
+    def retrieve(name, request):
+        if request["month"] == ["03"]:
+            raise RuntimeError("There is no data matching your request")
+
+    with mock.patch("cdsapi.Client", autospec=True) as cds:
+        cds.return_value.retrieve.side_effect = retrieve
+        era5 = initialize(land=True, ensemble=False, splitmonths=False, autochunk=True)
+        era5.years = [2008]
+        with pytest.raises(_retry.FailedRequestsError, match="1 of 12"):
+            era5.fetch()
+
+    postprocess.concatenate.assert_not_called()
+    assert list(tmp_path.iterdir()) == []
+
+
+@mock.patch("era5cli.utils.append_history", autospec=True)
+def test_fetch_resume(append_history, tmp_path, monkeypatch, capsys):
+    """Test that finished files are skipped, and submitted jobs reattached."""
+    monkeypatch.chdir(tmp_path)
+    era5 = initialize(splitmonths=False, resume=True)
+    assert era5.asynchronous
+
+    pathlib.Path("era5_total_precipitation_2008_hourly_ensemble.nc").touch()
+    pathlib.Path("era5_total_precipitation_2009_hourly_ensemble.nc").touch()
+    era5._ledger.output_finished(
+        (
+            *era5._build_request("total_precipitation", [2008]),
+            "era5_total_precipitation_2008_hourly_ensemble.nc",
+        )
+    )
+
+    # The 2009 file exists, but was not finished.
+    with pytest.raises(FileExistsError):
+        era5.fetch()
+
+    era5.overwrite = True
+    with mock.patch("era5cli._jobs.run_async", return_value=[]) as run_async:
+        era5.fetch()
+    _, tasks, _ = run_async.call_args.args
+    assert [task[-1] for task in tasks] == [
+        "era5_total_precipitation_2009_hourly_ensemble.nc"
+    ]
+    assert run_async.call_args.kwargs["resume"] is True
+    assert run_async.call_args.kwargs["ledger"] is era5._ledger
+    assert "Skipping 1 finished file(s)." in capsys.readouterr().out
+
+
+@mock.patch("era5cli.utils.append_history", autospec=True)
+def test_fetch_resume_absolute_prefix(append_history, tmp_path, monkeypatch):
+    """Test that finished files are recognized by their absolute path, and only
+    skipped if they were finished for the same request."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "out").mkdir()
+    era5 = initialize(splitmonths=False, resume=True, overwrite=True)
+    era5.outputprefix = str(tmp_path / "out" / "era5")
+    outputfiles = [
+        str(tmp_path / "out" / f"era5_total_precipitation_{year}_hourly_ensemble.nc")
+        for year in (2008, 2009)
+    ]
+    for outputfile in outputfiles:
+        pathlib.Path(outputfile).touch()
+    era5._ledger.output_finished(
+        (*era5._build_request("total_precipitation", [2008]), outputfiles[0])
+    )
+    # Finished, but for a different area.
+    name, request = era5._build_request("total_precipitation", [2009])
+    era5._ledger.output_finished(
+        (name, dict(request, area=[60, -10, 50, 5]), outputfiles[1])
+    )
+
+    with mock.patch("era5cli._jobs.run_async", return_value=[]) as run_async:
+        era5.fetch()
+    _, tasks, _ = run_async.call_args.args
+    assert [task[-1] for task in tasks] == [outputfiles[1]]
+
+
+@mock.patch("era5cli.utils.append_history", autospec=True)
+def test_fetch_skip_existing(append_history, tmp_path, monkeypatch, capsys):
+    """Test that valid existing files are skipped, without logging in."""
+    monkeypatch.chdir(tmp_path)
+    pathlib.Path("era5_total_precipitation_2008_hourly_ensemble.nc").write_bytes(
+        b"CDF\x01"
+    )
+    pathlib.Path("era5_total_precipitation_2009_hourly_ensemble.nc").write_bytes(
+        b"<html>"  # An error page, not a netCDF file.
+    )
+    era5 = initialize(splitmonths=False, skip_existing=True, overwrite=True)
+    with mock.patch.object(era5, "_retrieve_all", return_value=[]) as retrieve:
+        era5.fetch()
+    [(_, _, outputfile)] = retrieve.call_args.args[0]
+    assert outputfile == "era5_total_precipitation_2009_hourly_ensemble.nc"
+    assert "Skipping 1 finished file(s)." in capsys.readouterr().out
+
+    pathlib.Path(outputfile).write_bytes(b"\x89HDF")
+    era5 = initialize(splitmonths=False, skip_existing=True)
+    with mock.patch.object(era5, "_get_login") as login:
+        era5.fetch()
+    login.assert_not_called()
+
+
+def test_fetch_deferred_history(fetch_result, tmp_path, monkeypatch):
+    """Test that files are stamped in the background, and failures are reported."""
+    monkeypatch.chdir(tmp_path)
+    threads = []
+
+    def append_history(name, request, fname):
+        threads.append(threading.current_thread().name)
+        if "2009" in fname:
+            raise OSError("disk full")
+
+    with mock.patch("cdsapi.Client", autospec=True), mock.patch(
+        "era5cli.utils.append_history", side_effect=append_history
+    ):
+        era5 = initialize(splitmonths=False, years=[2008, 2009], threads=1)
+        with pytest.raises(_retry.FailedRequestsError, match="1 of 2") as error:
+            era5.fetch()
+
+    assert all(name.startswith("era5cli-finish") for name in threads)
+    assert "OSError: disk full" in str(error.value)
+    assert [record.path for record in era5._inventory.query()] == [
+        os.path.abspath("era5_total_precipitation_2008_hourly_ensemble.nc")
+    ]
+
+
+@mock.patch("era5cli.utils.append_history", autospec=True)
+def test_fetch_ledger(append_history, ledger_path):
+    """Test that downloads and failures are recorded in the ledger, when resuming,
+    and that the duration of transfers is recorded by every run."""
+    with mock.patch("cdsapi.Client", autospec=True) as cds:
+        era5 = initialize(splitmonths=False, threads=1)
+        era5.fetch()
+    assert len(era5._ledger.transfers()) == 2
+    with sqlite3.connect(ledger_path) as connection:
+        assert connection.execute("SELECT * FROM jobs").fetchall() == []
+        assert connection.execute("SELECT * FROM finished").fetchall() == []
+
+    with mock.patch("cdsapi.Client", autospec=True) as cds:
+        cds.return_value.retrieve.side_effect = [
+            mock.MagicMock(),
+            RuntimeError("There is no data matching your request"),
+        ]
+        era5 = initialize(splitmonths=False, threads=1, resume=True, overwrite=True)
+        with pytest.raises(_retry.FailedRequestsError):
+            era5.fetch()
+
+    with sqlite3.connect(ledger_path) as connection:
+        finished = connection.execute("SELECT outputfile FROM finished").fetchall()
+        states = connection.execute("SELECT state, error FROM jobs").fetchall()
+    assert finished == [
+        (os.path.abspath("era5_total_precipitation_2008_hourly_ensemble.nc"),)
+    ]
+    assert sorted(states) == [
+        ("completed", None),
+        ("failed", "There is no data matching your request"),
+    ]
+
+
+@mock.patch("era5cli.utils.append_history", autospec=True)
+def test_fetch_bookkeeping_errors(append_history, caplog):
+    """Test that a failing ledger or inventory does not fail (or retry) a task."""
+    locked = sqlite3.OperationalError("database is locked")
+    with mock.patch("cdsapi.Client", autospec=True) as cds, mock.patch(
+        "era5cli._inventory.Inventory.record", side_effect=locked
+    ), mock.patch("era5cli._ledger.Ledger.completed", side_effect=OSError("full")):
+        era5 = initialize(splitmonths=False, threads=1, resume=True)
+        era5.fetch()
+
+    assert cds.return_value.retrieve.call_count == 2
+    assert append_history.call_count == 2
+    assert caplog.text.count("failed: database is locked") == 2
+    assert caplog.text.count("failed: full") == 2
+
+
+@mock.patch("era5cli.utils.append_history", autospec=True)
+def test_fetch_cache(append_history, fetch_result, tmp_path, monkeypatch, capsys):
+    """Test that a cached result is reused, even under another file name."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("ERA5CLI_CACHE_DIR", str(tmp_path / "cache"))
+
+    def write(result, outputfile, session, segments, progress):
+        pathlib.Path(outputfile).write_bytes(b"data")
+
+    fetch_result.side_effect = write
+
+    with mock.patch("cdsapi.Client", autospec=True) as cds:
+        era5 = initialize(splitmonths=False, years=[2008], cache=True)
+        era5.fetch()
+        assert cds.return_value.retrieve.call_count == 1
+
+        era5 = initialize(splitmonths=False, years=[2008], cache=True)
+        era5.outputprefix = "copy"
+        era5.fetch()
+        assert cds.return_value.retrieve.call_count == 1
+
+    output = pathlib.Path("copy_total_precipitation_2008_hourly_ensemble.nc")
+    assert output.read_bytes() == b"data"
+    assert "Reused 1 cached result(s)." in capsys.readouterr().out
+    assert era5._inventory.lookup(str(output))
+
+
+@mock.patch("era5cli.utils.append_history", autospec=True)
+def test_download(append_history, fetch_result):
+    """Test that asynchronous results are downloaded and stamped."""
+    era5 = initialize()
+    remote = mock.MagicMock()
+    request = {"variable": "runoff", "year": 2008, "month": "01", "time": "00:00"}
+    era5._download(remote, "name", request, "out.nc")
+    fetch_result.assert_called_once_with(
+        remote.get_results.return_value, "out.nc", mock.ANY, 1, progress=False
+    )
+    append_history.assert_called_once_with("name", request, "out.nc")
+
+
+def test_fetch_autochunk_dryrun(capsys):
+    """Test that packed requests are printed with the files they are split into."""
+    era5 = initialize(autochunk=True, ensemble=False)
+    era5.fetch(dryrun=True)
+    out = capsys.readouterr().out.splitlines()
+    assert len(out) == 2
+    assert "'year': [2008, 2009]" in out[0]
+    assert out[0].endswith("era5_total_precipitation_2008-01_hourly.nc.chunk0")
+    assert out[1].startswith("  split into: era5_total_precipitation_2008-01")
+
+    # Too large requests are split up instead of raising an error
+    era5 = initialize(land=True, ensemble=False, splitmonths=False, autochunk=True)
+    era5.fetch(dryrun=True)
+    out = capsys.readouterr().out.splitlines()
+    assert len(out) == 2 * 12 + 2
+    output = "era5-land_total_precipitation_2008_hourly.nc"
+    assert out[12] == f"  concatenated into: {output}"
+
+
+@mock.patch("era5cli.utils.append_history", autospec=True)
+@mock.patch("era5cli.fetch._postprocess", autospec=True)
+def test_fetch_autochunk(postprocess, append_history, tmp_path):
+    """Test that downloaded chunks are assembled into the outputs, then removed."""
+    postprocess.concatenate.side_effect = concatenate
+
+    with mock.patch("cdsapi.Client", autospec=True):
+        era5 = initialize(land=True, ensemble=False, splitmonths=False, autochunk=True)
+        era5.years = [2008]
+        era5.fetch()
+
+    output = "era5-land_total_precipitation_2008_hourly.nc"
+    chunks = [f"{output}.chunk{i}" for i in range(12)]
+    postprocess.concatenate.assert_called_once()
+    inputs, outputfile, history = postprocess.concatenate.call_args.args
+    assert (inputs, outputfile) == (chunks, output)
+    assert len(history.splitlines()) == 12  # One line per request
+    append_history.assert_not_called()  # History is written at creation
+    assert [path.name for path in tmp_path.iterdir()] == [output]  # Chunks removed
+
+
+@mock.patch("era5cli.fetch._postprocess", autospec=True)
+def test_fetch_level_groups(postprocess):
+    """Test that a year of all pressure levels is requested in groups of levels."""
+    postprocess.merge_levels.side_effect = concatenate
+    # 37 levels * 24 hours * 366 days is too large for a single request.
+    era5 = initialize(
+        variables=["temperature"],
+        years=[2008],
+        pressurelevels=ref.PLEVELS,
+        ensemble=False,
+        splitmonths=False,
+    )
+    assert era5._level_groups
+    with mock.patch("cdsapi.Client", autospec=True):
+        era5.fetch()
+
+    output = "era5_temperature_2008_hourly.nc"
+    postprocess.merge_levels.assert_called_once()
+    inputs, outputfile, _ = postprocess.merge_levels.call_args.args
+    assert (inputs, outputfile) == ([f"{output}.chunk{i}" for i in range(3)], output)
+    postprocess.concatenate.assert_not_called()
+
+
+def test_fetch_split_levels_dryrun(capsys):
+    """Test that every pressure level can be written to its own file."""
+    era5 = initialize(
+        variables=["temperature", "2m_temperature"],
+        years=[2008],
+        pressurelevels=[500, 850],
+        ensemble=False,
+        splitmonths=False,
+        split_levels=True,
+    )
+    era5.fetch(dryrun=True)
+    captured = capsys.readouterr().out
+    assert "'pressure_level': [500]" in captured
+    assert "era5_temperature_500hPa_2008_hourly.nc" in captured
+    assert "era5_temperature_850hPa_2008_hourly.nc" in captured
+    assert "era5_2m_temperature_2008_hourly.nc" in captured
+
+
+@mock.patch("era5cli.fetch._postprocess", autospec=True)
+def test_fetch_tiles(postprocess):
+    """Test that the tiles of every request are stitched, before concatenating."""
+    postprocess.stitch.side_effect = concatenate
+    postprocess.concatenate.side_effect = concatenate
+    with mock.patch("cdsapi.Client", autospec=True) as cds:
+        era5 = initialize(
+            land=True,
+            ensemble=False,
+            splitmonths=False,
+            years=[2008],
+            months=[1, 2],
+            area=[60, -10, 50, 30],
+            autochunk=True,
+            tiles=2,
+        )
+        era5.fetch()
+    areas = [call.args[1]["area"] for call in cds.return_value.retrieve.call_args_list]
+    assert sorted(areas) == 2 * [[60, -10, 50, 9.9]] + 2 * [[60, 10.0, 50, 30]]
+
+    output = "era5-land_total_precipitation_2008_hourly_10W-30E_50N-60N.nc"
+    assert [call.args[:2] for call in postprocess.stitch.call_args_list] == [
+        ([f"{output}.tile0", f"{output}.tile1"], f"{output}.chunk0"),
+        ([f"{output}.tile2", f"{output}.tile3"], f"{output}.chunk1"),
+    ]
+    inputs, outputfile, _ = postprocess.concatenate.call_args.args
+    assert (inputs, outputfile) == ([f"{output}.chunk0", f"{output}.chunk1"], output)
+    assert [path.name for path in pathlib.Path().iterdir()] == [output]
+
+
+def test_tiles_options():
+    with pytest.raises(ValueError, match="requires an area"):
+        initialize(tiles=2)
+    with pytest.raises(ValueError, match="at least 1"):
+        initialize(tiles=0, area=[60, -10, 50, 30])
+
+
+def test_fetch_pack_variables_dryrun(capsys):
+    """Test that variables of the same dataset are requested together."""
+    era5 = initialize(
+        variables=["total_precipitation", "runoff", "temperature"],
+        pressurelevels=[1000],
+        pack_variables=True,
+        ensemble=False,
+        merge=True,
+        years=[2008],
+    )
+    era5.fetch(dryrun=True)
+    out = capsys.readouterr().out.splitlines()
+    assert len(out) == 3
+    assert "'variable': ['total_precipitation', 'runoff']" in out[0]
+    assert out[1] == (
+        "  split into: era5_total_precipitation_2008_hourly.nc, "
+        "era5_runoff_2008_hourly.nc"
+    )
+    assert "'variable': 'temperature'" in out[2]
+    assert out[2].endswith(" era5_temperature_2008_hourly.nc")
+
+
+@mock.patch("era5cli.fetch.logging", autospec=True)
+def test_fetch_pack_variables_grib(logging, capsys):
+    """Test that GRIB variables are requested separately."""
+    era5 = initialize(
+        outputformat="grib",
+        variables=["total_precipitation", "runoff"],
+        pack_variables=True,
+        ensemble=False,
+    )
+    era5.fetch(dryrun=True)
+    assert len(capsys.readouterr().out.splitlines()) == 2 * 2 * 12
+    logging.warning.assert_called_once()
+
+
+@mock.patch("era5cli.utils.append_history", autospec=True)
+@mock.patch("era5cli.fetch._postprocess", autospec=True)
+def test_fetch_pack_variables(
+    postprocess, append_history, fetch_result, tmp_path, monkeypatch
+):
+    """Test that packed requests of chunked outputs are split, then concatenated."""
+    monkeypatch.chdir(tmp_path)
+    fetch_result.side_effect = touch
+
+    def split_by_variable(inputfile, outputs, history=None):
+        for outputfile in outputs:
+            pathlib.Path(outputfile).touch()
+
+    postprocess.split_by_variable.side_effect = split_by_variable
+    with mock.patch("cdsapi.Client", autospec=True):
+        era5 = initialize(
+            variables=["total_precipitation", "2m_temperature"],
+            land=True,
+            ensemble=False,
+            splitmonths=False,
+            autochunk=True,
+            pack_variables=True,
+        )
+        era5.years = [2008]
+        era5.hours = ["00:00"]
+        era5.fetch()
+
+    # 2 variables * 31 days * 12 months fits in a single request
+    postprocess.split_by_variable.assert_called_once()
+    postprocess.concatenate.assert_not_called()
+
+    # A year of 2 variables * 12 hours is too large, so it is chunked per month
+    era5.hours = [f"{hour:02d}:00" for hour in range(12)]
+    era5.overwrite = True
+    with mock.patch("cdsapi.Client", autospec=True):
+        era5.fetch()
+    assert postprocess.concatenate.call_count == 2
+    pieces, output, _ = postprocess.concatenate.call_args_list[0].args
+    assert output == "era5-land_total_precipitation_2008_hourly.nc"
+    assert pieces == [f"{output}.split{i}" for i in range(12)]
+    assert not list(tmp_path.glob("*.split*"))  # Pieces are removed
+
+
+@mock.patch("era5cli.utils.append_history", autospec=True)
+@mock.patch("era5cli.fetch._postprocess", autospec=True)
+def test_fetch_merge(postprocess, append_history, tmp_path):
+    """Test that merged outputs are requested per year, and concatenated locally."""
+    postprocess.concatenate.side_effect = concatenate
+    with mock.patch("cdsapi.Client", autospec=True) as cds:
+        era5 = initialize(outputformat="grib", merge=True, years=[2007, 2008, 2009])
+        era5.fetch()
+
+    years = [
+        call.args[1]["year"] for call in cds.return_value.retrieve.call_args_list
+    ]
+    assert sorted(years) == [[2007], [2008], [2009]]
+    output = "era5_total_precipitation_2007-2009_hourly_ensemble.grb"
+    postprocess.concatenate.assert_called_once_with(
+        [f"{output}.chunk{i}" for i in range(3)], output, mock.ANY
+    )
+    assert [path.name for path in tmp_path.iterdir()] == [output]  # Chunks removed
+
+    # Only the merged output is in the inventory, not the chunks.
+    [record] = era5._inventory.query()
+    assert record.path == str(tmp_path / output)
+    assert record.years == [2007, 2008, 2009]
+    assert record.format == "grib"
+
+
 def test_fetch_dryrun():
     """Test fetch function of Fetch class with dryrun=False."""
     era5 = initialize()
     assert era5.fetch(dryrun=True) is None
 
 
+@mock.patch("era5cli.fetch.Pool", autospec=True)
+def test_dryrun_offline(pool, my_thing_mock, mock_load_config):
+    """Dry runs should never need the CDS login, nor a thread pool."""
+    my_thing_mock.reset_mock()
+    mock_load_config.reset_mock()
+    era5 = initialize()
+    era5.fetch(dryrun=True)
+    my_thing_mock.assert_not_called()
+    mock_load_config.assert_not_called()
+    pool.assert_not_called()
+    assert era5.url is None
+
+
+@mock.patch("cdsapi.Client", autospec=True)
+@mock.patch("era5cli.utils.append_history", autospec=True)
+def test_login_deferred(append_history, cds, my_thing_mock):
+    """The login is only checked right before the first real request, and once."""
+    my_thing_mock.reset_mock()
+    era5 = initialize(variables=["unknown"], merge=True)
+    with pytest.raises(ValueError):
+        era5.fetch()  # Invalid requests are caught before logging in.
+    my_thing_mock.assert_not_called()
+
+    era5 = initialize(years=[2008], splitmonths=False, overwrite=True)
+    era5.fetch()
+    era5.fetch()
+    my_thing_mock.assert_called_once()
+    assert (era5.url, era5.key) == ("url", "key:uid")
+
+
 def test_extension():
     """Test _extension function of Fetch class."""
     # checking netcdf outputformat
@@ -274,6 +922,65 @@ def test_define_outputfilename():
     assert fname == fn
 
 
+def test_date_range():
+    """Test the validation and filenames of a date range."""
+    era5 = initialize(ensemble=False, start="2001-11-15", end="2002-02-10")
+    era5._extension()
+    assert era5.years == [2001, 2002]
+    assert era5.months == [f"{month:02d}" for month in range(1, 13)]
+    fname = era5._define_outputfilename("total_precipitation", era5.years)
+    assert fname == "era5_total_precipitation_20011115-20020210_hourly.nc"
+
+    era5 = initialize(ensemble=False, start="2001-11-15T06:00", end="2001-11-16T12:00")
+    era5._extension()
+    fname = era5._define_outputfilename("total_precipitation", era5.years)
+    assert fname == "era5_total_precipitation_20011115T06-20011116T12_hourly.nc"
+
+    with pytest.raises(ValueError, match="before its start"):
+        initialize(start="2002-02-10", end="2001-11-15")
+    with pytest.raises(ValueError):
+        initialize(start="2001-11-15")
+
+
+def test_date_range_dryrun(capsys):
+    era5 = initialize(
+        ensemble=False,
+        variables=["total_precipitation", "runoff"],
+        start="2001-11-15",
+        end="2002-02-10",
+    )
+    era5.fetch(dryrun=True)
+    captured = capsys.readouterr().out
+    # Per variable: the end of November, December, January and the start of
+    # February, concatenated into a single file.
+    assert captured.count("'year': [2001]") == 2 * 2
+    assert captured.count("'year': [2002]") == 2 * 2
+    assert "era5_runoff_20011115-20020210_hourly.nc" in captured
+
+
+@mock.patch("era5cli.utils.append_history", autospec=True)
+@mock.patch("era5cli.fetch._postprocess", autospec=True)
+def test_date_range_inventory(postprocess, append_history):
+    """Test that the inventory holds the months, days and hours of a range."""
+    postprocess.concatenate.side_effect = concatenate
+    era5 = initialize(
+        ensemble=False,
+        hours=[0, 6, 12, 18],
+        start="2001-11-15T20",
+        end="2001-11-17T03",
+    )
+    with mock.patch("cdsapi.Client", autospec=True) as cds:
+        era5.fetch()
+
+    times = [call.args[1]["time"] for call in cds.return_value.retrieve.call_args_list]
+    assert sorted(times) == [["00:00"], ["00:00", "06:00", "12:00", "18:00"]]
+    [record] = era5._inventory.query()
+    assert record.years == [2001]
+    assert record.months == ["11"]
+    assert record.days == ["16", "17"]
+    assert record.hours == ["00:00", "06:00", "12:00", "18:00"]
+
+
 _vars = ["total_precipitation", "runoff"]
 _years = [2007, 2008, 2009]
 
@@ -282,7 +989,7 @@ _years = [2007, 2008, 2009]
     "variables, years, merge, ensemble, splitmonths, expected",
     [
         (_vars, _years, False, False, False, 2 * 3),
-        (_vars, _years, True, False, False, 2),  # test merge
+        (_vars, _years, True, False, False, 2 * 3),  # merged locally
         (_vars, _years, False, True, False, 2 * 3),  # old default
         (_vars, _years, False, True, True, 2 * 3 * 12),  # future default
         (_vars, _years[:1], False, False, False, 2 * 1),
@@ -413,6 +1120,12 @@ def test_check_variable():
     with pytest.raises(ValueError):
         era5._check_variable(missing_monthly_var)
 
+    # Missing hourly vars should only pass if period is monthly
+    era5._check_variable("10m_wind_speed")
+    era5.period = "hourly"
+    with pytest.raises(ValueError):
+        era5._check_variable("10m_wind_speed")
+
 
 def test_build_name():
     """Test _build_name function of Fetch class."""
@@ -586,7 +1299,7 @@ def test_area():
 
 
 def test_file_exists():
-    with mock.patch.object(pathlib.Path, "exists", return_value=True):
+    with mock.patch("era5cli.utils.existing_files", return_value={"era5.nc"}):
         era5 = initialize()
 
         mp_yes = mock.patch("builtins.input", return_value="Y")
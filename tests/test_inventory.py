@@ -0,0 +1,114 @@
+"""Tests for the inventory of written files."""
+
+import hashlib
+import os
+import unittest.mock as mock
+import pytest
+from era5cli import _inventory
+from era5cli import cli
+
+
+NAME = "reanalysis-era5-single-levels"
+
+
+def request(variable="2m_temperature", years=(2008,), months=("01",)):
+    return {
+        "variable": variable,
+        "year": list(years),
+        "month": list(months),
+        "day": ["01", "02"],
+        "time": ["00:00", "12:00"],
+        "format": "netcdf",
+        "area": [60, -10, 50, 5],
+    }
+
+
+@pytest.fixture
+def inventory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "config" / "inventory.sqlite"
+    inventory = _inventory.Inventory(path)
+    with mock.patch("era5cli._inventory.inventory_path", return_value=path):
+        yield inventory
+    inventory.close()
+
+
+def write(filename, data=b"CDF\x01data"):
+    with open(filename, "wb") as file:
+        file.write(data)
+
+
+def test_lazy_creation(inventory):
+    assert inventory.query() == []
+    assert inventory.lookup("a.nc") is None
+    inventory.forget(["a.nc"])
+    assert not inventory.path.exists()
+
+
+def test_record(inventory, tmp_path):
+    write("a.nc")
+    inventory.record("a.nc", NAME, request(years=[2009, 2008]))
+
+    record = inventory.lookup("a.nc")
+    assert record.path == str(tmp_path / "a.nc")
+    assert record.dataset == NAME
+    assert record.variable == "2m_temperature"
+    assert record.years == [2008, 2009]
+    assert record.days == ["01", "02"]
+    assert record.area == [60, -10, 50, 5]
+    assert record.levels is None
+    assert record.size == 8
+    assert record.checksum == hashlib.sha256(b"CDF\x01data").hexdigest()
+
+
+def test_lookup_changed(inventory):
+    write("a.nc")
+    inventory.record("a.nc", NAME, request())
+    write("a.nc", b"CDF\x01other data")
+    assert inventory.lookup("a.nc") is None
+
+    os.remove("a.nc")
+    assert inventory.lookup("a.nc") is None
+
+
+def test_query(inventory):
+    for i, (variable, years, months) in enumerate(
+        [
+            ("2m_temperature", [1990, 1991], ["01", "02"]),
+            ("2m_temperature", [2000], ["06"]),
+            ("total_precipitation", [1995], ["01"]),
+        ]
+    ):
+        write(f"{i}.nc")
+        inventory.record(f"{i}.nc", NAME, request(variable, years, months))
+
+    def names(**kwargs):
+        return [os.path.basename(rec.path) for rec in inventory.query(**kwargs)]
+
+    assert names() == ["0.nc", "1.nc", "2.nc"]
+    assert names(variables=["2m_temperature"]) == ["0.nc", "1.nc"]
+    assert names(variables=["2m_temperature"], startyear=1991) == ["0.nc", "1.nc"]
+    assert names(startyear=1992, endyear=1999) == ["2.nc"]
+    assert names(months=[1]) == ["0.nc", "2.nc"]
+
+
+def test_forget(inventory):
+    write("a.nc")
+    inventory.record("a.nc", NAME, request())
+    inventory.forget(["a.nc"])
+    assert inventory.query() == []
+
+
+def test_cli_query(inventory, capsys):
+    assert cli.main(["era5cli", "inventory", "query"]) is None
+    assert "No files found" in capsys.readouterr().out
+
+    write("a.nc")
+    inventory.record("a.nc", NAME, request(years=range(1990, 1996)))
+    cli.main(["era5cli", "inventory", "query", "--variables", "2m_temperature"])
+    out = capsys.readouterr().out
+    assert "a.nc" in out
+    assert "1990-1995" in out
+
+    cli.main(["era5cli", "inventory", "query", "--startyear", "2000"])
+    assert "No files found" in capsys.readouterr().out
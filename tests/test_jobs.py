@@ -0,0 +1,208 @@
+"""Tests for the asynchronous job pipeline."""
+
+import threading
+import unittest.mock as mock
+import pytest
+import requests
+from era5cli import _jobs
+from era5cli._concurrency import ConcurrencyController
+
+
+class FakeRemote:
+    """Stand-in for a CDS job, which completes after a number of polls."""
+
+    def __init__(self, polls_until_ready=0, fail=False, error=None):
+        self.polls_left = polls_until_ready
+        self.fail = fail
+        self.error = error or RuntimeError("The job failed at the CDS")
+
+    @property
+    def results_ready(self):
+        if self.fail:
+            raise self.error
+        self.polls_left -= 1
+        return self.polls_left < 0
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(f"{status_code} Server Error", response=response)
+
+
+TASKS = [
+    ("reanalysis-era5-single-levels", {"variable": "2t", "year": 2008}, "a.nc"),
+    ("reanalysis-era5-single-levels", {"variable": "2t", "year": 2009}, "b.nc"),
+    ("reanalysis-era5-land", {"variable": "skt", "year": 2008}, "c.nc"),
+]
+
+
+@pytest.fixture(autouse=True)
+def no_sleep():
+    # Also stops the waits between retries, as all modules share `time`.
+    with mock.patch("era5cli._jobs.time.sleep") as _fixture:
+        with mock.patch("era5cli._retry.backoff_delay", return_value=0):
+            yield _fixture
+
+
+def test_submit_all_up_front(capsys):
+    client = mock.MagicMock()
+    client.retrieve.side_effect = [FakeRemote(1), FakeRemote(1), FakeRemote(1)]
+    _jobs.run_async(client, TASKS, mock.MagicMock())
+
+    assert client.retrieve.call_count == 3
+    client.retrieve.assert_any_call(TASKS[0][0], TASKS[0][1])
+    assert capsys.readouterr().out.count("Submitted 3 request(s)") == 1
+
+
+def test_run_async_downloads_all():
+    remotes = [FakeRemote(2), FakeRemote(0), FakeRemote(5)]
+    client = mock.MagicMock()
+    client.retrieve.side_effect = remotes
+    download = mock.MagicMock()
+
+    _jobs.run_async(client, TASKS, download, threads=2)
+
+    assert download.call_count == 3
+    for remote, task in zip(remotes, TASKS):
+        download.assert_any_call(remote, *task)
+
+
+def test_run_async_backoff(no_sleep):
+    client = mock.MagicMock()
+    client.retrieve.side_effect = [FakeRemote(3)]
+
+    _jobs.run_async(client, TASKS[:1], mock.MagicMock(), poll_interval=10)
+
+    intervals = [call.args[0] for call in no_sleep.call_args_list]
+    assert intervals == [10, 15, 22.5]
+
+
+def test_run_async_failed_job():
+    client = mock.MagicMock()
+    client.retrieve.side_effect = [FakeRemote(), FakeRemote(fail=True), FakeRemote()]
+
+    download = mock.MagicMock()
+    failures = _jobs.run_async(client, TASKS, download)
+
+    # The other jobs are still downloaded
+    assert download.call_count == 2
+    assert len(failures) == 1
+    assert failures[0].task == TASKS[1]
+    assert "failed at the CDS" in str(failures[0].error)
+
+
+def test_run_async_failed_download():
+    client = mock.MagicMock()
+    client.retrieve.side_effect = [FakeRemote(), FakeRemote(), FakeRemote()]
+    download = mock.MagicMock(side_effect=OSError("Disk full"))
+
+    failures = _jobs.run_async(client, TASKS, download)
+    assert [failure.task for failure in failures] == TASKS
+    assert download.call_count == 3  # Permanent errors are not retried
+
+
+def test_run_async_transient_errors():
+    """Test that failed jobs are resubmitted, and failed downloads retried."""
+    client = mock.MagicMock()
+    client.retrieve.side_effect = [
+        requests.ConnectionError("Connection reset"),
+        FakeRemote(),
+        FakeRemote(fail=True, error=http_error(502)),
+        FakeRemote(),
+        FakeRemote(),
+    ]
+    broken = requests.exceptions.ChunkedEncodingError("Broken")
+    download = mock.MagicMock(side_effect=[broken, None, None, None])
+
+    failures = _jobs.run_async(client, TASKS, download)
+    assert failures == []
+    assert client.retrieve.call_count == 5
+    assert download.call_count == 4
+
+
+def test_run_async_controller():
+    """Test that no more jobs are in flight than the controller allows."""
+    client = mock.MagicMock()
+    remotes = []
+
+    def retrieve(name, request):
+        # The previous job has completed before the next one is submitted.
+        assert all(remote.polls_left < 0 for remote in remotes)
+        remotes.append(FakeRemote(1))
+        return remotes[-1]
+
+    client.retrieve.side_effect = retrieve
+    controller = ConcurrencyController(floor=1, ceiling=1)
+    _jobs.run_async(client, TASKS, mock.MagicMock(), controller=controller)
+    assert client.retrieve.call_count == 3
+
+
+def test_run_async_controller_downloads():
+    """Test that no more results are downloaded at once than the controller allows,
+    and that rejected downloads lower the limit."""
+    client = mock.MagicMock()
+    client.retrieve.side_effect = [FakeRemote(), FakeRemote(), FakeRemote()]
+    lock = threading.Lock()
+    active = []
+
+    def download(remote, name, request, outputfile):
+        with lock:
+            active.append(outputfile)
+            overlapping = len(active)
+        threading.Event().wait(0.01)
+        with lock:
+            active.remove(outputfile)
+        assert overlapping == 1
+
+    controller = ConcurrencyController(floor=1, ceiling=4)
+    with mock.patch.object(controller, "_adjust"):  # Keep the limit at 1.
+        failures = _jobs.run_async(client, TASKS, download, controller=controller)
+    assert failures == []
+
+    client.retrieve.side_effect = [FakeRemote()]
+    controller.limit = 4
+    rejected = mock.MagicMock(side_effect=[http_error(429), None])
+    _jobs.run_async(client, TASKS[:1], rejected, controller=controller)
+    assert rejected.call_count == 2
+    assert controller.limit == 2
+
+
+def test_run_async_rejected_submission():
+    client = mock.MagicMock()
+    client.retrieve.side_effect = [
+        FakeRemote(),
+        RuntimeError("429 Client Error: Too Many Requests"),
+        FakeRemote(),
+        FakeRemote(),
+    ]
+    controller = ConcurrencyController(floor=1, ceiling=4)
+    controller.limit = 4
+    download = mock.MagicMock()
+
+    _jobs.run_async(client, TASKS, download, controller=controller)
+    assert download.call_count == 3
+    assert controller.limit < 4
+
+
+def test_run_async_ledger():
+    """Test that submitted jobs are recorded, and reattached to when resuming."""
+    client = mock.MagicMock()
+    remotes = [FakeRemote(), FakeRemote(), FakeRemote()]
+    client.retrieve.side_effect = remotes
+    ledger = mock.MagicMock()
+    _jobs.run_async(client, TASKS, mock.MagicMock(), ledger=ledger)
+    assert ledger.submitted.call_count == 3
+    ledger.request_id.assert_not_called()
+
+    # Resume: the first job is still known at the CDS, the second is gone.
+    client.retrieve.reset_mock(side_effect=True)
+    client.retrieve.side_effect = [FakeRemote(), FakeRemote()]
+    client.client.get_remote.side_effect = [FakeRemote(), RuntimeError("Not found")]
+    ledger.request_id.side_effect = ["id-a", "id-b", None]
+    download = mock.MagicMock()
+
+    _jobs.run_async(client, TASKS, download, ledger=ledger, resume=True)
+    assert client.client.get_remote.call_count == 2
+    assert client.retrieve.call_count == 2
+    assert download.call_count == 3
@@ -0,0 +1,138 @@
+"""Tests for the on-disk record of submitted jobs."""
+
+import unittest.mock as mock
+import pytest
+from pathos.threading import ThreadPool as Pool
+from era5cli import _ledger
+
+
+# The default location, before the autouse fixture moves the ledger of every test.
+DEFAULT_LEDGER_PATH = _ledger.ledger_path
+TASK = ("reanalysis-era5-single-levels", {"year": [2008], "month": "01"}, "a.nc")
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ledger = _ledger.Ledger(tmp_path / "config" / "jobs.sqlite")
+    yield ledger
+    ledger.close()
+
+
+def test_task_key(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    name, request, outputfile = TASK
+    reordered = {"month": "01", "year": [2008]}
+    assert _ledger.task_key(*TASK) == _ledger.task_key(name, reordered, outputfile)
+    assert _ledger.task_key(*TASK) == _ledger.task_key(
+        name, request, str(tmp_path / outputfile)
+    )
+    assert _ledger.task_key(*TASK) != _ledger.task_key(name, request, "b.nc")
+
+
+def test_lazy_creation(ledger):
+    assert ledger.request_id(TASK) is None
+    assert ledger.finished([TASK]) == set()
+    assert not ledger.path.exists()
+
+
+def test_states(ledger, tmp_path):
+    ledger.submitted(TASK, "abc-123")
+    assert ledger.request_id(TASK) == "abc-123"
+
+    ledger.failed(TASK, RuntimeError("Oops"))
+    assert ledger.request_id(TASK) is None  # Failed jobs are not reattached.
+
+    ledger.submitted(TASK, "def-456")
+    ledger.completed(TASK)
+    assert ledger.request_id(TASK) is None
+    assert ledger.finished([TASK]) == {"a.nc"}
+
+    other = (TASK[0], TASK[1], "b.nc")
+    ledger.output_finished(other)
+    assert ledger.finished([TASK, other]) == {"a.nc", "b.nc"}
+
+
+def test_finished(ledger, tmp_path):
+    """Test that outputs are matched by absolute path, and by request."""
+    ledger.output_finished(TASK)
+    absolute = (TASK[0], TASK[1], str(tmp_path / "a.nc"))
+    assert ledger.finished([absolute]) == {absolute[-1]}
+
+    reordered = (TASK[0], {"month": ["01"], "year": ["2008"]}, "a.nc")
+    assert ledger.finished([reordered]) == {"a.nc"}
+    changed = (TASK[0], {"year": [2009], "month": "01"}, "a.nc")
+    assert ledger.finished([changed]) == set()
+    assert ledger.finished([("reanalysis-era5-land", TASK[1], "a.nc")]) == set()
+
+
+def test_persistent(ledger):
+    ledger.submitted(TASK, "abc-123")
+    ledger.close()
+
+    reopened = _ledger.Ledger(ledger.path)
+    assert reopened.request_id(TASK) == "abc-123"
+    reopened.close()
+
+
+def test_default_path(tmp_path):
+    config = tmp_path / "era5cli" / "cds_key.txt"
+    with mock.patch("era5cli._ledger.key_management.ERA5CLI_CONFIG_PATH", config):
+        assert DEFAULT_LEDGER_PATH() == tmp_path / "era5cli" / "jobs.sqlite"
+
+
+def test_reattach():
+    client = mock.MagicMock()
+    remote = _ledger.reattach(client, "abc-123")
+    client.client.get_remote.assert_called_once_with("abc-123")
+    assert remote == client.client.get_remote.return_value
+
+    client.client.get_remote.side_effect = RuntimeError("404 Not Found")
+    assert _ledger.reattach(client, "abc-123") is None
+
+
+def test_threads(ledger):
+    """Test that the ledger can be used from several threads."""
+    tasks = [(TASK[0], {"year": year}, f"{year}.nc") for year in range(20)]
+    Pool(nodes=4).map(ledger.completed, tasks)
+    assert ledger.finished(tasks) == {task[-1] for task in tasks}
+
+
+def test_transfers(ledger, tmp_path):
+    ledger.completed(TASK)  # Not submitted, e.g. taken from the cache
+    assert ledger.transfers() == []
+
+    other = (TASK[0], TASK[1], "b.nc")
+    for task in [TASK, other]:
+        ledger.submitted(task, None)
+        (tmp_path / task[-1]).write_bytes(b"data")
+        ledger.completed(task)
+    transfers = ledger.transfers(TASK[0])
+    assert [nbytes for nbytes, _ in transfers] == [4, 4]
+    assert all(seconds >= 0 for _, seconds in transfers)
+    assert ledger.transfers("reanalysis-era5-land") == []
+
+
+def test_not_resumable(tmp_path):
+    """Test that only transfers are recorded, if the ledger is not resumable."""
+    ledger = _ledger.Ledger(tmp_path / "jobs.sqlite", resumable=False)
+    (tmp_path / "a.nc").write_bytes(b"data")
+    task = (TASK[0], TASK[1], str(tmp_path / "a.nc"))
+    ledger.submitted(task, "abc-123")
+    ledger.completed(task)
+    ledger.failed(task, RuntimeError("Oops"))
+
+    assert ledger.request_id(task) is None
+    assert ledger.finished([task]) == set()
+    assert [nbytes for nbytes, _ in ledger.transfers()] == [4]
+    ledger.close()
+
+
+def test_recent_transfers(ledger, tmp_path):
+    (tmp_path / TASK[-1]).write_bytes(b"data")
+    with mock.patch("era5cli._ledger.MAX_TRANSFERS", 2):
+        for _ in range(3):
+            ledger.submitted(TASK, None)
+            ledger.completed(TASK)
+    connection = ledger._connect()
+    assert connection.execute("SELECT COUNT(*) FROM transfers").fetchone() == (2,)
@@ -0,0 +1,395 @@
+"""Tests for the cost-based request planner."""
+
+import datetime
+import pytest
+import era5cli.inputref as ref
+from era5cli import _planner
+from era5cli import _request_size
+from era5cli._request_size import TooLargeRequestError
+from era5cli.fetch import Fetch
+
+
+ALL_MONTHS = [f"{month:02d}" for month in range(1, 13)]
+ALL_DAYS = [f"{day:02d}" for day in range(1, 32)]
+
+
+def initialize(
+    variables=["2m_temperature"],
+    years=[2008, 2009],
+    period="hourly",
+    land=False,
+    pressurelevels=None,
+    outputformat="netcdf",
+    splitmonths=True,
+    merge=False,
+    pack_variables=False,
+):
+    era5 = Fetch(
+        years=years,
+        months=list(range(1, 13)),
+        days=list(range(1, 32)),
+        hours=list(range(24)),
+        variables=variables,
+        outputformat=outputformat,
+        outputprefix="era5",
+        period=period,
+        ensemble=False,
+        land=land,
+        pressurelevels=pressurelevels,
+        splitmonths=splitmonths,
+        merge=merge,
+        autochunk=True,
+        pack_variables=pack_variables,
+    )
+    era5._extension()
+    return era5
+
+
+def test_split_period_years():
+    era5 = initialize()
+    chunks = _planner.split_period(era5, ["2m_temperature"], [2008, 2009], ALL_MONTHS)
+    assert chunks == [_planner.Chunk([2008, 2009], ALL_MONTHS)]
+
+    # 37 levels * 24 hours * 31 days = 27528 fields per month: 4 months per request.
+    era5 = initialize(variables=["temperature"], pressurelevels=ref.PLEVELS)
+    chunks = _planner.split_period(era5, ["temperature"], [2008], ALL_MONTHS)
+    assert [chunk.months for chunk in chunks] == [
+        ALL_MONTHS[:4],
+        ALL_MONTHS[4:8],
+        ALL_MONTHS[8:],
+    ]
+
+
+def test_split_period_many_years():
+    # 24 hours * 31 days * 12 months = 8928 fields per year: 13 years per request.
+    era5 = initialize()
+    years = list(range(1980, 2020))
+    chunks = _planner.split_period(era5, ["2m_temperature"], years, ALL_MONTHS)
+    assert [chunk.years for chunk in chunks] == [
+        years[:13],
+        years[13:26],
+        years[26:39],
+        years[39:],
+    ]
+
+
+def test_split_period_calendar():
+    # 33 levels * 24 hours = 792 fields per day. With 31-day months only 4 years of
+    # February would fit in a request, but February has 28 or 29 days.
+    era5 = initialize(variables=["temperature"], pressurelevels=ref.PLEVELS[:33])
+    years = list(range(2009, 2019))
+    chunks = _planner.split_period(era5, ["temperature"], years, ["02"])
+    assert [chunk.years for chunk in chunks] == [years[:5], years[5:]]
+
+
+def test_split_period_era5t(monkeypatch):
+    """Test that dates after the end of ERA5T do not count, and are not requested."""
+    monkeypatch.setattr(
+        _request_size, "last_available_date", lambda: datetime.date(2009, 1, 25)
+    )
+    assert _request_size.count_days(2009, "01", ALL_DAYS) == 25
+    assert _request_size.count_days(2009, 2, ALL_DAYS) == 0
+    assert _request_size.count_days(2008, 12) == 1  # Monthly data
+    assert _request_size.count_days(2009, 1) == 0
+
+    era5 = initialize(land=True)
+    era5.hours = era5.hours * 2
+    chunks = _planner.split_period(era5, ["skin_temperature"], [2009], ["01"])
+    assert chunks == [
+        _planner.Chunk([2009], ["01"], ALL_DAYS[:20]),
+        _planner.Chunk([2009], ["01"], ALL_DAYS[20:25]),
+    ]
+
+
+def test_split_period_days():
+    # ERA5-Land: 24 * 31 = 744 fields per month, so no months can be combined.
+    era5 = initialize(land=True)
+    chunks = _planner.split_period(era5, ["skin_temperature"], [2008], ["01", "02"])
+    assert chunks == [
+        _planner.Chunk([2008], ["01"]),
+        _planner.Chunk([2008], ["02"]),
+    ]
+
+    era5.hours = era5.hours * 2  # Pretend there are 48 hours in a day.
+    chunks = _planner.split_period(era5, ["skin_temperature"], [2008], ["01"])
+    assert chunks == [
+        _planner.Chunk([2008], ["01"], ALL_DAYS[:20]),
+        _planner.Chunk([2008], ["01"], ALL_DAYS[20:]),
+    ]
+
+    era5.hours = era5.hours * 25
+    with pytest.raises(TooLargeRequestError):
+        _planner.split_period(era5, ["skin_temperature"], [2008], ["01"])
+
+
+def test_plan_packed_months():
+    era5 = initialize(variables=["2m_temperature", "runoff"])
+    outputs = era5._planned_outputs()
+    jobs = _planner.plan(era5, outputs)
+
+    # One request per variable, split into 2 * 12 monthly files
+    assert len(jobs) == 2
+    assert [job.variables for job in jobs] == [["2m_temperature"], ["runoff"]]
+    assert jobs[0].chunks == [_planner.Chunk([2008, 2009], ALL_MONTHS)]
+    assert len(jobs[0].outputs) == 24
+    assert not jobs[0].direct
+    assert jobs[0].targets == ["era5_2m_temperature_2008-01_hourly.nc.chunk0"]
+
+
+def test_plan_chunked_year():
+    era5 = initialize(land=True, splitmonths=False)
+    jobs = _planner.plan(era5, era5._planned_outputs())
+
+    # Every yearly file is concatenated from 12 monthly requests
+    assert len(jobs) == 2
+    assert len(jobs[0].chunks) == 12
+    assert jobs[0].outputs[0].filename == "era5-land_2m_temperature_2008_hourly.nc"
+    assert jobs[0].targets[-1] == "era5-land_2m_temperature_2008_hourly.nc.chunk11"
+
+
+def test_plan_direct():
+    era5 = initialize(land=True)
+    jobs = _planner.plan(era5, era5._planned_outputs())
+    assert len(jobs) == 24
+    assert all(job.direct for job in jobs)
+    assert jobs[0].targets == ["era5-land_2m_temperature_2008-01_hourly.nc"]
+
+
+def test_plan_no_packing():
+    era5 = initialize(outputformat="grib")
+    jobs = _planner.plan(era5, era5._planned_outputs(), pack=False)
+    assert len(jobs) == 24
+    assert all(job.direct for job in jobs)
+
+
+def test_plan_per_year():
+    era5 = initialize(splitmonths=False, merge=True)
+    jobs = _planner.plan(era5, era5._planned_outputs(), pack=False, per_year=True)
+    assert len(jobs) == 1
+    assert jobs[0].chunks == [
+        _planner.Chunk([2008], ALL_MONTHS),
+        _planner.Chunk([2009], ALL_MONTHS),
+    ]
+    assert jobs[0].targets == [
+        "era5_2m_temperature_2008-2009_hourly.nc.chunk0",
+        "era5_2m_temperature_2008-2009_hourly.nc.chunk1",
+    ]
+
+
+def test_plan_incomplete_grid():
+    era5 = initialize()
+    outputs = era5._planned_outputs()
+    del outputs[13]  # February 2009 already exists.
+    jobs = _planner.plan(era5, outputs)
+
+    assert [job.chunks for job in jobs] == [
+        [_planner.Chunk([2008], ALL_MONTHS)],
+        [_planner.Chunk([2009], ALL_MONTHS[:1] + ALL_MONTHS[2:])],
+    ]
+    assert sum(len(job.outputs) for job in jobs) == 23
+
+
+def test_bundle_variables():
+    era5 = initialize(
+        variables=["2m_temperature", "temperature", "runoff", "geopotential"],
+        pressurelevels=ref.PLEVELS,
+    )
+    bundles = _planner.bundle_variables(era5, era5.variables)
+    assert bundles == [["2m_temperature", "runoff"], ["temperature", "geopotential"]]
+
+    # ERA5-Land: a month of two variables is already too large for a request.
+    era5 = initialize(variables=["2m_temperature", "runoff"], land=True)
+    bundles = _planner.bundle_variables(era5, era5.variables)
+    assert bundles == [["2m_temperature"], ["runoff"]]
+
+
+def test_plan_pack_variables():
+    era5 = initialize(
+        variables=["2m_temperature", "runoff"],
+        splitmonths=False,
+        pack_variables=True,
+    )
+    jobs = _planner.plan(era5, era5._planned_outputs(), pack_variables=True)
+
+    # 2 variables * 2 years * 8928 fields fit in a single request
+    assert len(jobs) == 1
+    assert jobs[0].variables == ["2m_temperature", "runoff"]
+    assert jobs[0].chunks == [_planner.Chunk([2008, 2009], ALL_MONTHS)]
+    assert len(jobs[0].outputs) == 4
+
+
+def test_plan_pack_variables_no_time_packing():
+    era5 = initialize(variables=["2m_temperature", "runoff"], pack_variables=True)
+    jobs = _planner.plan(era5, era5._planned_outputs(), pack=False, pack_variables=True)
+
+    # A request per month, split into a file per variable
+    assert len(jobs) == 24
+    assert jobs[0].variables == ["2m_temperature", "runoff"]
+    assert [out.filename for out in jobs[0].outputs] == [
+        "era5_2m_temperature_2008-01_hourly.nc",
+        "era5_runoff_2008-01_hourly.nc",
+    ]
+
+
+def test_split_range():
+    era5 = initialize()
+    era5._set_range("2001-11-15", "2003-02-10")
+    chunks = _planner.split_range(era5, ["2m_temperature"])
+    assert chunks == [
+        _planner.Chunk([2001], ["11"], ALL_DAYS[14:30]),
+        _planner.Chunk([2001], ["12"]),
+        _planner.Chunk([2002], ALL_MONTHS),
+        _planner.Chunk([2003], ["01"]),
+        _planner.Chunk([2003], ["02"], ALL_DAYS[:10]),
+    ]
+
+
+def test_split_range_hours():
+    era5 = initialize()
+    era5._set_range("2001-11-15T18:00", "2001-12-31T05:00")
+    hours = [f"{hour:02d}:00" for hour in range(24)]
+    chunks = _planner.split_range(era5, ["2m_temperature"])
+    assert chunks == [
+        _planner.Chunk([2001], ["11"], ["15"], hours[18:]),
+        _planner.Chunk([2001], ["11"], ALL_DAYS[15:30]),
+        _planner.Chunk([2001], ["12"], ALL_DAYS[:30]),
+        _planner.Chunk([2001], ["12"], ["31"], hours[:6]),
+    ]
+
+    era5._set_range("2001-11-15T06:00", "2001-11-15T08:00")
+    assert _planner.split_range(era5, ["2m_temperature"]) == [
+        _planner.Chunk([2001], ["11"], ["15"], hours[6:9])
+    ]
+
+
+def test_split_range_hours_outside():
+    """Test that a partial day without any of the requested hours is left out."""
+    era5 = initialize()
+    era5.hours = ["00:00", "06:00", "12:00", "18:00"]
+    era5._set_range("2001-11-15T20", "2001-11-17T03")
+    assert _planner.split_range(era5, ["2m_temperature"]) == [
+        _planner.Chunk([2001], ["11"], ["16"]),
+        _planner.Chunk([2001], ["11"], ["17"], ["00:00"]),
+    ]
+
+    era5._set_range("2001-11-15T19", "2001-11-16T05")
+    era5.hours = ["12:00", "18:00"]
+    with pytest.raises(ValueError, match="None of the requested hours"):
+        _planner.split_range(era5, ["2m_temperature"])
+
+
+def test_range_selection():
+    era5 = initialize()
+    era5.hours = ["00:00", "06:00", "12:00", "18:00"]
+    era5._set_range("2001-11-30T20", "2001-12-02T03")
+    assert _planner.range_selection(era5) == (
+        ["12"],
+        ["01", "02"],
+        ["00:00", "06:00", "12:00", "18:00"],
+    )
+
+    era5._set_range("2001-11-15T06", "2001-11-15T12")
+    assert _planner.range_selection(era5) == (["11"], ["15"], ["06:00", "12:00"])
+
+    era5._set_range("2001-11-15", "2003-02-10")
+    months, days, hours = _planner.range_selection(era5)
+    assert (months, days, hours) == (ALL_MONTHS, ALL_DAYS, era5.hours)
+
+    era5 = initialize(period="monthly")
+    era5._set_range("2001-11-15", "2002-02-10")
+    assert _planner.range_selection(era5) == (
+        ["01", "02", "11", "12"],
+        None,
+        era5.hours,
+    )
+
+
+def test_split_range_land():
+    # ERA5-Land: 24 * 31 = 744 fields per month, so 16 + 30 days are split.
+    era5 = initialize(land=True)
+    era5._set_range("2001-11-01", "2002-01-16")
+    chunks = _planner.split_range(era5, ["skin_temperature"])
+    assert chunks == [
+        _planner.Chunk([2001], ["11"]),
+        _planner.Chunk([2001], ["12"]),
+        _planner.Chunk([2002], ["01"], ALL_DAYS[:16]),
+    ]
+
+
+def test_level_groups():
+    # A year of all 37 levels is too large, a year of 13 levels is not.
+    era5 = initialize(
+        variables=["temperature"], pressurelevels=ref.PLEVELS, splitmonths=False
+    )
+    jobs = _planner.plan(era5, era5._planned_outputs(), pack=False)
+    assert len(jobs) == 2
+    assert jobs[0].level_groups and not jobs[0].direct
+    assert [chunk.levels for chunk in jobs[0].chunks] == [
+        ref.PLEVELS[:13],
+        ref.PLEVELS[13:26],
+        ref.PLEVELS[26:],
+    ]
+    assert all(chunk.years == [2008] for chunk in jobs[0].chunks)
+
+    # Single level variables, and periods that fit, are not split into levels.
+    assert _planner.level_groups(era5, ["2m_temperature"], []) is None
+    era5 = initialize(variables=["temperature"], pressurelevels=ref.PLEVELS)
+    jobs = _planner.plan(era5, era5._planned_outputs(), pack=False)
+    assert all(job.direct for job in jobs)
+
+
+def test_split_levels():
+    era5 = initialize(
+        variables=["temperature"], pressurelevels=[500, 850], splitmonths=False
+    )
+    era5.split_levels = True
+    outputs = era5._planned_outputs()
+    assert [(out.levels, out.years) for out in outputs] == [
+        ([500], [2008]),
+        ([500], [2009]),
+        ([850], [2008]),
+        ([850], [2009]),
+    ]
+    # The years of each level are packed into a single request.
+    jobs = _planner.plan(era5, outputs)
+    assert [[chunk.levels for chunk in job.chunks] for job in jobs] == [
+        [[500]],
+        [[850]],
+    ]
+    assert [len(job.outputs) for job in jobs] == [2, 2]
+
+
+def test_tile_area():
+    tiles = _planner.tile_area([60.05, -10, 35, 30], 0.1, 4)
+    assert tiles == [
+        [60.05, -10, 47.5, 9.9],
+        [60.05, 10.0, 47.5, 30],
+        [47.4, -10, 35, 9.9],
+        [47.4, 10.0, 35, 30],
+    ]
+    # The longer side is split into more parts.
+    assert _planner.tile_area([60, -10, 50, 30], 0.1, 2) == [
+        [60, -10, 50, 9.9],
+        [60, 10.0, 50, 30],
+    ]
+    assert _planner.tile_area([60, -10, 20, 0], 0.1, 2) == [
+        [60, -10, 40.0, 0],
+        [39.9, -10, 20, 0],
+    ]
+    # Across the antimeridian, and smaller than the number of tiles.
+    assert _planner.tile_area([60, 170, 59.9, -170], 0.1, 3) == [
+        [60, 170, 60.0, -170],
+        [59.9, 170, 59.9, -170],
+    ]
+
+
+def test_tile_job():
+    era5 = initialize(land=True, splitmonths=False, years=[2008])
+    era5.area = [60, -10, 50, 30]
+    jobs = _planner.plan(era5, era5._planned_outputs(), pack=False)
+    tiled = _planner.tile(jobs[0], _planner.tile_area(era5.area, 0.1, 2))
+    assert tiled.n_tiles == 2
+    assert len(tiled.chunks) == 2 * len(jobs[0].chunks)
+    assert tiled.targets[0].endswith(".tile0")
+    assert tiled.untiled() == jobs[0]
+    assert _planner.tile(jobs[0], [era5.area]) == jobs[0]
@@ -0,0 +1,378 @@
+"""Tests for the local splitting and concatenation of downloaded files."""
+
+import datetime
+import zipfile
+import netCDF4
+import numpy as np
+import pytest
+from era5cli import _postprocess
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def write_netcdf(
+    fname,
+    dates,
+    fmt="NETCDF4",
+    timedim="valid_time",
+    offset=0.0,
+    fields={"t2m": "2 metre temperature"},
+):
+    """Write a small netCDF file, similar to the files of the CDS."""
+    with netCDF4.Dataset(fname, "w", format=fmt) as ds:
+        ds.history = "made by the CDS"
+        ds.createDimension(timedim, len(dates))
+        ds.createDimension("latitude", 2)
+        ds.createDimension("longitude", 3)
+
+        dtype = "i8" if fmt == "NETCDF4" else "f8"
+        time = ds.createVariable(timedim, dtype, (timedim,))
+        time.units = "seconds since 1970-01-01"
+        time.calendar = "proleptic_gregorian"
+        time[:] = [(date - EPOCH).total_seconds() for date in dates]
+
+        lat = ds.createVariable("latitude", "f8", ("latitude",))
+        lat[:] = [10.0, 9.75]
+
+        expver = ds.createVariable("expver", "i4", (timedim,))
+        expver[:] = 1
+
+        kwargs = {"zlib": True, "complevel": 1} if fmt == "NETCDF4" else {}
+        for i, (name, long_name) in enumerate(fields.items()):
+            dims = (timedim, "latitude", "longitude")
+            var = ds.createVariable(name, "f4", dims, fill_value=-999, **kwargs)
+            var.units = "K"
+            var.long_name = long_name
+            var[:] = offset + 1000 * i + np.arange(len(dates) * 6).reshape(-1, 2, 3)
+
+
+def read(fname, timedim="valid_time", name="t2m"):
+    with netCDF4.Dataset(fname) as ds:
+        dates = netCDF4.num2date(ds[timedim][:], ds[timedim].units)
+        return [(d.year, d.month, d.day) for d in dates], ds[name][:]
+
+
+def days(year, month, n):
+    return [datetime.datetime(year, month, day) for day in range(1, n + 1)]
+
+
+@pytest.mark.parametrize("fmt", ["NETCDF4", "NETCDF3_64BIT_OFFSET"])
+def test_concatenate_netcdf(tmp_path, monkeypatch, fmt):
+    first, second = tmp_path / "a.nc.chunk0", tmp_path / "a.nc.chunk1"
+    write_netcdf(first, days(2008, 1, 3), fmt=fmt)
+    write_netcdf(second, days(2008, 2, 2), fmt=fmt, offset=100)
+
+    output = tmp_path / "a.nc"
+    monkeypatch.setattr(_postprocess, "BLOCK_STEPS", 2)  # Copy in several blocks
+    _postprocess.concatenate([first, second], str(output))
+
+    dates, data = read(output)
+    assert dates == [
+        (2008, 1, 1),
+        (2008, 1, 2),
+        (2008, 1, 3),
+        (2008, 2, 1),
+        (2008, 2, 2),
+    ]
+    assert data.shape == (5, 2, 3)
+    assert data[2, 1, 2] == 17
+    assert data[3, 0, 0] == 100
+    with netCDF4.Dataset(output) as ds:
+        assert ds.data_model == fmt
+        assert ds.history == "made by the CDS"
+        assert ds["t2m"].units == "K"
+        assert ds["t2m"]._FillValue == -999
+        assert list(ds["latitude"][:]) == [10.0, 9.75]
+        if fmt == "NETCDF4":
+            assert ds["t2m"].filters()["zlib"]
+
+
+def test_merge_steps(tmp_path, monkeypatch):
+    stored, added = tmp_path / "a.nc", tmp_path / "a.nc.chunk0"
+    write_netcdf(stored, days(2008, 1, 5)[::2])  # Days 1, 3 and 5
+    write_netcdf(added, days(2008, 1, 6)[1::2], offset=100)  # Days 2, 4 and 6
+    with netCDF4.Dataset(added, "a") as ds:
+        # Time counted in other units than the stored file.
+        ds["valid_time"].units = "hours since 2008-01-01"
+        ds["valid_time"][:] = [24, 72, 120]
+
+    output = tmp_path / "a.nc"  # Merged into the stored file itself.
+    monkeypatch.setattr(_postprocess, "BLOCK_STEPS", 2)
+    _postprocess.merge_steps([stored, added], str(output), "b")
+
+    dates, data = read(output)
+    assert dates == [(2008, 1, day) for day in range(1, 7)]
+    assert [data[i, 0, 0] for i in range(6)] == [0, 100, 6, 106, 12, 112]
+    with netCDF4.Dataset(output) as ds:
+        assert ds.history == "b\nmade by the CDS"
+        assert ds["valid_time"].units == "seconds since 1970-01-01"
+
+
+@pytest.mark.parametrize("suffix", [".nc", ".grb"])
+def test_interrupted(tmp_path, monkeypatch, suffix):
+    """Test that an output is only replaced once it was written completely."""
+    first, second = tmp_path / f"a{suffix}.chunk0", tmp_path / f"a{suffix}.chunk1"
+    write_netcdf(first, days(2008, 1, 3))
+    write_netcdf(second, days(2008, 2, 2))
+    output = tmp_path / f"a{suffix}"
+    output.write_bytes(b"old")
+
+    def interrupt(*args):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(_postprocess, "_copy_steps", interrupt)
+    monkeypatch.setattr(_postprocess.shutil, "copyfileobj", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        _postprocess.concatenate([first, second], str(output))
+    assert output.read_bytes() == b"old"
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        [first.name, second.name, output.name]
+    )
+
+
+def test_concatenate_old_time_name(tmp_path):
+    first, second = tmp_path / "a.nc.chunk0", tmp_path / "a.nc.chunk1"
+    write_netcdf(first, days(2008, 1, 1), timedim="time")
+    write_netcdf(second, days(2008, 1, 1), timedim="time")
+    _postprocess.concatenate([first, second], str(tmp_path / "a.nc"))
+    dates, _ = read(tmp_path / "a.nc", timedim="time")
+    assert len(dates) == 2
+
+
+@pytest.mark.parametrize("fmt", ["NETCDF3_64BIT_OFFSET", "NETCDF4"])
+def test_history_at_creation(tmp_path, fmt):
+    first, second = tmp_path / "a.nc.chunk0", tmp_path / "a.nc.chunk1"
+    write_netcdf(first, days(2008, 1, 1), fmt=fmt)
+    write_netcdf(second, days(2008, 1, 1), fmt=fmt)
+    _postprocess.concatenate([first, second], str(tmp_path / "a.nc"), "b\na")
+    with netCDF4.Dataset(tmp_path / "a.nc") as ds:
+        assert ds.history == "b\na\nmade by the CDS"
+
+    _postprocess.split_by_period(
+        str(tmp_path / "a.nc"), {str(tmp_path / "b.nc"): ([2008], ["01"])}, "c"
+    )
+    with netCDF4.Dataset(tmp_path / "b.nc") as ds:
+        assert ds.history == "c\nb\na\nmade by the CDS"
+
+
+def write_levels(fname, levels, n_steps=30, fmt="NETCDF4"):
+    """Write a small netCDF file of a pressure level variable, like the CDS."""
+    with netCDF4.Dataset(fname, "w", format=fmt) as ds:
+        ds.createDimension("valid_time", n_steps)
+        ds.createDimension("pressure_level", len(levels))
+        ds.createDimension("latitude", 2)
+        time = ds.createVariable("valid_time", "f8", ("valid_time",))
+        time.units = "seconds since 1970-01-01"
+        time[:] = np.arange(n_steps) * 3600
+        level = ds.createVariable("pressure_level", "f8", ("pressure_level",))
+        level[:] = levels
+        dims = ("valid_time", "pressure_level", "latitude")
+        var = ds.createVariable("t", "f4", dims, fill_value=-999)
+        var[:] = np.broadcast_to(
+            np.array(levels, dtype="f4")[None, :, None], (n_steps, len(levels), 2)
+        )
+
+
+@pytest.mark.parametrize("fmt", ["NETCDF4", "NETCDF3_64BIT_OFFSET"])
+def test_merge_levels(tmp_path, fmt):
+    # The groups are merged in the (descending) order of the levels.
+    groups = [[300, 200], [1000, 850, 500], [100]]
+    inputs = [str(tmp_path / f"a.nc.chunk{i}") for i in range(len(groups))]
+    for fname, levels in zip(inputs, groups):
+        write_levels(fname, levels, fmt=fmt)
+    _postprocess.merge_levels(inputs, str(tmp_path / "a.nc"), "a")
+
+    with netCDF4.Dataset(tmp_path / "a.nc") as ds:
+        expected = [1000, 850, 500, 300, 200, 100]
+        assert list(ds["pressure_level"][:]) == expected
+        assert len(ds["valid_time"]) == 30  # More than a block of time steps
+        assert (ds["t"][:] == np.array(expected)[None, :, None]).all()
+        assert ds.history == "a"
+
+
+def write_tile(fname, lats, lons, n_steps=30):
+    """Write a small netCDF file of a tile of an area, like the CDS."""
+    with netCDF4.Dataset(fname, "w") as ds:
+        ds.createDimension("valid_time", n_steps)
+        ds.createDimension("latitude", len(lats))
+        ds.createDimension("longitude", len(lons))
+        time = ds.createVariable("valid_time", "i8", ("valid_time",))
+        time.units = "seconds since 1970-01-01"
+        time[:] = np.arange(n_steps) * 3600
+        ds.createVariable("latitude", "f8", ("latitude",))[:] = lats
+        ds.createVariable("longitude", "f8", ("longitude",))[:] = lons
+        dims = ("valid_time", "latitude", "longitude")
+        var = ds.createVariable("t2m", "f4", dims, fill_value=-999, zlib=True)
+        var[:] = np.add.outer(np.arange(n_steps), np.add.outer(lats, lons))
+
+
+def test_stitch(tmp_path):
+    lats = np.round(np.arange(60, 59.45, -0.1), 1)
+    lons = np.round(np.arange(-1, 0.25, 0.1), 1)
+    tiles = {
+        "a.nc.tile0": (lats[:3], lons[:7]),
+        "a.nc.tile1": (lats[:3], lons[7:]),
+        "a.nc.tile2": (lats[3:], lons[:7]),
+        "a.nc.tile3": (lats[3:], lons[7:]),
+    }
+    inputs = []
+    for name, (tile_lats, tile_lons) in reversed(tiles.items()):
+        inputs.append(str(tmp_path / name))
+        write_tile(inputs[-1], tile_lats, tile_lons)
+    _postprocess.stitch(inputs, str(tmp_path / "a.nc"), "a")
+
+    with netCDF4.Dataset(tmp_path / "a.nc") as ds:
+        assert np.allclose(ds["latitude"][:], lats)
+        assert np.allclose(ds["longitude"][:], lons)
+        expected = np.add.outer(np.arange(30), np.add.outer(lats, lons))
+        assert np.allclose(ds["t2m"][:], expected)
+        assert ds.history == "a"
+
+
+def test_concatenate_bytes(tmp_path):
+    first, second = tmp_path / "a.grb.chunk0", tmp_path / "a.grb.chunk1"
+    first.write_bytes(b"GRIB1234")
+    second.write_bytes(b"GRIB5678")
+    _postprocess.concatenate([first, second], str(tmp_path / "a.grb"))
+    assert (tmp_path / "a.grb").read_bytes() == b"GRIB1234GRIB5678"
+
+
+def test_split_by_period(tmp_path):
+    packed = tmp_path / "packed.nc"
+    write_netcdf(packed, days(2008, 12, 2) + days(2009, 1, 3) + days(2009, 2, 1))
+
+    outputs = {
+        str(tmp_path / "dec.nc"): ([2008], ["12"]),
+        str(tmp_path / "2009.nc"): ([2009], ["01", "02"]),
+        str(tmp_path / "jan.nc"): ([2009], ["01"]),
+    }
+    _postprocess.split_by_period(str(packed), outputs)
+
+    dates, data = read(tmp_path / "dec.nc")
+    assert dates == [(2008, 12, 1), (2008, 12, 2)]
+    assert data[0, 0, 0] == 0
+
+    dates, data = read(tmp_path / "2009.nc")
+    assert len(dates) == 4
+    assert data[0, 0, 0] == 12
+
+    dates, data = read(tmp_path / "jan.nc")
+    assert dates == [(2009, 1, 1), (2009, 1, 2), (2009, 1, 3)]
+
+
+def test_runs():
+    assert _postprocess._runs([]) == []
+    assert _postprocess._runs([0, 1, 2, 5, 6, 9]) == [(0, 3), (5, 2), (9, 1)]
+
+
+def test_match_variables(tmp_path):
+    fields = {
+        "u10": "10 metre U wind component",
+        "v10": "10 metre V wind component",
+        "t2m": "2 metre temperature",
+        "tp": "Total precipitation",
+    }
+    write_netcdf(tmp_path / "a.nc", days(2008, 1, 1), fields=fields)
+    variables = [
+        "total_precipitation",
+        "10m_v_component_of_wind",
+        "2m_temperature",
+        "10m_u_component_of_wind",
+    ]
+    with netCDF4.Dataset(tmp_path / "a.nc") as ds:
+        matches = _postprocess.match_variables(
+            variables, {name: ds[name] for name in fields}
+        )
+        assert matches == {
+            "total_precipitation": "tp",
+            "10m_v_component_of_wind": "v10",
+            "2m_temperature": "t2m",
+            "10m_u_component_of_wind": "u10",
+        }
+
+        with pytest.raises(ValueError, match="Expected 3 variables"):
+            _postprocess.match_variables(variables[:3], {"t2m": ds["t2m"]})
+
+
+@pytest.mark.parametrize(
+    "fields, error",
+    [
+        # A description that only resembles the variable is no match.
+        ({"var1": "Total precipitation rate"}, "matches none of the fields"),
+        (
+            {"tp": "Total precipitation", "tp_1": "Total precipitation"},
+            "matches 2 of the fields",
+        ),
+    ],
+)
+def test_match_variables_not_unique(tmp_path, fields, error):
+    write_netcdf(tmp_path / "a.nc", days(2008, 1, 1), fields=fields)
+    variables = ["total_precipitation", "2m_temperature"][: len(fields)]
+    with netCDF4.Dataset(tmp_path / "a.nc") as ds:
+        with pytest.raises(ValueError, match=error):
+            _postprocess.match_variables(
+                variables, {name: ds[name] for name in fields}
+            )
+
+
+def test_match_variables_short_name(tmp_path):
+    """Test that fields are found by their GRIB short name, if not by their name."""
+    fields = {"var167": "", "var165": ""}
+    write_netcdf(tmp_path / "a.nc", days(2008, 1, 1), fields=fields)
+    with netCDF4.Dataset(tmp_path / "a.nc", "a") as ds:
+        ds["var167"].GRIB_shortName = "2t"
+        ds["var165"].GRIB_cfVarName = "u10"
+        matches = _postprocess.match_variables(
+            ["10m_u_component_of_wind", "2m_temperature"],
+            {name: ds[name] for name in fields},
+        )
+    assert matches == {"10m_u_component_of_wind": "var165", "2m_temperature": "var167"}
+
+
+def test_split_by_variable(tmp_path):
+    packed = tmp_path / "packed.nc"
+    fields = {"t2m": "2 metre temperature", "skt": "Skin temperature"}
+    write_netcdf(packed, days(2008, 1, 2) + days(2008, 2, 1), fields=fields)
+
+    outputs = {
+        str(tmp_path / "t2m_jan.nc"): ("2m_temperature", [2008], ["01"]),
+        str(tmp_path / "t2m_feb.nc"): ("2m_temperature", [2008], ["02"]),
+        str(tmp_path / "skt.nc"): ("skin_temperature", [2008], ["01", "02"]),
+    }
+    _postprocess.split_by_variable(str(packed), outputs)
+
+    dates, data = read(tmp_path / "t2m_jan.nc")
+    assert dates == [(2008, 1, 1), (2008, 1, 2)]
+    assert data[1, 0, 0] == 6
+    with netCDF4.Dataset(tmp_path / "t2m_jan.nc") as ds:
+        assert "skt" not in ds.variables
+        assert "expver" in ds.variables
+
+    dates, data = read(tmp_path / "skt.nc", name="skt")
+    assert len(dates) == 3
+    assert data[0, 0, 0] == 1000
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "packed.nc",
+        "skt.nc",
+        "t2m_feb.nc",
+        "t2m_jan.nc",
+    ]
+
+
+def test_split_by_variable_zip(tmp_path):
+    instant, accum = tmp_path / "instant.nc", tmp_path / "accum.nc"
+    write_netcdf(instant, days(2008, 1, 2), fields={"t2m": "2 metre temperature"})
+    write_netcdf(accum, days(2008, 1, 2), fields={"tp": "Total precipitation"})
+    packed = tmp_path / "packed.nc"
+    with zipfile.ZipFile(packed, "w") as archive:
+        archive.write(instant, "data_stream-oper_stepType-instant.nc")
+        archive.write(accum, "data_stream-oper_stepType-accum.nc")
+
+    outputs = {
+        str(tmp_path / "t2m.nc"): ("2m_temperature", [2008], ["01"]),
+        str(tmp_path / "tp.nc"): ("total_precipitation", [2008], ["01"]),
+    }
+    _postprocess.split_by_variable(str(packed), outputs)
+    assert len(read(tmp_path / "t2m.nc")[0]) == 2
+    assert len(read(tmp_path / "tp.nc", name="tp")[0]) == 2
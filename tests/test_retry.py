@@ -0,0 +1,106 @@
+"""Tests for the classification and retrying of failed requests."""
+
+import unittest.mock as mock
+import pytest
+import requests
+from era5cli import _retry
+
+
+TASK = ("reanalysis-era5-single-levels", {"year": 2008}, "era5_2008.nc")
+
+
+def http_error(status_code, details=""):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(f"{status_code} Error {details}", response=response)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep():
+    with mock.patch("era5cli._retry.time.sleep") as _fixture:
+        yield _fixture
+
+
+@pytest.mark.parametrize(
+    "error, kind",
+    [
+        (http_error(429), _retry.REJECTED),
+        (RuntimeError("Too many requests for this user"), _retry.REJECTED),
+        (RuntimeError("Queued requests are temporarily limited"), _retry.REJECTED),
+        (http_error(503), _retry.TRANSIENT),
+        (requests.ConnectionError("Connection reset"), _retry.TRANSIENT),
+        (requests.exceptions.ChunkedEncodingError("Broken"), _retry.TRANSIENT),
+        (http_error(401), _retry.PERMANENT),
+        # "401" in a URL, UUID or byte count is not a rejected login.
+        (requests.ConnectionError("Reset after 4011 bytes"), _retry.TRANSIENT),
+        (http_error(503, "for url: /tasks/a401b"), _retry.TRANSIENT),
+        (RuntimeError("There is no data matching your request"), _retry.PERMANENT),
+        (RuntimeError("Request is too large: cost limits exceeded"), _retry.PERMANENT),
+        (ValueError("Something unexpected"), _retry.PERMANENT),
+    ],
+)
+def test_classify(error, kind):
+    assert _retry.classify(error) == kind
+
+
+def test_backoff_delay():
+    with mock.patch("era5cli._retry.random.uniform", side_effect=lambda a, b: b):
+        assert [_retry.backoff_delay(i) for i in range(1, 5)] == [10, 20, 40, 80]
+        assert _retry.backoff_delay(20) == _retry.BACKOFF_MAX
+    with mock.patch("era5cli._retry.random.uniform", side_effect=lambda a, b: a):
+        assert _retry.backoff_delay(1) == 5
+
+
+def test_call_success():
+    work = mock.MagicMock()
+    assert _retry.call(work, *TASK) is None
+    work.assert_called_once_with(*TASK)
+
+
+def test_call_retries_transient(no_sleep, capsys):
+    work = mock.MagicMock(side_effect=[http_error(502), http_error(504), None])
+    assert _retry.call(work, *TASK) is None
+    assert work.call_count == 3
+    assert no_sleep.call_count == 2
+    assert "Request for era5_2008.nc failed" in capsys.readouterr().out
+
+
+def test_call_gives_up():
+    work = mock.MagicMock(side_effect=requests.ConnectionError("Connection reset"))
+    failure = _retry.call(work, *TASK)
+    assert work.call_count == _retry.MAX_ATTEMPTS
+    assert failure.task == TASK
+    assert failure.attempts == _retry.MAX_ATTEMPTS
+
+
+def test_call_permanent():
+    work = mock.MagicMock(side_effect=RuntimeError("There is no data matching"))
+    failure = _retry.call(work, *TASK)
+    assert work.call_count == 1
+    assert failure.attempts == 1
+
+
+def test_call_rejections():
+    work = mock.MagicMock(side_effect=[http_error(429), None])
+    assert _retry.call(work, *TASK) is None
+
+    # Rejections can be left to the caller
+    work = mock.MagicMock(side_effect=[http_error(429), None])
+    failure = _retry.call(work, *TASK, rejections=False)
+    assert _retry.classify(failure.error) == _retry.REJECTED
+
+
+def test_summarize():
+    _retry.summarize([], 10)  # Nothing failed, nothing raised.
+
+    failures = [
+        _retry.Failure(TASK, RuntimeError("There is no data\nmore info"), 1),
+        _retry.Failure(TASK[:2] + ("b.nc",), http_error(503), 5),
+    ]
+    with pytest.raises(_retry.FailedRequestsError) as error:
+        _retry.summarize(failures, 10)
+    assert str(error.value).splitlines() == [
+        "2 of 10 request(s) failed:",
+        "  era5_2008.nc: RuntimeError: There is no data (permanent, 1 attempt(s))",
+        "  b.nc: HTTPError: 503 Error (transient, 5 attempt(s))",
+    ]
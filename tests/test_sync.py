@@ -0,0 +1,250 @@
+"""Tests for finding missing and incomplete output files."""
+
+import datetime
+import os
+import unittest.mock as mock
+import pytest
+from era5cli import _planner
+from era5cli import _sync
+from era5cli.fetch import Fetch
+from tests.test_postprocess import read
+from tests.test_postprocess import write_netcdf
+
+
+ALL_DAYS = [f"{day:02d}" for day in range(1, 32)]
+
+
+def initialize(
+    period="hourly",
+    outputformat="netcdf",
+    sync=True,
+    hours=[0, 12],
+    ensemble=False,
+    variables=["2m_temperature"],
+    pressurelevels=None,
+):
+    era5 = Fetch(
+        years=[2008],
+        months=[1, 2],
+        days=list(range(1, 32)),
+        hours=hours,
+        variables=variables,
+        outputformat=outputformat,
+        outputprefix="era5",
+        period=period,
+        ensemble=ensemble,
+        pressurelevels=pressurelevels,
+        splitmonths=True,
+        sync=sync,
+    )
+    era5._extension()
+    return era5
+
+
+def steps(year, month, ndays, hours=(0, 12)):
+    return [
+        datetime.datetime(year, month, day, hour)
+        for day in range(1, ndays + 1)
+        for hour in hours
+    ]
+
+
+@pytest.fixture
+def outputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    era5 = initialize()
+    return era5, era5._planned_outputs()
+
+
+def test_expected_steps(outputs):
+    era5, (january, february) = outputs
+    assert len(_sync.expected_steps(era5, january)) == 31 * 2
+    assert len(_sync.expected_steps(era5, february)) == 29 * 2  # Leap year
+
+    monthly = initialize(period="monthly")
+    assert _sync.expected_steps(monthly, january) == {(2008, 1)}
+
+
+def test_expected_steps_ensemble(outputs):
+    _, (january, _) = outputs
+    era5 = initialize(hours=[0, 1, 2, 3], ensemble=True)
+    assert {step[3] for step in _sync.expected_steps(era5, january)} == {0, 3}
+
+
+@mock.patch(
+    "era5cli._request_size.last_available_date",
+    return_value=datetime.date(2008, 2, 10),
+)
+def test_expected_steps_available(last_available_date, outputs):
+    """Test that time steps which are not published yet are not expected."""
+    era5, (january, february) = outputs
+    assert len(_sync.expected_steps(era5, january)) == 31 * 2
+    assert len(_sync.expected_steps(era5, february)) == 10 * 2
+
+    monthly = initialize(period="monthly")
+    assert _sync.expected_steps(monthly, january) == {(2008, 1)}
+    assert _sync.expected_steps(monthly, february) == set()
+
+
+def test_expected_steps_range(outputs):
+    era5, _ = outputs
+    era5._set_range("2008-01-30T12:00", "2008-02-02")
+    (output,) = era5._planned_outputs()
+    assert _sync.expected_steps(era5, output) == set(
+        (step.year, step.month, step.day, step.hour)
+        for step in steps(2008, 1, 31)[-3:] + steps(2008, 2, 2)
+    )
+
+    monthly = initialize(period="monthly")
+    monthly._set_range("2008-01-30", "2008-02-02")
+    (output,) = monthly._planned_outputs()
+    assert _sync.expected_steps(monthly, output) == {(2008, 1), (2008, 2)}
+
+
+def test_plan_missing(outputs, capsys):
+    era5, (january, february) = outputs
+    assert _sync.plan_missing(era5, [january, february]) == ([january, february], [])
+
+    write_netcdf(january.filename, steps(2008, 1, 31))
+    write_netcdf(february.filename, steps(2008, 2, 10))  # Incomplete
+    missing, [fill] = _sync.plan_missing(era5, [january, february])
+    assert missing == []
+    assert fill.fill and fill.outputs == [february]
+    assert fill.chunks == [_planner.Chunk([2008], ["02"], ALL_DAYS[10:29])]
+    out = capsys.readouterr().out
+    assert "1 of 2 file(s) are up to date." in out
+    assert "Fetching the missing time steps of 1 file(s)." in out
+
+    write_netcdf(february.filename, steps(2008, 2, 29))
+    assert _sync.plan_missing(era5, [january, february]) == ([], [])
+
+
+def test_missing_steps(outputs):
+    era5, (january, _) = outputs
+    assert _sync.missing_steps(era5, january) is None  # Does not exist
+
+    # The first half of January 1st, and all of January 3rd are missing.
+    write_netcdf(
+        january.filename,
+        [steps(2008, 1, 1)[1]] + steps(2008, 1, 2)[2:] + steps(2008, 1, 31)[6:],
+    )
+    assert _sync.missing_steps(era5, january) == {
+        (2008, 1, 1, 0),
+        (2008, 1, 3, 0),
+        (2008, 1, 3, 12),
+    }
+    assert _planner.split_steps(
+        era5, ["2m_temperature"], _sync.missing_steps(era5, january)
+    ) == [
+        _planner.Chunk([2008], ["01"], ["01"], ["00:00"]),
+        _planner.Chunk([2008], ["01"], ["03"]),
+    ]
+
+    # None of the steps of January: fetched whole.
+    write_netcdf(january.filename, steps(2008, 2, 2))
+    assert _sync.missing_steps(era5, january) is None
+
+
+def test_unreadable(outputs):
+    era5, (january, _) = outputs
+    with open(january.filename, "w") as file:
+        file.write("Not a netCDF file")
+    assert _sync.missing_steps(era5, january) is None
+
+
+def test_grib(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    era5 = initialize(outputformat="grib")
+    january, february = era5._planned_outputs()
+    open(january.filename, "w").close()
+    assert _sync.plan_missing(era5, [january, february]) == ([february], [])
+
+
+def test_inventory(outputs):
+    """Test that files in the inventory are not opened to check their time steps."""
+    era5, (january, _) = outputs
+    open(january.filename, "w").close()
+    assert _sync.missing_steps(era5, january) is None
+
+    name, request = era5._build_request("2m_temperature", [2008], "01")
+    era5._inventory.record(january.filename, name, request)
+    assert _sync.plan_missing(era5, [january]) == ([], [])
+
+    era5.hours = ["00:00", "06:00", "12:00"]  # More hours than were downloaded.
+    assert _sync.plan_missing(era5, [january]) == ([january], [])
+
+
+def test_inventory_other_request(tmp_path, monkeypatch):
+    """Test that a file written for other levels or another area is not covered by
+    its inventory record."""
+    monkeypatch.chdir(tmp_path)
+    era5 = initialize(variables=["temperature"], pressurelevels=[500, 850])
+    output = era5._planned_outputs()[0]
+    write_netcdf(output.filename, steps(2008, 1, 31))
+    name, request = era5._build_request("temperature", [2008], ["01"])
+    era5._inventory.record(output.filename, name, request)
+    record = era5._inventory.lookup(output.filename)
+    assert _sync.covers(era5, output, record)
+
+    assert not _sync.covers(era5, output, record._replace(levels=[500]))
+    assert not _sync.covers(era5, output, record._replace(area=[60, -10, 50, 5]))
+    assert not _sync.covers(
+        era5, output, record._replace(dataset="reanalysis-era5-single-levels")
+    )
+    assert not _sync.covers(
+        era5, output, record._replace(product_type=["ensemble_members"])
+    )
+
+
+def test_inventory_unpublished(outputs):
+    """Test that a file written before all of its period was published is not
+    covered by its inventory record."""
+    era5, (january, _) = outputs
+    write_netcdf(january.filename, steps(2008, 1, 31))
+    name, request = era5._build_request("2m_temperature", [2008], "01")
+    era5._inventory.record(january.filename, name, request)
+    record = era5._inventory.lookup(january.filename)
+    assert _sync.covers(era5, january, record)
+
+    written_at = datetime.datetime(2008, 1, 20).timestamp()
+    assert not _sync.covers(era5, january, record._replace(written_at=written_at))
+
+
+def test_fetch_sync(outputs, capsys):
+    era5, (january, february) = outputs
+    write_netcdf(january.filename, steps(2008, 1, 31))
+    write_netcdf(february.filename, steps(2008, 2, 10))
+
+    era5.fetch(dryrun=True)  # Existing files are no error.
+    out = capsys.readouterr().out.splitlines()
+    assert out[0] == "1 of 2 file(s) are up to date."
+    assert out[1] == "Fetching the missing time steps of 1 file(s)."
+    assert "'day': ['11', '12'," in out[2]
+    assert out[-1] == f"  added into: {february.filename}"
+
+
+@mock.patch("era5cli.fetch.key_management", autospec=True)
+@mock.patch("era5cli.utils.append_history", autospec=True)
+def test_fetch_sync_fill(append_history, key_management, outputs, tmp_path):
+    """Test that the missing time steps are merged into an incomplete file."""
+    era5, (january, february) = outputs
+    key_management.load_era5cli_config.return_value = ("url", "key:uid")
+    write_netcdf(january.filename, steps(2008, 1, 31))
+    write_netcdf(february.filename, steps(2008, 2, 10))
+
+    def download(result, outputfile, session, segments, progress):
+        write_netcdf(outputfile, steps(2008, 2, 29)[20:], offset=100)
+
+    with mock.patch("cdsapi.Client", autospec=True) as cds, mock.patch(
+        "era5cli.fetch._download.fetch_result", side_effect=download
+    ):
+        era5.fetch()
+
+    [call] = cds.return_value.retrieve.call_args_list
+    assert call.args[1]["month"] == ["02"]
+    assert call.args[1]["day"] == ALL_DAYS[10:29]
+    dates, data = read(february.filename)
+    assert len(dates) == 29 * 2
+    assert data[19, 1, 2] == 19 * 6 + 5  # Stored
+    assert data[20, 0, 0] == 100  # Added
+    assert sorted(os.listdir()) == [january.filename, february.filename]
@@ -1,5 +1,6 @@
 """Tests for era5cli utility functions."""
 
+import os
 import pytest
 from netCDF4 import Dataset
 import era5cli
@@ -185,3 +186,43 @@ def test_strtobool_incorrect(value):
     """Test incorrect inputs."""
     with pytest.raises(ValueError, match="Could not convert string to boolean"):
         era5cli.utils.strtobool(value)
+
+
+def test_existing_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "sub").mkdir()
+    for name in ["a.nc", "sub/b.nc", "target.nc"]:
+        (tmp_path / name).touch()
+    os.symlink("target.nc", "link.nc")
+    os.symlink("missing.nc", "broken.nc")
+
+    files = [
+        "a.nc",
+        "c.nc",
+        "sub/b.nc",
+        "sub/a.nc",
+        "nodir/a.nc",
+        str(tmp_path / "a.nc"),
+        "link.nc",
+        "broken.nc",
+        "sub",
+        ".",
+    ]
+    existing = era5cli.utils.existing_files(files)
+    assert existing == {file for file in files if os.path.exists(file)}
+    assert existing == {
+        "a.nc",
+        "sub/b.nc",
+        str(tmp_path / "a.nc"),
+        "link.nc",
+        "sub",
+        ".",
+    }
+
+
+def test_assert_outputfiles_not_exist(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    era5cli.utils.assert_outputfiles_not_exist(["a.nc", "b.nc"])
+    (tmp_path / "b.nc").touch()
+    with pytest.raises(FileExistsError):
+        era5cli.utils.assert_outputfiles_not_exist(["a.nc", "b.nc"])